@@ -0,0 +1,146 @@
+import os
+import fcntl
+import shutil
+import logging
+from typing import List, Optional
+
+# Persistent Chrome disk caches, one set of slots per platform.
+# Only the HTTP/code cache persists (via --disk-cache-dir); cookies and logins
+# stay in Chrome's throwaway profile so login flows behave as before.
+
+DEFAULT_MAX_SIZE_MB = 512
+DEFAULT_MAX_SLOTS = 8
+
+# Chrome index files must survive eviction, entries can go
+_KEEP_FILES = {'index', 'the-real-index'}
+
+
+class CacheSlot:
+    """One locked cache directory, used by a single Chrome at a time"""
+    def __init__(self, cache: 'AssetCache', platform: str, index: int, path: str, lock_file):
+        self.cache = cache
+        self.platform = platform
+        self.index = index
+        self.path = path
+        self._lock_file = lock_file
+
+    def release(self):
+        """Trim the slot to the size limit and unlock it"""
+        if self._lock_file is None:
+            return
+        try:
+            self.cache.evict(self.path)
+        finally:
+            fcntl.flock(self._lock_file, fcntl.LOCK_UN)
+            self._lock_file.close()
+            self._lock_file = None
+
+
+class AssetCache:
+    """Pool of persistent per-platform disk caches shared between runs and workers"""
+    def __init__(self, root: str, max_size_mb: int = DEFAULT_MAX_SIZE_MB,
+                 max_slots: int = DEFAULT_MAX_SLOTS):
+        self.root = os.path.abspath(os.path.expanduser(root))
+        self.max_bytes = max_size_mb * 1024 * 1024
+        self.max_slots = max_slots
+
+    def _slot_path(self, platform: str, index: int) -> str:
+        return os.path.join(self.root, platform, f"slot-{index}")
+
+    def _try_lock(self, path: str):
+        os.makedirs(path, exist_ok=True)
+        lock_file = open(os.path.join(path, '.lock'), 'w')
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            return lock_file
+        except BlockingIOError:
+            lock_file.close()
+            return None
+
+    def acquire(self, platform: str) -> Optional[CacheSlot]:
+        """Lock a free slot for this platform, seeding new slots from an idle one"""
+        for index in range(self.max_slots):
+            path = self._slot_path(platform, index)
+            is_new = not os.path.isdir(path)
+            lock_file = self._try_lock(path)
+            if lock_file is None:
+                continue
+            if is_new:
+                self._seed(platform, index, path)
+            logging.info(f"Using {platform} asset cache slot {index}: {path}")
+            return CacheSlot(self, platform, index, path, lock_file)
+        logging.warning(f"All {self.max_slots} {platform} asset cache slots busy, running uncached")
+        return None
+
+    def _seed(self, platform: str, index: int, path: str):
+        """Clone the cache of an idle sibling slot so a new worker starts warm"""
+        for donor in range(self.max_slots):
+            donor_path = self._slot_path(platform, donor)
+            if donor == index or not os.path.isdir(donor_path):
+                continue
+            lock_file = self._try_lock(donor_path)
+            if lock_file is None:
+                continue
+            try:
+                for name in os.listdir(donor_path):
+                    if name == '.lock':
+                        continue
+                    src, dst = os.path.join(donor_path, name), os.path.join(path, name)
+                    if os.path.isdir(src):
+                        shutil.copytree(src, dst, dirs_exist_ok=True)
+                    else:
+                        shutil.copy2(src, dst)
+                logging.info(f"Seeded {platform} cache slot {index} from slot {donor}")
+                return
+            except OSError as e:
+                logging.warning(f"Could not seed cache slot {index}: {str(e)}")
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+                lock_file.close()
+
+    @staticmethod
+    def _entries(path: str) -> List[os.DirEntry]:
+        entries, stack = [], [path]
+        while stack:
+            with os.scandir(stack.pop()) as it:
+                for entry in it:
+                    if entry.is_dir(follow_symlinks=False):
+                        stack.append(entry.path)
+                    elif entry.name not in _KEEP_FILES and entry.name != '.lock':
+                        entries.append(entry)
+        return entries
+
+    def size(self, path: str) -> int:
+        return sum(e.stat().st_size for e in self._entries(path))
+
+    def evict(self, path: str) -> int:
+        """Delete least recently used cache entries until the slot fits; returns bytes freed"""
+        entries = self._entries(path)
+        stats = [(e, e.stat()) for e in entries]
+        total = sum(st.st_size for _, st in stats)
+        freed = 0
+        if total <= self.max_bytes:
+            return 0
+        # Oldest access (or write, on noatime mounts) goes first
+        for entry, st in sorted(stats, key=lambda item: max(item[1].st_atime, item[1].st_mtime)):
+            if total - freed <= self.max_bytes:
+                break
+            try:
+                os.remove(entry.path)
+                freed += st.st_size
+            except OSError:
+                continue
+        logging.info(f"Evicted {freed / 1024 / 1024:.1f} MB from {path}")
+        return freed
+
+
+def from_env() -> Optional[AssetCache]:
+    """AssetCache configured by $CAPTURE_ASSET_CACHE_DIR (None when unset)"""
+    root = os.environ.get('CAPTURE_ASSET_CACHE_DIR')
+    if not root:
+        return None
+    return AssetCache(
+        root,
+        max_size_mb=int(os.environ.get('CAPTURE_ASSET_CACHE_MB', DEFAULT_MAX_SIZE_MB)),
+        max_slots=int(os.environ.get('CAPTURE_ASSET_CACHE_SLOTS', DEFAULT_MAX_SLOTS)),
+    )
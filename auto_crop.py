@@ -0,0 +1,240 @@
+import os
+import json
+import time
+import logging
+import argparse
+import multiprocessing
+from typing import Dict, List, Optional, Tuple
+
+import capture_report
+
+# Auto-crop and panel splitting need NumPy and Pillow
+try:
+    import numpy as np
+    from PIL import Image
+except ImportError:
+    np = None
+
+# Post-processing of screenshots: crop away empty margins (and, with recorded
+# panel boxes, headers and side menus), and cut each dashboard into one image
+# per panel.
+#
+# The page background is the most common colour along the image's edges; the
+# content box is where pixels differ from it by more than the tolerance, found
+# with whole-array row/column reductions. Panels come from the panel boxes the
+# browser reported at capture time (<capture>.panels.json, written with
+# $CAPTURE_PANEL_BOXES) when there are some, otherwise from a recursive XY-cut:
+# the content is split at background gutters at least min_gap wide, into rows
+# and then columns, until no gutter is left. A run directory is processed by a
+# pool of worker processes, a batch of captures per task.
+#
+# Output: <output dir>/cropped/<capture path> and <output dir>/panels/<capture
+# path without .png>/panel-NN[-title].png
+
+DEFAULT_TOLERANCE = 12
+DEFAULT_MIN_GAP = 6
+DEFAULT_MARGIN = 4
+# Smaller pieces are text fragments or borders, not panels
+MIN_PANEL_PX = 48
+MAX_CUT_DEPTH = 8
+IMAGE_EXTENSIONS = ('.png',)
+
+
+def boxes_path(file_path: str) -> str:
+    """Sidecar with the panel boxes recorded for a capture"""
+    return f"{os.path.splitext(file_path)[0]}.panels.json"
+
+
+def background(pixels: 'np.ndarray') -> 'np.ndarray':
+    """Most common colour along the image's edges"""
+    edges = np.concatenate([pixels[0], pixels[-1], pixels[:, 0], pixels[:, -1]]).astype(np.int32)
+    packed = edges[:, 0] << 16 | edges[:, 1] << 8 | edges[:, 2]
+    values, counts = np.unique(packed, return_counts=True)
+    colour = int(values[counts.argmax()])
+    return np.array([colour >> 16 & 255, colour >> 8 & 255, colour & 255], dtype=np.int16)
+
+
+def content_mask(pixels: 'np.ndarray', tolerance: int = DEFAULT_TOLERANCE) -> 'np.ndarray':
+    """True where a pixel differs from the background"""
+    return (np.abs(pixels.astype(np.int16) - background(pixels)) > tolerance).any(axis=2)
+
+
+def _extent(flags: 'np.ndarray') -> Optional[Tuple[int, int]]:
+    """First and one-past-last True index"""
+    found = np.flatnonzero(flags)
+    return (int(found[0]), int(found[-1]) + 1) if found.size else None
+
+
+def content_box(mask: 'np.ndarray', margin: int = DEFAULT_MARGIN) -> Optional[Tuple[int, int, int, int]]:
+    """(left, top, right, bottom) of everything that isn't background, plus margin"""
+    rows, cols = _extent(mask.any(axis=1)), _extent(mask.any(axis=0))
+    if rows is None:
+        return None
+    height, width = mask.shape
+    return (max(cols[0] - margin, 0), max(rows[0] - margin, 0),
+            min(cols[1] + margin, width), min(rows[1] + margin, height))
+
+
+def _bands(flags: 'np.ndarray', min_gap: int) -> List[Tuple[int, int]]:
+    """Runs of True in flags, joined across gaps narrower than min_gap"""
+    padded = np.concatenate([[False], flags, [False]])
+    edges = np.flatnonzero(np.diff(padded.astype(np.int8)))
+    bands = []
+    for start, end in zip(edges[::2], edges[1::2]):
+        if bands and start - bands[-1][1] < min_gap:
+            bands[-1] = (bands[-1][0], int(end))
+        else:
+            bands.append((int(start), int(end)))
+    return bands
+
+
+def xy_cut(mask: 'np.ndarray', min_gap: int = DEFAULT_MIN_GAP, top: int = 0, left: int = 0,
+           depth: int = 0) -> List[Tuple[int, int, int, int]]:
+    """Panel boxes (left, top, right, bottom): content split at background gutters, rows first"""
+    rows, cols = _extent(mask.any(axis=1)), _extent(mask.any(axis=0))
+    if rows is None:
+        return []
+    mask = mask[rows[0]:rows[1], cols[0]:cols[1]]
+    top, left = top + rows[0], left + cols[0]
+    if depth < MAX_CUT_DEPTH:
+        for axis in (1, 0):
+            bands = _bands(mask.any(axis=axis), min_gap)
+            if len(bands) > 1:
+                boxes = []
+                for start, end in bands:
+                    if axis == 1:
+                        boxes += xy_cut(mask[start:end], min_gap, top + start, left, depth + 1)
+                    else:
+                        boxes += xy_cut(mask[:, start:end], min_gap, top, left + start, depth + 1)
+                return boxes
+    height, width = mask.shape
+    if height < MIN_PANEL_PX or width < MIN_PANEL_PX:
+        return []
+    return [(left, top, left + width, top + height)]
+
+
+def recorded_boxes(file_path: str, size: Tuple[int, int]) -> Optional[List[Dict]]:
+    """Panel boxes the browser reported for this capture, in image pixels and clipped to it"""
+    try:
+        with open(boxes_path(file_path)) as f:
+            recorded = json.load(f)
+    except (OSError, ValueError):
+        return None
+    ratio = recorded.get('ratio') or 1
+    boxes = []
+    for box in recorded.get('boxes', []):
+        left, top = max(round(box['x'] * ratio), 0), max(round(box['y'] * ratio), 0)
+        right = min(round((box['x'] + box['width']) * ratio), size[0])
+        bottom = min(round((box['y'] + box['height']) * ratio), size[1])
+        if right - left >= MIN_PANEL_PX and bottom - top >= MIN_PANEL_PX:
+            boxes.append({'box': (left, top, right, bottom), 'title': box.get('title') or ''})
+    return boxes or None
+
+
+def _slug(title: str) -> str:
+    return ''.join(c if c.isalnum() else '_' for c in title).strip('_')[:40]
+
+
+def process(file_path: str, output_dir: str, crop: bool = True, split: bool = True,
+            tolerance: int = DEFAULT_TOLERANCE, min_gap: int = DEFAULT_MIN_GAP,
+            margin: int = DEFAULT_MARGIN) -> Dict:
+    """Crop one capture and/or split it into panels; returns {'file', 'cropped', 'panels', 'source'}"""
+    with Image.open(file_path) as image:
+        image = image.convert('RGB')
+    pixels = np.asarray(image)
+    recorded = recorded_boxes(file_path, image.size)
+    if recorded:
+        source = 'dom'
+        panels = [(item['box'], item['title']) for item in recorded]
+        edges = np.array([box for box, _ in panels])
+        # Everything outside the panels (top bar, side menu, margins) goes
+        box = (max(int(edges[:, 0].min()) - margin, 0), max(int(edges[:, 1].min()) - margin, 0),
+               min(int(edges[:, 2].max()) + margin, image.width), min(int(edges[:, 3].max()) + margin, image.height))
+    else:
+        source = 'pixels'
+        mask = content_mask(pixels, tolerance)
+        box = content_box(mask, margin)
+        panels = [(panel, '') for panel in xy_cut(mask, min_gap)] if split else []
+    relative = os.path.relpath(file_path, output_dir)
+    if relative.startswith('..'):
+        relative = os.path.basename(file_path)
+    result = {'file': file_path, 'cropped': None, 'panels': [], 'source': source}
+    if crop and box:
+        result['cropped'] = os.path.join(output_dir, 'cropped', relative)
+        os.makedirs(os.path.dirname(result['cropped']), exist_ok=True)
+        image.crop(box).save(result['cropped'])
+    if split and len(panels) > 1:
+        panels_dir = os.path.join(output_dir, 'panels', os.path.splitext(relative)[0])
+        os.makedirs(panels_dir, exist_ok=True)
+        # Reading order: top to bottom, then left to right
+        for n, (panel, title) in enumerate(sorted(panels, key=lambda p: (p[0][1], p[0][0])), 1):
+            path = os.path.join(panels_dir, f"panel-{n:02d}{f'-{_slug(title)}' if _slug(title) else ''}.png")
+            image.crop(panel).save(path)
+            result['panels'].append(path)
+    return result
+
+
+def _process_batch(args: Tuple[List[str], str, Dict]) -> List[Dict]:
+    """Worker process entry point: one batch of captures"""
+    files, output_dir, options = args
+    results = []
+    for file_path in files:
+        try:
+            results.append(process(file_path, output_dir, **options))
+        except Exception as e:
+            results.append({'file': file_path, 'error': str(e)})
+    return results
+
+
+def process_run(output_dir: str, run_id: str = None, files: List[str] = None, workers: int = None,
+                **options) -> List[Dict]:
+    """Post-process a run's captures (or the output dir's, or the given files) in worker processes"""
+    if np is None:
+        raise ValueError("Auto-crop needs NumPy and Pillow (pip install numpy pillow)")
+    if files is None:
+        files = [row['file_path'] for row in capture_report.captures(output_dir, run_id)
+                 if row['file_path'].lower().endswith(IMAGE_EXTENSIONS)]
+    if not files:
+        logging.warning("No captures to post-process")
+        return []
+    workers = min(workers or int(os.environ.get('CAPTURE_CROP_WORKERS', os.cpu_count() or 2)), len(files))
+    # A few batches per worker: fewer round trips than one task per image, still balanced
+    size = max(1, len(files) // (workers * 4))
+    batches = [(files[n:n + size], output_dir, options) for n in range(0, len(files), size)]
+    started = time.perf_counter()
+    if workers == 1:
+        results = [result for batch in batches for result in _process_batch(batch)]
+    else:
+        # spawn: the capture process has browser, upload and mail threads a fork would copy mid-flight
+        with multiprocessing.get_context('spawn').Pool(workers) as pool:
+            results = [result for batch in pool.imap_unordered(_process_batch, batches) for result in batch]
+    failed = [result for result in results if 'error' in result]
+    for result in failed:
+        logging.warning(f"Post-processing {result['file']} failed: {result['error']}")
+    logging.info(f"Post-processed {len(results) - len(failed)} captures into "
+                 f"{sum(len(r.get('panels', [])) for r in results)} panels in "
+                 f"{time.perf_counter() - started:.1f}s with {workers} processes")
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Crop captures to their content and split them into panels")
+    parser.add_argument("files", nargs="*", help="Captures to process (default: every capture in the output dir)")
+    parser.add_argument("-o", "--output-dir", default="./captures", help="Output dir of the captures")
+    parser.add_argument("--run", metavar="RUN_ID", help="Only the captures of this --jobs run")
+    parser.add_argument("--no-crop", action="store_true", help="Only split into panels")
+    parser.add_argument("--no-split", action="store_true", help="Only crop")
+    parser.add_argument("--tolerance", type=int, default=DEFAULT_TOLERANCE,
+                        help="Colour difference from the background still counted as background")
+    parser.add_argument("--min-gap", type=int, default=DEFAULT_MIN_GAP, help="Narrowest gutter between panels (px)")
+    parser.add_argument("--workers", type=int, help="Worker processes (default: $CAPTURE_CROP_WORKERS or one per CPU)")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
+    results = process_run(args.output_dir, args.run, args.files or None, args.workers, crop=not args.no_crop,
+                          split=not args.no_split, tolerance=args.tolerance, min_gap=args.min_gap)
+    if any('error' in result for result in results):
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
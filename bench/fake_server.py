@@ -0,0 +1,461 @@
+import argparse
+import csv
+import io
+import json
+import logging
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List
+from urllib.parse import urlparse, parse_qs
+
+# Local stand-in for Grafana, Dynatrace and Splunk, just enough for the capture scripts
+
+LOGIN_FORMS = {
+    'grafana': (
+        '<form method="post" action="/login">'
+        '<input name="user" type="text"><input name="password" type="password">'
+        '<button type="submit">Log in</button></form>'
+    ),
+    'dynatrace': (
+        '<form method="post" action="/login">'
+        '<input id="email" name="email" type="text"><input id="password" name="password" type="password">'
+        '<button type="submit">Sign in</button></form>'
+    ),
+    'splunk': (
+        '<form method="post" action="{action}">'
+        '<input id="username" name="username" type="text"><input id="password" name="password" type="password">'
+        '<input type="hidden" name="return_to" value="{return_to}">'
+        '<button type="submit" id="loginButton">Sign In</button></form>'
+    ),
+}
+
+# Non-essential requests each real platform makes on a dashboard load
+NOISE_URLS = {
+    'grafana': ['/public/fonts/inter.woff2', '/avatar/46d229b033af06a191ff2267bca9ae56', '/api/news',
+                '/api/frontend-metrics'],
+    'dynatrace': ['/fonts/bernina-sans.woff2', '/ui/api/v1/notifications', '/rb_bf28376ljv?type=js3'],
+    'splunk': ['/static/fonts/splunkdatasans.woff2', '/splunkd/__raw/services/messages'],
+}
+
+# Nav bar and side menu, left out of kiosk/chromeless/solo views
+CHROME_HTML = (
+    '<nav class="navbar"><a href="/">Home</a><input class="search" placeholder="Search"></nav>'
+    '<aside class="sidemenu"><img src="/public/img/logo.svg"><ul><li>Dashboards</li><li>Explore</li>'
+    '<li>Alerting</li><li>Admin</li></ul></aside>'
+    '<script src="/public/build/navigation.js"></script>'
+)
+CHROMELESS_PARAMS = ('kiosk', 'kioskMode', 'hideChrome')
+
+# Simulated backend result caches (one dict per server, see _backend_cache)
+QUERY_CACHE_LOCK = threading.Lock()
+
+# Simple XML served for every Splunk dashboard over REST
+SPLUNK_VIEW_XML = """<form>
+  <fieldset><input type="time" token="global_time"><default><earliest>-60m</earliest><latest>now</latest></default></input>
+  <input type="dropdown" token="transaction_type"><default>*</default></input></fieldset>
+  <search id="base"><query>index=main sourcetype=transactions type=$transaction_type$ | fields _time status duration</query>
+    <earliest>$global_time.earliest$</earliest><latest>$global_time.latest$</latest></search>
+  <row><panel><table><search base="base"><query>| stats count by status</query></search></table></panel>
+  <panel><chart><search><query>index=main sourcetype=transactions | timechart avg(duration)</query>
+    <earliest>$global_time.earliest$</earliest><latest>$global_time.latest$</latest></search></chart></panel></row>
+</form>"""
+
+DASHBOARD_PAGE = """<!DOCTYPE html>
+<html><head><title>{title}</title>
+<link rel="stylesheet" href="/public/build/app.css">
+<script src="/public/build/app.js"></script>
+<style>
+body {{ margin: 0; font-family: sans-serif; background: #111217; color: #ccc; }}
+.panel-container {{ display: inline-block; width: 30%; height: 220px; margin: 8px;
+                    background: #181b1f; border: 1px solid #2c3235; }}
+</style></head>
+<body>{chrome}<div class="{root_class}"><h1 class="dashboard-title">{title}</h1>
+<div id="panels"></div></div>
+<script>
+{noise}.forEach(function (u) {{ fetch(u).catch(function () {{}}); }});
+var panels = {panels}, delay = {render_delay}, stagger = {panel_stagger}, queryUrl = {query_url};
+var params = new URLSearchParams(location.search);
+function query(n) {{
+  // Grafana panels fetch their data before drawing; other platforms just draw
+  if (!queryUrl) return Promise.resolve();
+  var expr = 'rate(panel_' + n + '_total{{host=~"$host"}}[5m])'.replace('$host', params.get('var-host') || '$host');
+  return fetch(queryUrl, {{method: 'POST', body: JSON.stringify({{
+    queries: [{{refId: 'A', expr: expr, maxDataPoints: 640, intervalMs: 5625}}],
+    from: params.get('from') || '0', to: params.get('to') || '0'}})}}).catch(function () {{}});
+}}
+for (var i = 0; i < panels; i++) {{
+  (function (n) {{
+    var index = {first_panel} + n - 1;
+    setTimeout(function () {{
+      query(index).then(function () {{
+        var p = document.createElement('div');
+        p.className = 'panel-container';
+        p.innerHTML = '<div class="panel-title">Panel ' + n + '</div><canvas width="300" height="150"></canvas>';
+        document.getElementById('panels').appendChild(p);
+      }});
+    }}, delay + n * stagger);
+  }})(i);
+}}
+</script></body></html>"""
+
+
+class FakeDashboardHandler(BaseHTTPRequestHandler):
+    """Serve login forms, dashboard pages and JSON APIs for one platform"""
+    platform = 'grafana'
+    config = {}
+    stats = None
+    protocol_version = 'HTTP/1.1'
+    # Headers and body go out in separate writes; without this keep-alive requests stall on delayed ACKs
+    disable_nagle_algorithm = True
+
+    def log_message(self, fmt, *args):
+        logging.debug(f"[{self.platform}] {fmt % args}")
+
+    # Response helpers
+    def _send(self, status: int, body: bytes, content_type: str, headers: Dict = None):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        if self.command != 'HEAD':
+            self.wfile.write(body)
+        self.stats.record(self.path, len(body))
+
+    def _html(self, html: str, status: int = 200):
+        self._send(status, html.encode(), 'text/html; charset=utf-8')
+
+    def _json(self, payload, status: int = 200):
+        time.sleep(self.config.get('api_latency', 0))
+        self._send(status, json.dumps(payload).encode(), 'application/json')
+
+    def _redirect(self, location: str, cookie: str = None):
+        headers = {'Location': location}
+        if cookie:
+            headers['Set-Cookie'] = f"{cookie}=fake-session; Path=/"
+        self._send(302, b'', 'text/plain', headers)
+
+    def _dashboard(self, title: str, root_class: str, query: Dict = None, panels: int = None):
+        chromeless = panels is not None or any(key in (query or {}) for key in CHROMELESS_PARAMS)
+        self._html(DASHBOARD_PAGE.format(
+            title=title,
+            root_class=root_class,
+            chrome='' if chromeless else CHROME_HTML,
+            noise=json.dumps(NOISE_URLS[self.platform] if self.config.get('noise_kb', 64) else []),
+            panels=self.config.get('panels', 6) if panels is None else panels,
+            render_delay=int(self.config.get('render_delay', 0.5) * 1000),
+            query_url=json.dumps('/api/ds/query' if self.platform == 'grafana' else ''),
+            first_panel=int((query or {}).get('panelId', ['1'])[0]) if panels == 1 else 1,
+            panel_stagger=int(self.config.get('panel_stagger', 0.05) * 1000),
+        ))
+
+    def _noise(self):
+        body = b'\0' * (int(self.config.get('noise_kb', 64)) * 1024)
+        self._send(200, body, 'application/octet-stream')
+
+    def _asset(self, path: str):
+        size = int(self.config.get('asset_kb', 512)) * 1024
+        content_type = 'text/css' if path.endswith('.css') else 'application/javascript'
+        body = (b'/*' + b'x' * max(size - 4, 0) + b'*/')
+        self._send(200, body, content_type, {'Cache-Control': 'public, max-age=31536000, immutable'})
+
+    # Routing
+    def do_HEAD(self):
+        self.do_GET()
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        query = parse_qs(url.query, keep_blank_values=True)
+        path = url.path
+        if path in (u.split('?')[0] for u in NOISE_URLS[self.platform]):
+            return self._noise()
+        if path.startswith('/public/'):
+            return self._asset(path)
+        if path == '/__stats':
+            return self._json(self.stats.snapshot())
+        handler = getattr(self, f"_get_{self.platform}")
+        if handler(path, query) is False:
+            self._html('<h1>Not found</h1>', 404)
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length).decode() if length else ''
+        url = urlparse(self.path)
+        if url.path.endswith('/login'):
+            form = parse_qs(body)
+            return_to = (form.get('return_to') or parse_qs(url.query).get('return_to') or ['/'])[0]
+            return self._redirect(return_to or '/', cookie=f"{self.platform}_session")
+        handler = getattr(self, f"_post_{self.platform}", None)
+        if handler is None or handler(url.path, body) is False:
+            self._json({'message': 'not found'}, 404)
+
+    def _get_grafana(self, path: str, query: Dict):
+        dashboards = self.config['dashboards']
+        if path == '/login':
+            return self._html(LOGIN_FORMS['grafana'])
+        if path in ('/', '/dashboards'):
+            return self._dashboard('Home', 'dashboard')
+        if path.startswith('/d/'):
+            uid = path.split('/')[2]
+            return self._dashboard(dashboards.get(uid, uid), 'dashboard', query)
+        if path.startswith('/d-solo/'):
+            uid = path.split('/')[2]
+            return self._dashboard(dashboards.get(uid, uid), 'panel-solo', query, panels=1)
+        if path == '/api/datasources':
+            return self._json([{'id': 1, 'uid': 'bench', 'name': 'bench', 'type': 'prometheus', 'isDefault': True}])
+        if path == '/api/search':
+            return self._json([
+                {'uid': uid, 'title': title, 'type': 'dash-db', 'url': f"/d/{uid}"}
+                for uid, title in dashboards.items()
+            ])
+        if path.startswith('/api/dashboards/uid/'):
+            uid = path.rsplit('/', 1)[1]
+            if uid not in dashboards:
+                return self._json({'message': 'Dashboard not found'}, 404)
+            return self._json({
+                'dashboard': {
+                    'uid': uid,
+                    'title': dashboards[uid],
+                    'version': 1,
+                    'panels': [
+                        {'id': n + 1, 'type': 'timeseries', 'title': f"Panel {n}",
+                         'gridPos': {'x': (n % 3) * 8, 'y': (n // 3) * 8, 'w': 8, 'h': 8},
+                         'datasource': {'type': 'prometheus', 'uid': '${DS_PROMETHEUS}'},
+                         'targets': [{'refId': 'A', 'expr': f'rate(panel_{n}_total{{host=~"$host"}}[5m])'}]}
+                        for n in range(self.config.get('panels', 6))
+                    ],
+                    'templating': {'list': [
+                        {'name': 'DS_PROMETHEUS', 'type': 'datasource', 'query': 'prometheus'},
+                    ] + [
+                        {'name': name, 'type': 'custom', 'query': ','.join(values),
+                         'options': [{'text': v, 'value': v} for v in values]}
+                        for name, values in self.config['variables'].items()
+                    ]},
+                },
+                'meta': {'slug': dashboards[uid].lower().replace(' ', '-')},
+            })
+        return False
+
+    def _post_grafana(self, path: str, body: str):
+        if path == '/api/ds/query':
+            return self._json({'results': self._ds_query(json.loads(body or '{}'))})
+        return False
+
+    def _ds_query(self, request: Dict) -> Dict:
+        """One time series frame per query and host, maxDataPoints points over the window.
+        A query not seen in the last query_cache_ttl seconds takes query_latency (cold backend)"""
+        start, end = int(request.get('from', 0)), int(request.get('to', 0))
+        results = {}
+        for query in request.get('queries', []):
+            self._backend_cache(query.get('expr', ''))
+            points = max(1, min(query.get('maxDataPoints', 100), (end - start) // max(1, query.get('intervalMs', 1))))
+            step = (end - start) // points
+            times = [start + n * step for n in range(points)]
+            results[query['refId']] = {'status': 200, 'frames': [
+                {'schema': {'refId': query['refId'], 'name': query.get('expr', ''), 'fields': [
+                    {'name': 'Time', 'type': 'time'},
+                    {'name': 'Value', 'type': 'number', 'labels': {'host': host}},
+                ]}, 'data': {'values': [times, [round((n * 7 + len(host)) % 100 / 10, 1) for n in range(points)]]}}
+                for host in self.config['variables'].get('host', ['host0'])
+            ]}
+        return results
+
+    def _backend_cache(self, key: str):
+        """Wait until the backend has results for key: query_latency when cold, shared with a run in flight"""
+        latency = self.config.get('query_latency', 0)
+        if not latency:
+            return
+        now = time.time()
+        with QUERY_CACHE_LOCK:
+            ready_at = self.query_cache.get(key)
+            if ready_at is None or now - ready_at > self.config.get('query_cache_ttl', 300):
+                ready_at = self.query_cache[key] = now + latency
+        time.sleep(max(0.0, ready_at - now))
+
+    def _get_dynatrace(self, path: str, query: Dict):
+        dashboards = self.config['dashboards']
+        if path == '/login':
+            return self._html(LOGIN_FORMS['dynatrace'])
+        if path == '/':
+            return self._dashboard('Home', 'dashboard')
+        if path.startswith('/ui/dashboards/'):
+            dashboard_id = path.rsplit('/', 1)[1]
+            return self._dashboard(dashboards.get(dashboard_id, dashboard_id), 'dashboard', query)
+        if path.endswith('/api/v2/settings/objects'):
+            zones = self.config.get('management_zones', {})
+            return self._json({
+                'items': [
+                    {'objectId': f"obj-{mz_id}", 'value': {'name': name}}
+                    for mz_id, name in zones.items()
+                ],
+                'totalCount': len(zones),
+            })
+        if '/api/v2/settings/managementZones/' in path:
+            obj_id = path.rsplit('/', 1)[1]
+            return self._json({'id': obj_id[len('obj-'):], 'objectId': obj_id})
+        if '/api/config/v1/dashboards/' in path:
+            dashboard_id = path.rsplit('/', 1)[1]
+            return self._json(self._dynatrace_dashboard(dashboard_id, dashboards.get(dashboard_id, dashboard_id)))
+        if path.endswith('/api/v2/metrics/query'):
+            return self._json(self._metrics_query(query))
+        return False
+
+    def _dynatrace_dashboard(self, dashboard_id: str, name: str) -> Dict:
+        """Config API dashboard: Data Explorer tiles plus one custom chart and one markdown tile"""
+        tiles = [
+            {'name': f"Tile {n}", 'tileType': 'DATA_EXPLORER', 'queries': [], 'metricExpressions': [
+                f'resolution=null&(builtin:host.cpu.usage{n}:splitBy("dt.entity.host"):avg):limit(100):names']}
+            for n in range(self.config.get('panels', 6) - 1)
+        ]
+        tiles.append({'name': 'Response time', 'tileType': 'CUSTOM_CHARTING', 'filterConfig': {'chartConfig': {
+            'series': [{'metric': 'builtin:service.response.time', 'aggregation': 'AVG',
+                        'dimensions': [{'id': '0', 'name': 'dt.entity.service'}]}]}}})
+        tiles.append({'name': 'Notes', 'tileType': 'MARKDOWN', 'markdown': '## Bench'})
+        return {'id': dashboard_id, 'dashboardMetadata': {'name': name}, 'tiles': tiles}
+
+    def _metrics_query(self, query: Dict) -> Dict:
+        """Metrics v2 result for one selector: a series per management zone host, one point a minute"""
+        selector = (query.get('metricSelector') or [''])[0]
+        zone = (query.get('mzSelector') or [''])[0]
+        self._backend_cache(f"{selector}|{zone}")
+        start, end = int((query.get('from') or [0])[0]), int((query.get('to') or [0])[0])
+        times = list(range(start - start % 60000 + 60000, end, 60000))
+        hosts = [f"HOST-{n}" for n in range(1 if zone else 2)]
+        return {'totalCount': len(hosts), 'nextPageKey': None, 'resolution': '1m', 'result': [{
+            'metricId': selector, 'dataPointCountRatio': 0.001, 'dimensionCountRatio': 0.01, 'data': [
+                {'dimensions': [host], 'dimensionMap': {'dt.entity.host': host}, 'timestamps': times,
+                 'values': [round((n * 3 + len(host)) % 100 / 10, 1) for n in range(len(times))]}
+                for host in hosts
+            ]}]}
+
+    def _post_splunk(self, path: str, body: str):
+        if path.endswith('/search/jobs/export'):
+            form = parse_qs(body)
+            search = (form.get('search') or [''])[0]
+            self._backend_cache(search)
+            return self._splunk_export((form.get('output_mode') or ['csv'])[0])
+        return False
+
+    def _splunk_export(self, output_mode: str):
+        """splunk_rows results as the export endpoint sends them: CSV, or one JSON message per line"""
+        rows = splunk_rows(self.config.get('splunk_rows', 100))
+        if output_mode == 'json':
+            body = ''.join(json.dumps({'preview': False, 'offset': n, 'result': row}) + '\n'
+                           for n, row in enumerate(rows))
+            return self._send(200, body.encode(), 'application/json')
+        body = io.StringIO()
+        writer = csv.DictWriter(body, fieldnames=list(rows[0]) if rows else ['_time'])
+        writer.writeheader()
+        writer.writerows(rows)
+        self._send(200, body.getvalue().encode(), 'text/csv')
+
+    def _get_splunk(self, path: str, query: Dict):
+        if '/data/ui/views/' in path:
+            name = path.rstrip('/').rsplit('/', 1)[1]
+            return self._json({'entry': [{'name': name, 'updated': '2024-01-01T00:00:00+00:00',
+                                          'content': {'eai:data': SPLUNK_VIEW_XML}}]})
+        if path.endswith('/account/login'):
+            return_to = (query.get('return_to') or ['/en-US/'])[0]
+            return self._html(LOGIN_FORMS['splunk'].format(action=path, return_to=return_to))
+        if path.rstrip('/') in ('', '/en-US', '/en-GB'):
+            return self._dashboard('Splunk Home', 'dashboard')
+        if '/app/' in path:
+            title = (query.get('q') or [path.rstrip('/').rsplit('/', 1)[-1]])[0]
+            return self._dashboard(title, 'dashboard dashboard-container', query)
+        return False
+
+
+def splunk_rows(count: int) -> List[Dict[str, str]]:
+    """Search results of the export endpoint; every 10th event's _raw spans several lines, blank ones too"""
+    return [{'_time': f"{1700000000 + n * 60}", 'status': str(200 + n % 5 * 100), 'count': str(n * 7 % 50),
+             '_raw': f"GET /api/{n} {200 + n % 5 * 100}" + (f"\r\n\r\n  at handler {n}, \"retry\"" if n % 10 == 0 else '')}
+            for n in range(count)]
+
+
+class ServerStats:
+    """Thread-safe request and byte counters"""
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.requests = 0
+            self.bytes = 0
+            self.by_path = {}
+
+    def record(self, path: str, size: int):
+        with self._lock:
+            self.requests += 1
+            self.bytes += size
+            key = urlparse(path).path
+            self.by_path[key] = self.by_path.get(key, 0) + 1
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            return {'requests': self.requests, 'bytes': self.bytes, 'by_path': dict(self.by_path)}
+
+
+def make_server(platform: str, host: str = '127.0.0.1', port: int = 0, **config) -> ThreadingHTTPServer:
+    """Create (but don't start) a fake server for one platform"""
+    config.setdefault('dashboards', {f"dash{n}": f"Dashboard {n}" for n in range(10)})
+    config.setdefault('management_zones', {'1001': 'Zone1', '1002': 'Zone2'})
+    config.setdefault('variables', {'host': [f"host{n}" for n in range(3)], 'env': ['prod', 'staging']})
+    handler = type(f"{platform.title()}Handler", (FakeDashboardHandler,), {
+        'platform': platform,
+        'config': config,
+        'stats': ServerStats(),
+        'query_cache': {},
+    })
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
+
+
+def start_server(platform: str, **config) -> ThreadingHTTPServer:
+    """Start a fake server in a background thread and return it"""
+    server = make_server(platform, **config)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    host, port = server.server_address[:2]
+    server.base_url = f"http://{host}:{port}"
+    logging.info(f"Fake {platform} listening on {server.base_url}")
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fake Grafana/Dynatrace/Splunk server for benchmarks")
+    parser.add_argument("-p", "--platform", required=True, choices=['grafana', 'dynatrace', 'splunk'])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=0, help="Port (0 picks a free one)")
+    parser.add_argument("--panels", type=int, default=6, help="Number of .panel-container elements per dashboard")
+    parser.add_argument("--render-delay", type=float, default=0.5, help="Seconds before the first panel renders")
+    parser.add_argument("--panel-stagger", type=float, default=0.05, help="Extra seconds between panels")
+    parser.add_argument("--api-latency", type=float, default=0.0, help="Seconds added to every JSON API response")
+    parser.add_argument("--query-latency", type=float, default=0.0,
+                        help="Seconds a cold datasource query / search job takes (repeats within 5 min are cached)")
+    parser.add_argument("--asset-kb", type=int, default=512, help="Size of each static JS/CSS bundle")
+    parser.add_argument("--noise-kb", type=int, default=64,
+                        help="Size of each font/avatar/news/telemetry response (0 disables them)")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
+    server = make_server(
+        args.platform, host=args.host, port=args.port,
+        panels=args.panels, render_delay=args.render_delay, panel_stagger=args.panel_stagger,
+        api_latency=args.api_latency, asset_kb=args.asset_kb, noise_kb=args.noise_kb,
+        query_latency=args.query_latency,
+    )
+    host, port = server.server_address[:2]
+    logging.info(f"Fake {args.platform} listening on http://{host}:{port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,339 @@
+import argparse
+import importlib.util
+import itertools
+import json
+import logging
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from argparse import Namespace
+from contextlib import contextmanager
+from typing import Callable, Dict, List
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+import proctree
+from fake_server import start_server
+
+# Benchmark driver: runs capture paths against the fake server and reports throughput
+
+MODES: Dict[str, Callable] = {}
+# Modes that can capture Grafana panel by panel (the others take whole dashboards)
+SOLO_MODES = {'warm-session'}
+# Modes that only make sense against Grafana
+GRAFANA_MODES = {'panel-export'}
+
+
+def register_mode(name: str):
+    """Register a capture path under a benchmark mode name"""
+    def decorator(func):
+        MODES[name] = func
+        return func
+    return decorator
+
+
+def load_script(name: str, relative_path: str):
+    """Import a repo script by path (the file names are not valid module names)"""
+    spec = importlib.util.spec_from_file_location(name, os.path.join(REPO_ROOT, relative_path))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+class RssSampler(threading.Thread):
+    """Track peak RSS of this process plus its browser/driver children"""
+    def __init__(self, interval: float = 0.2):
+        super().__init__(daemon=True)
+        self.interval = interval
+        self.peak = 0
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.is_set():
+            self.peak = max(self.peak, proctree.tree_rss_bytes(os.getpid()))
+            self._stop_event.wait(self.interval)
+
+    def stop(self) -> int:
+        self._stop_event.set()
+        self.join()
+        return self.peak
+
+
+class Recorder:
+    """Collect per-capture latencies and failures for one mode/platform"""
+    def __init__(self):
+        self.latencies: List[float] = []
+        self.failures: List[str] = []
+        self.extra: Dict[str, List[float]] = {}
+
+    def add(self, metric: str, value: float):
+        """Record a mode-specific metric (reported as its mean)"""
+        self.extra.setdefault(metric, []).append(value)
+
+    @contextmanager
+    def measure(self):
+        started = time.perf_counter()
+        try:
+            yield
+        except Exception as e:
+            self.failures.append(str(e))
+            logging.error(f"Benchmark capture failed: {str(e)}")
+        else:
+            self.latencies.append(time.perf_counter() - started)
+
+
+def percentile(values: List[float], pct: int) -> float:
+    """Nearest-rank style percentile that works for short samples"""
+    if not values:
+        return 0.0
+    if len(values) == 1:
+        return values[0]
+    return statistics.quantiles(values, n=100, method='inclusive')[pct - 1]
+
+
+@register_mode("superfake")
+def bench_superfake(target: Dict, rec: Recorder):
+    """superfake.CaptureApp: new browser and login for every dashboard"""
+    import superfake
+    credentials = {'username': target['username'], 'password': target['password']}
+    for dashboard in target['dashboards']:
+        app = superfake.CaptureApp()
+        with rec.measure():
+            if target['platform'] == 'grafana':
+                app.capture_grafana(target['base_url'], dashboard, target['time_range'],
+                                    'bench', target['output_dir'], credentials)
+            elif target['platform'] == 'dynatrace':
+                app.capture_dynatrace(target['base_url'], dashboard, target['time_range'],
+                                      target['output_dir'], credentials)
+            else:
+                app.capture_splunk(target['base_url'], dashboard, target['time_range'],
+                                   target['output_dir'], credentials)
+
+
+@register_mode("warm-session")
+def bench_warm_session(target: Dict, rec: Recorder):
+    """superfake.CaptureApp.run_job: one browser and login reused, as the daemon workers do"""
+    import superfake
+    app = superfake.CaptureApp()
+    key = 'dashboard_name' if target['platform'] == 'splunk' else 'dashboard_id'
+    try:
+        for dashboard in target['dashboards']:
+            job = superfake.validate_job({
+                'platform': target['platform'], 'url': target['base_url'], key: dashboard,
+                'datasource': 'bench', 'time_range': target['time_range'],
+                'output_dir': target['output_dir'],
+                'username': target['username'], 'password': target['password'],
+            })
+            # Solo render mode captures every panel of the dashboard
+            with rec.measure():
+                for panel_job in superfake.expand_job(job):
+                    app.run_job(panel_job, headless=target['headless'])
+    finally:
+        app.close()
+
+
+@register_mode("panel-export")
+def bench_panel_export(target: Dict, rec: Recorder):
+    """panel_export: every panel's data through /api/ds/query, no browser"""
+    import superfake
+    app = superfake.CaptureApp()
+    for dashboard in target['dashboards']:
+        job = superfake.validate_job({
+            'platform': 'grafana', 'url': target['base_url'], 'dashboard_id': dashboard,
+            'datasource': 'bench', 'time_range': target['time_range'], 'output_dir': target['output_dir'],
+            'username': target['username'], 'password': target['password'], 'export': 'csv',
+        })
+        with rec.measure():
+            for panel_job in superfake.expand_job(job):
+                app.run_job(panel_job)
+
+
+@register_mode("startup")
+def bench_startup(target: Dict, rec: Recorder):
+    """Browser profile only: Chrome startup and first dashboard load, no login"""
+    import browser_profile
+    from selenium.webdriver.common.by import By
+    from selenium.webdriver.support.ui import WebDriverWait
+    from selenium.webdriver.support import expected_conditions as EC
+    page = {'grafana': '/d/{}', 'dynatrace': '/ui/dashboards/{}', 'splunk': '/en-GB/app/search/{}'}
+    for dashboard in target['dashboards']:
+        with rec.measure():
+            started = time.perf_counter()
+            driver = browser_profile.get_profile(headless=target['headless']).create_driver()
+            try:
+                rec.add('startup_s', time.perf_counter() - started)
+                loaded = time.perf_counter()
+                driver.get(target['base_url'] + page[target['platform']].format(dashboard))
+                WebDriverWait(driver, 30).until(
+                    EC.visibility_of_element_located((By.CLASS_NAME, "panel-container")))
+                rec.add('page_load_s', time.perf_counter() - loaded)
+            finally:
+                driver.quit()
+
+
+@register_mode("python-test3")
+def bench_python_test3(target: Dict, rec: Recorder):
+    """docker-compose/python-test3.py: one browser and login for the whole loop"""
+    module = load_script('python_test3', os.path.join('docker-compose', 'python-test3.py'))
+    capture = module.MonitoringCapture()
+    args = Namespace(
+        url=target['base_url'], username=target['username'], password=target['password'],
+        token='bench-token', app='search', datasource='bench', debug=not target['headless'],
+        time_range='now-1h now', output_dir=target['output_dir'], dashboards=target['dashboards'],
+    )
+    # The script loops internally, so time the whole batch and spread it per dashboard
+    with rec.measure():
+        getattr(capture, f"capture_{target['platform']}")(args)
+    if rec.latencies:
+        batch = rec.latencies.pop()
+        rec.latencies.extend([batch / len(target['dashboards'])] * len(target['dashboards']))
+
+
+def run_mode(mode: str, platform: str, base_url: str, args) -> Dict:
+    """Run one benchmark mode against one platform and summarise it"""
+    output_dir = os.path.join(args.work_dir, args.render_mode, f"prefetch-{args.prefetch_lead:g}", mode, platform)
+    os.makedirs(output_dir, exist_ok=True)
+    target = {
+        'platform': platform,
+        'base_url': base_url,
+        'dashboards': [f"dash{n % 10}" for n in range(args.dashboards)],
+        'time_range': args.time_range,
+        'output_dir': output_dir,
+        'username': 'admin',
+        'password': 'admin',
+        'headless': True,
+    }
+    rec = Recorder()
+    sampler = RssSampler()
+    sampler.start()
+    started = time.perf_counter()
+    MODES[mode](target, rec)
+    wall = time.perf_counter() - started
+    peak_rss = sampler.stop()
+    extra = {k: round(statistics.mean(v), 3) for k, v in rec.extra.items()}
+    return {
+        'browser_profile': args.browser_profile,
+        'render_mode': args.render_mode,
+        'prefetch_lead': args.prefetch_lead,
+        'mode': mode,
+        'platform': platform,
+        'captures': len(rec.latencies),
+        'failures': len(rec.failures),
+        'wall_s': round(wall, 3),
+        'captures_per_min': round(len(rec.latencies) / wall * 60, 2) if wall else 0.0,
+        'p50_s': round(percentile(rec.latencies, 50), 3),
+        'p90_s': round(percentile(rec.latencies, 90), 3),
+        'p99_s': round(percentile(rec.latencies, 99), 3),
+        'peak_rss_mb': round(peak_rss / 1024 / 1024, 1),
+        **extra,
+    }
+
+
+def print_table(results: List[Dict]):
+    columns = ['mode', 'browser_profile', 'render_mode', 'prefetch_lead', 'platform', 'captures', 'failures', 'captures_per_min',
+               'p50_s', 'p90_s', 'p99_s', 'peak_rss_mb', 'page_kb']
+    columns += sorted({k for r in results for k in r if k.endswith('_s') and k not in columns
+                       and k != 'wall_s'})
+    widths = {c: max(len(c), *(len(str(r.get(c, ''))) for r in results)) for c in columns}
+    print('  '.join(c.ljust(widths[c]) for c in columns))
+    for row in results:
+        print('  '.join(str(row.get(c, '')).ljust(widths[c]) for c in columns))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Capture throughput benchmark against a fake dashboard server")
+    parser.add_argument("-m", "--modes", nargs="+", default=list(MODES), help=f"Modes to run ({', '.join(MODES)})")
+    parser.add_argument("-p", "--platforms", nargs="+", default=['grafana', 'dynatrace', 'splunk'],
+                        choices=['grafana', 'dynatrace', 'splunk'])
+    parser.add_argument("-n", "--dashboards", type=int, default=5, help="Captures per mode and platform")
+    parser.add_argument("-t", "--time-range", default="now-1h")
+    parser.add_argument("--panels", type=int, default=6, help="Panels per fake dashboard")
+    parser.add_argument("--render-delay", type=float, default=0.5, help="Seconds before panels render")
+    parser.add_argument("--panel-stagger", type=float, default=0.05, help="Extra seconds between panels")
+    parser.add_argument("--api-latency", type=float, default=0.0, help="Seconds added to fake JSON APIs")
+    parser.add_argument("--asset-kb", type=int, default=512, help="Size of each fake static bundle")
+    parser.add_argument("--noise-kb", type=int, default=64, help="Size of each fake font/avatar/telemetry response")
+    parser.add_argument("--resource-filter", choices=['block', 'observe', 'off'],
+                        help="Resource filter mode (block vs observe shows the bytes saved)")
+    parser.add_argument("--browser-profiles", nargs="+", default=['screenshot'],
+                        help="Browser profiles to compare (e.g. legacy screenshot minimal)")
+    parser.add_argument("--render-modes", nargs="+", default=['full'], choices=['full', 'kiosk', 'solo'],
+                        help="Render modes to compare (page weight is the fake server's bytes per capture)")
+    parser.add_argument("--prefetch-leads", nargs="+", type=float, default=[0],
+                        help="Query prefetch lead times to compare in seconds (0: off)")
+    parser.add_argument("--query-latency", type=float, default=0.0,
+                        help="Seconds a cold fake backend query takes (repeats within 5 min are cached)")
+    parser.add_argument("--asset-cache-dir", help="Enable the persistent asset cache at this path")
+    parser.add_argument("--work-dir", default=None, help="Where screenshots go (default: temp dir)")
+    parser.add_argument("--json", dest="json_out", help="Also write results to this JSON file")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
+    unknown = [m for m in args.modes if m not in MODES]
+    if unknown:
+        parser.error(f"Unknown modes: {', '.join(unknown)}")
+    args.work_dir = os.path.abspath(args.work_dir or tempfile.mkdtemp(prefix="capture-bench-"))
+    os.makedirs(args.work_dir, exist_ok=True)
+    if args.json_out:
+        args.json_out = os.path.abspath(args.json_out)
+    if args.resource_filter:
+        os.environ['CAPTURE_RESOURCE_FILTER'] = args.resource_filter
+    if args.asset_cache_dir:
+        os.environ['CAPTURE_ASSET_CACHE_DIR'] = os.path.abspath(args.asset_cache_dir)
+    # The scripts write capture.log / dashboard_links.csv into the cwd
+    os.chdir(args.work_dir)
+
+    servers = {
+        platform: start_server(
+            platform, panels=args.panels, render_delay=args.render_delay,
+            panel_stagger=args.panel_stagger, api_latency=args.api_latency, asset_kb=args.asset_kb,
+            noise_kb=args.noise_kb, query_latency=args.query_latency,
+        )
+        for platform in args.platforms
+    }
+    if 'splunk' in servers:
+        # Splunk REST (the search export endpoint) is served by the same fake server
+        os.environ['CAPTURE_SPLUNK_REST_URL'] = servers['splunk'].base_url
+    results = []
+    try:
+        for profile_name, render_mode, lead in itertools.product(args.browser_profiles, args.render_modes,
+                                                                 args.prefetch_leads):
+            # Every capture path picks its profile, render mode and prefetch lead up from the environment
+            os.environ['CAPTURE_BROWSER_PROFILE'] = profile_name
+            os.environ['CAPTURE_RENDER_MODE'] = render_mode
+            os.environ['CAPTURE_PREFETCH_LEAD'] = str(lead)
+            args.browser_profile, args.render_mode, args.prefetch_lead = profile_name, render_mode, lead
+            for mode in args.modes:
+                for platform, server in servers.items():
+                    if mode in GRAFANA_MODES and platform != 'grafana':
+                        continue
+                    if render_mode == 'solo' and platform == 'grafana' and mode not in SOLO_MODES:
+                        logging.info(f"Skipping {mode} for solo Grafana (whole-dashboard mode)")
+                        continue
+                    server.RequestHandlerClass.stats.reset()
+                    # Every run starts with cold backends
+                    server.RequestHandlerClass.query_cache.clear()
+                    result = run_mode(mode, platform, server.base_url, args)
+                    stats = server.RequestHandlerClass.stats.snapshot()
+                    result['server_requests'] = stats['requests']
+                    result['server_bytes'] = stats['bytes']
+                    if result['captures']:
+                        result['page_kb'] = round(stats['bytes'] / result['captures'] / 1024, 1)
+                    results.append(result)
+    finally:
+        for server in servers.values():
+            server.shutdown()
+
+    print_table(results)
+    if args.json_out:
+        with open(args.json_out, 'w') as f:
+            json.dump(results, f, indent=2)
+        logging.info(f"Wrote {args.json_out}")
+
+
+if __name__ == "__main__":
+    main()
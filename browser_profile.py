@@ -0,0 +1,232 @@
+import os
+import logging
+from typing import Dict, List, Optional, Tuple
+from selenium import webdriver
+import asset_cache
+import resource_filter
+
+# Chrome settings shared by every capture path, tuned for headless screenshots
+
+# Analytics, telemetry and update-check URLs that never affect a dashboard render
+# (Network.setBlockedURLs wildcard syntax)
+DEFAULT_BLOCKLIST = [
+    "*google-analytics.com*",
+    "*googletagmanager.com*",
+    "*doubleclick.net*",
+    "*segment.io*",
+    "*api.segment.io*",
+    "*sentry.io*",
+    "*hotjar.com*",
+    "*stats.grafana.org*",
+    "*://grafana.com/api/plugins*",
+    "*://grafana.com/api/grafana/versions*",
+    "*/api/frontend-metrics*",
+    "*/api/live/ws*",
+    "*beacon.dynatrace.com*",
+    "*/rb_bf*",
+    "*quickdraw.splunk.com*",
+    "*e1345.dsca.akamaiedge.net*",
+]
+
+# Flags that turn off work a capture never needs
+LIGHTWEIGHT_ARGS = [
+    "--disable-extensions",
+    "--disable-background-networking",
+    "--disable-component-update",
+    "--disable-default-apps",
+    "--disable-sync",
+    "--disable-domain-reliability",
+    "--disable-client-side-phishing-detection",
+    "--disable-features=Translate,OptimizationHints,MediaRouter,AutofillServerCommunication",
+    "--metrics-recording-only",
+    "--no-first-run",
+    "--no-pings",
+    "--mute-audio",
+    "--hide-scrollbars",
+    # Keep timers and rendering running while the window is hidden
+    "--disable-background-timer-throttling",
+    "--disable-backgrounding-occluded-windows",
+    "--disable-renderer-backgrounding",
+]
+
+PROFILES: Dict[str, Dict] = {
+    # What the scripts used before: no tuning at all
+    'legacy': {
+        'lightweight': False,
+        'disable_gpu': False,
+        'blocked_urls': [],
+        'filter_resources': False,
+    },
+    # Default for captures
+    'screenshot': {
+        'lightweight': True,
+        'disable_gpu': True,
+        'blocked_urls': DEFAULT_BLOCKLIST,
+        'disk_cache_size_mb': 256,
+        'memory_cap_mb': 1024,
+    },
+    # Smallest footprint for many parallel browsers
+    'minimal': {
+        'lightweight': True,
+        'disable_gpu': True,
+        'blocked_urls': DEFAULT_BLOCKLIST,
+        'disk_cache_size_mb': 128,
+        'memory_cap_mb': 512,
+        'extra_args': ["--renderer-process-limit=1", "--disable-site-isolation-trials"],
+    },
+}
+
+
+class CaptureDriverMixin:
+    """Reports the resource filter and hands the asset cache slot back on quit"""
+    cache_slot = None
+    resource_filter = None
+
+    def collect_network_stats(self):
+        """Fold the network events since the last call into the resource filter stats"""
+        if self.resource_filter:
+            self.resource_filter.collect(self)
+
+    def quit(self):
+        try:
+            if self.resource_filter:
+                self.collect_network_stats()
+                self.resource_filter.report()
+        except Exception as e:
+            logging.warning(f"Could not collect resource filter stats: {str(e)}")
+        try:
+            super().quit()
+        finally:
+            if self.cache_slot:
+                self.cache_slot.release()
+                self.cache_slot = None
+
+
+class CaptureDriver(CaptureDriverMixin, webdriver.Chrome):
+    """Local Chrome"""
+
+
+class RemoteCaptureDriver(CaptureDriverMixin, webdriver.Remote):
+    """Chrome on a Selenium Grid node"""
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Remote has no execute_cdp_cmd; Chrome nodes expose the same endpoint
+        self.command_executor._commands['executeCdpCommand'] = ('POST', '/session/$sessionId/goog/cdp/execute')
+
+    def execute_cdp_cmd(self, cmd: str, cmd_args: Dict):
+        return self.execute('executeCdpCommand', {'cmd': cmd, 'params': cmd_args})['value']
+
+
+class BrowserProfile:
+    """Tunable Chrome configuration used to build drivers"""
+    def __init__(self, name: str = 'screenshot', headless: bool = True,
+                 window_size: Tuple[int, int] = (1920, 1080), lightweight: bool = True,
+                 disable_gpu: bool = True, disk_cache_dir: Optional[str] = None,
+                 disk_cache_size_mb: Optional[int] = None, blocked_urls: Optional[List[str]] = None,
+                 memory_cap_mb: Optional[int] = None, extra_args: Optional[List[str]] = None,
+                 asset_cache: Optional[asset_cache.AssetCache] = None, filter_resources: bool = True,
+                 remote_url: Optional[str] = None):
+        self.name = name
+        self.headless = headless
+        self.window_size = window_size
+        self.lightweight = lightweight
+        self.disable_gpu = disable_gpu
+        self.disk_cache_dir = disk_cache_dir
+        self.disk_cache_size_mb = disk_cache_size_mb
+        self.blocked_urls = list(blocked_urls or [])
+        self.memory_cap_mb = memory_cap_mb
+        self.extra_args = list(extra_args or [])
+        self.asset_cache = asset_cache
+        self.filter_resources = filter_resources
+        self.remote_url = remote_url
+
+    def arguments(self, disk_cache_dir: Optional[str] = None) -> List[str]:
+        """Chrome command-line switches for this profile"""
+        disk_cache_dir = disk_cache_dir or self.disk_cache_dir
+        args = []
+        if self.headless:
+            args.append("--headless=new")
+        args += ["--no-sandbox", "--disable-dev-shm-usage"]
+        args.append(f"--window-size={self.window_size[0]},{self.window_size[1]}")
+        if self.lightweight:
+            args += LIGHTWEIGHT_ARGS
+        if self.disable_gpu:
+            args.append("--disable-gpu")
+        if disk_cache_dir:
+            args.append(f"--disk-cache-dir={disk_cache_dir}")
+        if self.disk_cache_size_mb:
+            args.append(f"--disk-cache-size={self.disk_cache_size_mb * 1024 * 1024}")
+        if self.memory_cap_mb:
+            args.append(f"--js-flags=--max-old-space-size={self.memory_cap_mb}")
+        return args + self.extra_args
+
+    def chrome_options(self, disk_cache_dir: Optional[str] = None) -> webdriver.ChromeOptions:
+        options = webdriver.ChromeOptions()
+        for arg in self.arguments(disk_cache_dir):
+            options.add_argument(arg)
+        return options
+
+    def apply_blocklist(self, driver, extra_urls: Optional[List[str]] = None):
+        """Block analytics/telemetry URLs (plus extra_urls) through the DevTools protocol"""
+        urls = self.blocked_urls + list(extra_urls or [])
+        if not urls:
+            return
+        try:
+            driver.execute_cdp_cmd("Network.enable", {})
+            driver.execute_cdp_cmd("Network.setBlockedURLs", {"urls": urls})
+        except Exception as e:
+            logging.warning(f"Could not apply URL blocklist: {str(e)}")
+
+    def _network_options(self, options: webdriver.ChromeOptions, rf):
+        if rf and rf.mode != 'off':
+            # Network events feed the per-platform savings report
+            options.set_capability('goog:loggingPrefs', {'performance': 'ALL'})
+        return options
+
+    def create_remote_driver(self, platform: str = 'default') -> RemoteCaptureDriver:
+        """Start Chrome on the Selenium Grid at remote_url (no local asset cache there)"""
+        rf = resource_filter.from_env(platform) if self.filter_resources else None
+        options = self._network_options(self.chrome_options(), rf)
+        driver = RemoteCaptureDriver(command_executor=self.remote_url, options=options)
+        driver.resource_filter = rf
+        self.apply_blocklist(driver, rf.blocked_urls if rf else None)
+        return driver
+
+    def create_driver(self, platform: str = 'default') -> CaptureDriverMixin:
+        """Start Chrome with this profile: on the grid when remote_url is set (falling back
+        to local Chrome), locally on a persistent asset cache slot when configured"""
+        if self.remote_url:
+            try:
+                return self.create_remote_driver(platform)
+            except Exception as e:
+                logging.warning(f"Selenium Grid {self.remote_url} unavailable, using local Chrome: {str(e)}")
+        rf = resource_filter.from_env(platform) if self.filter_resources else None
+        options = self.chrome_options()
+        slot = self.asset_cache.acquire(platform) if self.asset_cache else None
+        if slot:
+            options = self.chrome_options(slot.path)
+        options = self._network_options(options, rf)
+        try:
+            driver = CaptureDriver(options=options)
+        except Exception:
+            if slot:
+                slot.release()
+            raise
+        driver.cache_slot = slot
+        driver.resource_filter = rf
+        self.apply_blocklist(driver, rf.blocked_urls if rf else None)
+        return driver
+
+
+def get_profile(name: Optional[str] = None, **overrides) -> BrowserProfile:
+    """Build a named profile; name defaults to $CAPTURE_BROWSER_PROFILE or 'screenshot'"""
+    name = name or os.environ.get('CAPTURE_BROWSER_PROFILE', 'screenshot')
+    if name not in PROFILES:
+        raise ValueError(f"Unknown browser profile: {name} (choose from {', '.join(PROFILES)})")
+    settings = dict(PROFILES[name])
+    if os.environ.get('CAPTURE_CHROME_CACHE_DIR'):
+        settings.setdefault('disk_cache_dir', os.environ['CAPTURE_CHROME_CACHE_DIR'])
+    settings.setdefault('asset_cache', asset_cache.from_env())
+    settings.setdefault('remote_url', os.environ.get('CAPTURE_SELENIUM_GRID'))
+    settings.update({k: v for k, v in overrides.items() if v is not None})
+    return BrowserProfile(name=name, **settings)
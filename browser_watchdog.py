@@ -0,0 +1,155 @@
+import os
+import time
+import logging
+import threading
+from contextlib import contextmanager
+from typing import Optional
+
+import proctree
+
+# Watchdog for one browser: samples the chromedriver/Chrome process tree and
+# kills it when a capture overruns its deadline, the tree grows past an RSS cap,
+# or a capture burns more CPU than its budget. Killing the tree makes the blocked
+# Selenium call fail at once; the caller sees BrowserRecycled and retries the
+# dashboard on a fresh browser.
+#
+# Remote (grid) browsers have no local process tree; they only get the page load
+# timeout and the between-jobs ping.
+
+
+class BrowserRecycled(Exception):
+    """The watchdog killed the browser during a capture"""
+
+
+class BrowserWatchdog(threading.Thread):
+    """Monitor one driver's process tree and kill it when it goes bad"""
+    def __init__(self, driver, deadline: float = 180, max_rss_mb: int = 3072, max_cpu_seconds: float = 0,
+                 ping_timeout: float = 10, interval: float = 2.0):
+        super().__init__(name='browser-watchdog', daemon=True)
+        self.driver = driver
+        self.deadline = deadline
+        self.max_rss_mb = max_rss_mb
+        self.max_cpu_seconds = max_cpu_seconds
+        self.ping_timeout = ping_timeout
+        self.interval = interval
+        self.pid = self._driver_pid(driver)
+        self.tripped: Optional[str] = None
+        self.peak_rss_mb = 0.0
+        self._label = None
+        self._capture_started = None
+        self._cpu_start = 0.0
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        try:
+            driver.set_page_load_timeout(deadline)
+        except Exception as e:
+            logging.debug(f"Could not set page load timeout: {str(e)}")
+
+    @staticmethod
+    def _driver_pid(driver) -> Optional[int]:
+        process = getattr(getattr(driver, 'service', None), 'process', None)
+        return getattr(process, 'pid', None)
+
+    def begin(self, label: str):
+        """Start the deadline and CPU budget for one capture"""
+        with self._lock:
+            self._label, self._capture_started = label, time.monotonic()
+            self._cpu_start = proctree.tree_cpu_seconds(self.pid) if self.pid else 0.0
+
+    def end(self):
+        with self._lock:
+            self._label = self._capture_started = None
+
+    @contextmanager
+    def capture(self, label: str):
+        """begin()/end() around one capture, raising BrowserRecycled if the browser was killed"""
+        self.begin(label)
+        try:
+            yield
+        except Exception as e:
+            if self.diagnose():
+                raise BrowserRecycled(f"{label}: {self.tripped}") from e
+            raise
+        finally:
+            self.end()
+
+    def diagnose(self) -> bool:
+        """After a failed capture: True if the browser is dead or wedged (and now killed)"""
+        self.end()
+        if not self.tripped:
+            self.check()
+        if not self.tripped:
+            self.ping()
+        return bool(self.tripped)
+
+    def ping(self) -> bool:
+        """True if the browser answers a trivial script within ping_timeout"""
+        result = {}
+
+        def _ping():
+            try:
+                result['ok'] = self.driver.execute_script('return 1') == 1
+            except Exception:
+                result['ok'] = False
+
+        thread = threading.Thread(target=_ping, daemon=True)
+        thread.start()
+        thread.join(self.ping_timeout)
+        if result.get('ok'):
+            return True
+        self.kill('no answer to ping' if thread.is_alive() else 'ping failed')
+        return False
+
+    def kill(self, reason: str):
+        with self._lock:
+            if self.tripped:
+                return
+            self.tripped = reason
+            label = self._label
+        logging.warning(f"Watchdog killing browser{f' during {label}' if label else ''}: {reason}")
+        if self.pid:
+            proctree.kill_tree(self.pid)
+
+    def check(self):
+        """One sample of the process tree (called every interval)"""
+        with self._lock:
+            label, started, cpu_start = self._label, self._capture_started, self._cpu_start
+        if label and time.monotonic() - started > self.deadline:
+            return self.kill(f"capture exceeded {self.deadline:.0f}s deadline")
+        if not self.pid:
+            return
+        if not proctree.rss_bytes(self.pid):
+            return self.kill('chromedriver exited')
+        rss_mb = proctree.tree_rss_bytes(self.pid) / (1024 * 1024)
+        self.peak_rss_mb = max(self.peak_rss_mb, rss_mb)
+        if self.max_rss_mb and rss_mb > self.max_rss_mb:
+            return self.kill(f"RSS {rss_mb:.0f} MB over {self.max_rss_mb} MB")
+        if label and self.max_cpu_seconds:
+            cpu = proctree.tree_cpu_seconds(self.pid) - cpu_start
+            if cpu > self.max_cpu_seconds:
+                self.kill(f"capture used {cpu:.0f}s CPU, budget {self.max_cpu_seconds:.0f}s")
+
+    def run(self):
+        while not self._stop_event.wait(self.interval) and not self.tripped:
+            try:
+                self.check()
+            except Exception as e:
+                logging.debug(f"Watchdog sample failed: {str(e)}")
+
+    def stop(self):
+        self._stop_event.set()
+
+
+def from_env(driver) -> Optional[BrowserWatchdog]:
+    """Watchdog configured by $CAPTURE_WATCHDOG_DEADLINE, $CAPTURE_WATCHDOG_RSS_MB,
+    $CAPTURE_WATCHDOG_CPU_SECONDS (0 disables a limit); $CAPTURE_WATCHDOG=off disables it"""
+    if os.environ.get('CAPTURE_WATCHDOG', 'on') == 'off':
+        return None
+    watchdog = BrowserWatchdog(
+        driver,
+        deadline=float(os.environ.get('CAPTURE_WATCHDOG_DEADLINE', 180)),
+        max_rss_mb=int(os.environ.get('CAPTURE_WATCHDOG_RSS_MB', 3072)),
+        max_cpu_seconds=float(os.environ.get('CAPTURE_WATCHDOG_CPU_SECONDS', 0)),
+    )
+    watchdog.start()
+    return watchdog
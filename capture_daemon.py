@@ -0,0 +1,333 @@
+import json
+import signal
+import logging
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional
+
+import requests
+
+import mail_delivery
+import remote_driver
+import superfake
+
+# Long-running capture service: warm browsers pull jobs from a priority queue,
+# clients submit/inspect/cancel jobs over a local HTTP/JSON API.
+#
+#   POST   /jobs        {"platform": "grafana", "dashboard_id": "...", ..., "priority": 5}  (or a list;
+#                       "variables": {"host": null} queues one job per value; "mail_to": "a@x,b@y"
+#                       mails the captures once the last of those jobs is over)
+#   GET    /jobs        all known jobs
+#   GET    /jobs/<id>   one job, including output_path once done
+#   DELETE /jobs/<id>   cancel a queued job
+#   GET    /health      queue and worker counts
+
+MAX_FINISHED_JOBS = 1000
+SECRET_FIELDS = ('password', 'token')
+
+
+class Job:
+    """One capture request and its lifecycle"""
+    def __init__(self, payload: Dict, priority: int = 0):
+        self.id = uuid.uuid4().hex[:12]
+        self.payload = payload
+        self.priority = priority
+        self.status = 'queued'
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.output_path = None
+        self.error = None
+        self.worker = None
+        self.batch: Optional[mail_delivery.Batch] = None
+
+    @property
+    def session_key(self):
+        return (self.payload['platform'], self.payload['url'])
+
+    def as_dict(self) -> Dict:
+        return {
+            'id': self.id,
+            'status': self.status,
+            'priority': self.priority,
+            'job': {k: v for k, v in self.payload.items() if k not in SECRET_FIELDS},
+            'created_at': self.created_at,
+            'started_at': self.started_at,
+            'finished_at': self.finished_at,
+            'output_path': self.output_path,
+            'error': self.error,
+            'worker': self.worker,
+        }
+
+
+class JobQueue:
+    """Priority queue (higher first, FIFO within a priority) with session affinity"""
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._pending: List[Job] = []
+        self._jobs: Dict[str, Job] = {}
+        self._finished: List[str] = []
+        self._closed = False
+
+    def submit(self, job: Job) -> Job:
+        with self._cond:
+            self._jobs[job.id] = job
+            self._pending.append(job)
+            # Stable sort keeps submission order within a priority
+            self._pending.sort(key=lambda j: -j.priority)
+            self._cond.notify()
+        return job
+
+    def next(self, sessions=frozenset(), timeout: float = 1.0) -> Optional[Job]:
+        """Pop the best job, preferring one this worker already holds a login for"""
+        with self._cond:
+            if not self._pending and not self._closed:
+                self._cond.wait(timeout)
+            if not self._pending:
+                return None
+            top = self._pending[0].priority
+            chosen = self._pending[0]
+            for job in self._pending:
+                if job.priority != top:
+                    break
+                if job.session_key in sessions:
+                    chosen = job
+                    break
+            self._pending.remove(chosen)
+            chosen.status = 'running'
+            chosen.started_at = time.time()
+            return chosen
+
+    def finish(self, job: Job, output_path: str = None, error: str = None):
+        with self._cond:
+            job.finished_at = time.time()
+            job.output_path = output_path
+            job.error = error
+            job.status = 'failed' if error else 'done'
+            self._remember(job)
+        if job.batch:
+            job.batch.finished(output_path)
+
+    def _remember(self, job: Job):
+        self._finished.append(job.id)
+        while len(self._finished) > MAX_FINISHED_JOBS:
+            self._jobs.pop(self._finished.pop(0), None)
+
+    def cancel(self, job_id: str) -> Optional[Job]:
+        """Cancel a queued job; running and finished jobs are left alone"""
+        with self._cond:
+            job = self._jobs.get(job_id)
+            if job and job.status == 'queued':
+                self._pending.remove(job)
+                job.status = 'cancelled'
+                job.finished_at = time.time()
+                self._remember(job)
+            else:
+                return job
+        if job.batch:
+            job.batch.finished()
+        return job
+
+    def pending(self) -> List[Dict]:
+        """Payloads of the queued jobs, in the order they will run"""
+        with self._cond:
+            return [job.payload for job in self._pending]
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._cond:
+            return self._jobs.get(job_id)
+
+    def all(self) -> List[Job]:
+        with self._cond:
+            return list(self._jobs.values())
+
+    def counts(self) -> Dict[str, int]:
+        with self._cond:
+            counts = {}
+            for job in self._jobs.values():
+                counts[job.status] = counts.get(job.status, 0) + 1
+            return counts
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+
+class CaptureWorker(threading.Thread):
+    """Owns one warm browser and runs jobs on it"""
+    def __init__(self, index: int, queue: JobQueue, profile_name: str = None,
+                 headless: bool = True, max_jobs_per_browser: int = 200):
+        super().__init__(name=f"capture-worker-{index}", daemon=True)
+        self.queue = queue
+        self.app = superfake.CaptureApp(profile_name=profile_name)
+        self.headless = headless
+        self.max_jobs_per_browser = max_jobs_per_browser
+        self.jobs_on_browser = 0
+        self._stop_event = threading.Event()
+
+    def stop(self):
+        self._stop_event.set()
+
+    def run(self):
+        try:
+            while not self._stop_event.is_set():
+                job = self.queue.next(frozenset(self.app.sessions))
+                if job is None:
+                    continue
+                self._run(job)
+        finally:
+            self.app.close()
+
+    def _run(self, job: Job):
+        job.worker = self.name
+        logging.info(f"[{self.name}] Job {job.id}: {job.payload['platform']} "
+                     f"{job.payload.get('dashboard_id') or job.payload.get('dashboard_name')}")
+        if self.app.prefetcher:
+            self.app.prefetcher.upcoming(self.queue.pending())
+        try:
+            output_path = self.app.run_job(job.payload, headless=self.headless)
+        except Exception as e:
+            logging.error(f"[{self.name}] Job {job.id} failed: {str(e)}")
+            self.queue.finish(job, error=str(e))
+            # The browser may be wedged; start the next job on a fresh one
+            self.app.close()
+            self.jobs_on_browser = 0
+            return
+        self.queue.finish(job, output_path=output_path)
+        self.jobs_on_browser += 1
+        if self.jobs_on_browser >= self.max_jobs_per_browser:
+            logging.info(f"[{self.name}] Recycling browser after {self.jobs_on_browser} jobs")
+            self.app.close()
+            self.jobs_on_browser = 0
+
+
+class CaptureDaemon:
+    """Job queue, worker pool and defaults for submitted jobs"""
+    def __init__(self, workers: int = 2, defaults: Dict = None, profile_name: str = None,
+                 headless: bool = True):
+        self.queue = JobQueue()
+        self.defaults = {k: v for k, v in (defaults or {}).items() if v is not None}
+        # Connects on the first mail_to delivery
+        self.mailer = mail_delivery.from_env()
+        self.workers = [
+            CaptureWorker(n, self.queue, profile_name=profile_name, headless=headless)
+            for n in range(workers)
+        ]
+
+    def start(self):
+        for worker in self.workers:
+            worker.start()
+
+    def stop(self):
+        self.queue.close()
+        for worker in self.workers:
+            worker.stop()
+        for worker in self.workers:
+            worker.join()
+        self.mailer.close()
+
+    def submit(self, payload: Dict) -> List[Job]:
+        """Queue a job (one per combination when it has a template variable matrix,
+        one per panel/search for exports)"""
+        return [self.queue.submit(job) for job in self.prepare(payload)]
+
+    def prepare(self, payload: Dict) -> List[Job]:
+        """The jobs submit() would queue, validated and expanded but not queued yet"""
+        payload = dict(payload)
+        priority = int(payload.pop('priority', 0))
+        mail_to = mail_delivery.recipients(payload.pop('mail_to', None))
+        jobs = [Job(superfake.validate_job(job), priority)
+                for job in superfake.expand_job({**self.defaults, **payload})]
+        if mail_to and jobs:
+            dashboard = jobs[0].payload.get('dashboard_name') or jobs[0].payload.get('dashboard_id')
+            batch = mail_delivery.Batch(self.mailer, mail_to, f"Dashboard captures: {dashboard}",
+                                        jobs[0].payload.get('output_dir'), len(jobs))
+            for job in jobs:
+                job.batch = batch
+        return jobs
+
+
+def make_handler(daemon: CaptureDaemon):
+    class CaptureAPIHandler(BaseHTTPRequestHandler):
+        """HTTP/JSON front end for the daemon"""
+        def log_message(self, fmt, *args):
+            logging.debug(f"API {fmt % args}")
+
+        def _reply(self, payload, status: int = 200):
+            body = json.dumps(payload).encode()
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _job_id(self) -> Optional[str]:
+            parts = self.path.strip('/').split('/')
+            return parts[1] if len(parts) == 2 and parts[0] == 'jobs' else None
+
+        def do_GET(self):
+            if self.path == '/health':
+                return self._reply({'workers': len(daemon.workers), 'jobs': daemon.queue.counts()})
+            if self.path.rstrip('/') == '/jobs':
+                return self._reply([job.as_dict() for job in daemon.queue.all()])
+            job = daemon.queue.get(self._job_id() or '')
+            if job is None:
+                return self._reply({'error': 'job not found'}, 404)
+            self._reply(job.as_dict())
+
+        def do_POST(self):
+            if self.path.rstrip('/') != '/jobs':
+                return self._reply({'error': 'not found'}, 404)
+            try:
+                length = int(self.headers.get('Content-Length') or 0)
+                payload = json.loads(self.rfile.read(length) or b'{}')
+                # Every item must pass before any is queued: an error reply carries no job ids
+                prepared = [job for item in (payload if isinstance(payload, list) else [payload])
+                            for job in daemon.prepare(item)]
+                jobs = [daemon.queue.submit(job) for job in prepared]
+                if isinstance(payload, list) or len(jobs) != 1:
+                    return self._reply([job.as_dict() for job in jobs], 202)
+                self._reply(jobs[0].as_dict(), 202)
+            except (ValueError, TypeError, requests.RequestException) as e:
+                self._reply({'error': str(e)}, 400)
+
+        def do_DELETE(self):
+            job = daemon.queue.cancel(self._job_id() or '')
+            if job is None:
+                return self._reply({'error': 'job not found'}, 404)
+            if job.status != 'cancelled':
+                return self._reply({'error': f"job is {job.status}", 'job': job.as_dict()}, 409)
+            self._reply(job.as_dict())
+
+    return CaptureAPIHandler
+
+
+def serve(args):
+    """Run the daemon until SIGINT/SIGTERM (args from superfake.main)"""
+    host, _, port = args.listen.rpartition(':')
+    # --workers 0: one warm session per grid slot
+    workers = args.workers or remote_driver.grid_capacity()
+    daemon = CaptureDaemon(
+        workers=workers,
+        defaults={
+            'url': args.url, 'username': args.username, 'password': args.password,
+            'output_dir': args.output_dir, 'time_range': args.time_range,
+        },
+        profile_name=args.browser_profile,
+    )
+    server = ThreadingHTTPServer((host or '127.0.0.1', int(port)), make_handler(daemon))
+    server.daemon_threads = True
+    signal.signal(signal.SIGTERM, lambda *_: threading.Thread(target=server.shutdown).start())
+    daemon.start()
+    logging.info(f"Capture daemon listening on http://{host or '127.0.0.1'}:{port} with {workers} workers")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        daemon.stop()
+        logging.info("Capture daemon stopped")
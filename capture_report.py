@@ -0,0 +1,240 @@
+import os
+import io
+import csv
+import html
+import logging
+import argparse
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Dict, Iterator, List, Optional, Set
+
+import run_journal
+
+# Reports need Pillow
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+# Report stage: a run's captures as one paginated PDF and an HTML contact sheet.
+#
+# Captures come from capture_history.csv (only those recorded in the run's
+# journal when a run id is given), grouped by platform and dashboard, oldest
+# window first. Images are decoded, scaled and thumbnailed by a worker pool a
+# few at a time and written out in order as they finish: the PDF is written page
+# by page and the HTML row by row, so memory stays flat however long the run.
+# Data exports (CSV, JSON, Parquet) are linked from the HTML only.
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg')
+THUMBNAIL_PX = 320
+# Longest side of a page image; tall kiosk captures are scaled down to fit the page anyway
+PAGE_IMAGE_PX = 2400
+PAGE_JPEG_QUALITY = 85
+# A4 landscape, in points
+PAGE_SIZE = (842, 595)
+PAGE_MARGIN = 28
+CAPTION_HEIGHT = 34
+
+CONTACT_SHEET_CSS = """
+body { font-family: sans-serif; margin: 24px; color: #222; }
+h2 { border-bottom: 1px solid #ccc; padding-bottom: 4px; margin-top: 32px; }
+.grid { display: flex; flex-wrap: wrap; gap: 12px; }
+.capture { width: 320px; font-size: 12px; }
+.capture img { max-width: 320px; max-height: 320px; border: 1px solid #ddd; }
+"""
+
+
+class PdfWriter:
+    """Minimal streaming PDF: one JPEG per page under a two-line caption"""
+    def __init__(self, path: str):
+        self.file = open(path, 'wb')
+        self.offsets: Dict[int, int] = {}
+        self.pages: List[int] = []
+        # 1: catalog, 2: page tree (written last, once the pages are known), 3: font
+        self.next_id = 4
+        self.file.write(b'%PDF-1.4\n%\xe2\xe3\xcf\xd3\n')
+        self._object(1, b'<< /Type /Catalog /Pages 2 0 R >>')
+        self._object(3, b'<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>')
+
+    def _object(self, number: int, body: bytes, stream: bytes = None):
+        self.offsets[number] = self.file.tell()
+        self.file.write(f"{number} 0 obj\n".encode() + body)
+        if stream is not None:
+            self.file.write(b'\nstream\n' + stream + b'\nendstream')
+        self.file.write(b'\nendobj\n')
+
+    def _reserve(self) -> int:
+        self.next_id += 1
+        return self.next_id - 1
+
+    @staticmethod
+    def _text(text: str) -> bytes:
+        raw = text.encode('cp1252', 'replace')
+        return b'(' + raw.replace(b'\\', b'\\\\').replace(b'(', b'\\(').replace(b')', b'\\)') + b')'
+
+    def add_page(self, title: str, subtitle: str, jpeg: bytes = None, size=None):
+        width, height = PAGE_SIZE
+        content = (b'BT /F1 13 Tf %d %d Td ' % (PAGE_MARGIN, height - PAGE_MARGIN - 6) + self._text(title)
+                   + b' Tj /F1 9 Tf 0 -15 Td ' + self._text(subtitle) + b' Tj ET')
+        resources = b'/Font << /F1 3 0 R >>'
+        if jpeg:
+            image_id = self._reserve()
+            self._object(image_id, b'<< /Type /XObject /Subtype /Image /Width %d /Height %d /ColorSpace /DeviceRGB '
+                         b'/BitsPerComponent 8 /Filter /DCTDecode /Length %d >>' % (size[0], size[1], len(jpeg)),
+                         jpeg)
+            box_width, box_height = width - 2 * PAGE_MARGIN, height - 2 * PAGE_MARGIN - CAPTION_HEIGHT
+            scale = min(box_width / size[0], box_height / size[1])
+            draw_width, draw_height = size[0] * scale, size[1] * scale
+            x, y = PAGE_MARGIN + (box_width - draw_width) / 2, PAGE_MARGIN + (box_height - draw_height)
+            content += b' q %.2f 0 0 %.2f %.2f %.2f cm /Im0 Do Q' % (draw_width, draw_height, x, y)
+            resources += b' /XObject << /Im0 %d 0 R >>' % image_id
+        content_id, page_id = self._reserve(), self._reserve()
+        self._object(content_id, b'<< /Length %d >>' % len(content), content)
+        self._object(page_id, b'<< /Type /Page /Parent 2 0 R /MediaBox [0 0 %d %d] /Resources << %s >> '
+                     b'/Contents %d 0 R >>' % (width, height, resources, content_id))
+        self.pages.append(page_id)
+
+    def close(self):
+        if not self.pages:
+            self.add_page('No captures', '')
+        kids = b' '.join(b'%d 0 R' % page for page in self.pages)
+        self._object(2, b'<< /Type /Pages /Kids [%s] /Count %d >>' % (kids, len(self.pages)))
+        xref = self.file.tell()
+        self.file.write(b'xref\n0 %d\n0000000000 65535 f \n' % self.next_id)
+        for number in range(1, self.next_id):
+            self.file.write(b'%010d 00000 n \n' % self.offsets.get(number, 0))
+        self.file.write(b'trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n' % (self.next_id, xref))
+        self.file.close()
+
+
+def captures(output_dir: str, run_id: str = None, since: datetime = None) -> List[Dict]:
+    """History rows of the output dir (or of one run, or captured since a time), one per file,
+    by platform, dashboard and window"""
+    history = os.path.join(output_dir, 'capture_history.csv')
+    if not os.path.exists(history):
+        return []
+    files: Optional[Set[str]] = None
+    if run_id:
+        journal = run_journal.RunJournal.open(output_dir, run_id)
+        files = journal.files()
+    rows = {}
+    with open(history, newline='') as f:
+        for row in csv.DictReader(f):
+            if since and datetime.fromisoformat(row['capture_time']) < since:
+                continue
+            if files is None or row['file_path'] in files:
+                # Recaptures and store hits repeat a file: the last row wins
+                rows[row['file_path']] = row
+    return sorted(rows.values(), key=lambda r: (r['platform'], r['dashboard_name'], r['dashboard_id'],
+                                                r['start_date'], r['file_path']))
+
+
+def _prepare(file_path: str, thumbnail_path: str) -> Dict:
+    """Page JPEG and thumbnail of one capture (runs in the worker pool)"""
+    with Image.open(file_path) as image:
+        image = image.convert('RGB')
+    page = image.copy()
+    page.thumbnail((PAGE_IMAGE_PX, PAGE_IMAGE_PX))
+    buffer = io.BytesIO()
+    page.save(buffer, 'JPEG', quality=PAGE_JPEG_QUALITY)
+    image.thumbnail((THUMBNAIL_PX, THUMBNAIL_PX))
+    image.save(thumbnail_path, 'JPEG', quality=80)
+    return {'jpeg': buffer.getvalue(), 'size': page.size}
+
+
+def _prepared(rows: List[Dict], thumbs_dir: str, workers: int) -> Iterator[tuple]:
+    """(n, row, future) in order, with at most 2 x workers images in flight"""
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='report-thumb') as pool:
+        window = deque()
+        for n, row in enumerate(rows):
+            future = None
+            if row['file_path'].lower().endswith(IMAGE_EXTENSIONS):
+                future = pool.submit(_prepare, row['file_path'], os.path.join(thumbs_dir, f"{n}.jpg"))
+            window.append((n, row, future))
+            if len(window) >= workers * 2:
+                yield window.popleft()
+        while window:
+            yield window.popleft()
+
+
+def window_label(row: Dict) -> str:
+    """Capture window for captions, e.g. 2025-01-01 00:00 – 2025-01-01 01:00"""
+    try:
+        start, end = datetime.fromisoformat(row['start_date']), datetime.fromisoformat(row['end_date'])
+    except ValueError:
+        return f"{row['start_date']} – {row['end_date']}"
+    return f"{start.strftime('%Y-%m-%d %H:%M')} – {end.strftime('%Y-%m-%d %H:%M')}"
+
+
+def build_report(output_dir: str, run_id: str = None, report_dir: str = None, title: str = None,
+                 workers: int = None, since: datetime = None) -> Dict[str, str]:
+    """Write report.pdf and index.html for the output dir's captures (or one run's, or those
+    captured since a time); returns their paths"""
+    if Image is None:
+        raise ValueError("Reports need Pillow (pip install pillow)")
+    workers = workers or int(os.environ.get('CAPTURE_REPORT_WORKERS', os.cpu_count() or 2))
+    report_dir = report_dir or os.path.join(output_dir, 'reports', run_id or datetime.now().strftime('%Y%m%dT%H%M%S'))
+    thumbs_dir = os.path.join(report_dir, 'thumbs')
+    os.makedirs(thumbs_dir, exist_ok=True)
+    title = title or f"Dashboard captures{f' - run {run_id}' if run_id else ''}"
+    rows = captures(output_dir, run_id, since)
+    paths = {'pdf': os.path.join(report_dir, 'report.pdf'), 'html': os.path.join(report_dir, 'index.html')}
+
+    pdf = PdfWriter(paths['pdf'])
+    images = failed = 0
+    with open(paths['html'], 'w') as page:
+        page.write(f"<!DOCTYPE html>\n<html><head><meta charset=\"utf-8\"><title>{html.escape(title)}</title>"
+                   f"<style>{CONTACT_SHEET_CSS}</style></head><body>\n<h1>{html.escape(title)}</h1>\n"
+                   f"<p>{len(rows)} captures, generated {datetime.now().strftime('%Y-%m-%d %H:%M')}</p>\n")
+        group = None
+        for n, row, future in _prepared(rows, thumbs_dir, workers):
+            if (row['platform'], row['dashboard_name'], row['dashboard_id']) != group:
+                if group:
+                    page.write("</div>\n")
+                group = (row['platform'], row['dashboard_name'], row['dashboard_id'])
+                page.write(f"<h2>{html.escape(row['platform'].capitalize())} · {html.escape(row['dashboard_name'])}"
+                           f" <small>({html.escape(row['dashboard_id'])})</small></h2>\n<div class=\"grid\">\n")
+            link = html.escape(os.path.relpath(row['file_path'], report_dir))
+            name = html.escape(os.path.basename(row['file_path']))
+            prepared = None
+            if future is not None:
+                try:
+                    prepared = future.result()
+                except Exception as e:
+                    failed += 1
+                    logging.warning(f"Report: skipping {row['file_path']}: {str(e)}")
+            if prepared:
+                pdf.add_page(f"{row['platform'].capitalize()} · {row['dashboard_name']}",
+                             f"{window_label(row)}   {os.path.basename(row['file_path'])}",
+                             prepared['jpeg'], prepared['size'])
+                images += 1
+                preview = f"<img src=\"thumbs/{n}.jpg\" alt=\"{name}\" loading=\"lazy\">"
+            else:
+                preview = name
+            page.write(f"<div class=\"capture\"><a href=\"{link}\">{preview}</a><br>{html.escape(window_label(row))}"
+                       f"</div>\n")
+        if group:
+            page.write("</div>\n")
+        page.write("</body></html>\n")
+    pdf.close()
+    logging.info(f"Report of {images} captures ({len(rows) - images - failed} data files, {failed} unreadable) "
+                 f"written to {report_dir}")
+    return paths
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Assemble captures into a PDF report and an HTML contact sheet")
+    parser.add_argument("-o", "--output-dir", default="./captures", help="Output dir of the captures")
+    parser.add_argument("--run", metavar="RUN_ID", help="Only the captures of this --jobs run")
+    parser.add_argument("--report-dir", help="Where to write the report (default: <output dir>/reports/<run id>)")
+    parser.add_argument("--title", help="Report title")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
+    paths = build_report(args.output_dir, args.run, args.report_dir, args.title)
+    print(paths['pdf'])
+    print(paths['html'])
+
+
+if __name__ == "__main__":
+    main()
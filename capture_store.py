@@ -0,0 +1,146 @@
+import os
+import json
+import time
+import shutil
+import hashlib
+import logging
+import threading
+from datetime import datetime
+from typing import Dict, Optional
+
+from run_journal import file_digest
+
+# Content-addressed store for captures of windows that are over.
+#
+# A capture of a fully past window (yesterday 00:00-24:00) can't change until the
+# dashboard does, so it is stored under objects/<sha256 of content> and indexed
+# under keys/<sha256 of capture key>.json; the key covers platform, instance,
+# dashboard, dashboard version, window and render settings. A later request for
+# the same key is served by copying the object to the path the capture would
+# have been written to, after checking its size and sha256. Never a hardlink:
+# a later capture rewriting that path in place would rewrite the object too.
+# Objects are evicted least recently served first once the store outgrows
+# CAPTURE_STORE_MB; index entries left pointing at nothing are dropped on their
+# next lookup.
+
+DEFAULT_MAX_SIZE_MB = 2048
+# Windows must have ended this long ago (late data still arriving otherwise)
+DEFAULT_SETTLE_SECONDS = 300
+
+
+def capture_key(fields: Dict) -> str:
+    """Stable digest of the fields that make two captures identical"""
+    return hashlib.sha256(json.dumps(fields, sort_keys=True, default=str).encode()).hexdigest()
+
+
+class CaptureStore:
+    """Immutable capture cache shared between runs, workers and users of one directory"""
+    def __init__(self, root: str, max_size_mb: int = DEFAULT_MAX_SIZE_MB,
+                 settle_seconds: float = DEFAULT_SETTLE_SECONDS):
+        self.root = os.path.abspath(os.path.expanduser(root))
+        self.max_bytes = max_size_mb * 1024 * 1024
+        self.settle_seconds = settle_seconds
+        self._lock = threading.Lock()
+
+    def cacheable(self, end_date: datetime) -> bool:
+        """The window ended long enough ago for its capture never to change"""
+        return end_date.timestamp() <= time.time() - self.settle_seconds
+
+    def _object_path(self, digest: str) -> str:
+        return os.path.join(self.root, 'objects', digest[:2], digest)
+
+    def _index_path(self, key: str) -> str:
+        return os.path.join(self.root, 'keys', key[:2], f"{key}.json")
+
+    def fetch(self, key: str, output_dir: str) -> Optional[Dict]:
+        """Place the stored capture for key where it was first written (relative to output_dir);
+        returns its index entry with 'file_path' set, None on a miss or a damaged object"""
+        index_path = self._index_path(key)
+        try:
+            with open(index_path) as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        source = self._object_path(entry['digest'])
+        try:
+            intact = os.path.getsize(source) == entry['bytes'] and file_digest(source) == entry['digest']
+        except OSError:
+            intact = False
+        if not intact:
+            logging.warning(f"Capture store object for {entry.get('path')} is missing or damaged, recapturing")
+            for path in (index_path, source):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+            return None
+        file_path = os.path.join(output_dir, entry['path'])
+        os.makedirs(os.path.dirname(file_path), exist_ok=True)
+        temp_path = f"{file_path}.store-{threading.get_ident()}"
+        shutil.copyfile(source, temp_path)
+        os.replace(temp_path, file_path)
+        # Served objects are the last to be evicted
+        os.utime(source)
+        logging.info(f"Served {file_path} from the capture store")
+        return {**entry, 'file_path': file_path}
+
+    def put(self, key: str, file_path: str, output_dir: str, metadata: Dict = None):
+        """Store a finished capture under key"""
+        path = os.path.relpath(file_path, output_dir)
+        if path.startswith('..'):
+            return
+        digest = file_digest(file_path)
+        target = self._object_path(digest)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        if os.path.exists(target):
+            os.utime(target)
+        else:
+            # A copy, not a link: later edits to the output file must not reach the store
+            temp_path = f"{target}.{threading.get_ident()}.tmp"
+            shutil.copyfile(file_path, temp_path)
+            os.replace(temp_path, target)
+        entry = {'digest': digest, 'bytes': os.path.getsize(target), 'path': path,
+                 'stored_at': datetime.now().isoformat(), 'metadata': metadata or {}}
+        index_path = self._index_path(key)
+        os.makedirs(os.path.dirname(index_path), exist_ok=True)
+        temp_path = f"{index_path}.{threading.get_ident()}.tmp"
+        with open(temp_path, 'w') as f:
+            json.dump(entry, f)
+        os.replace(temp_path, index_path)
+        self.evict()
+
+    def evict(self) -> int:
+        """Delete least recently served objects until the store fits; returns bytes freed"""
+        with self._lock:
+            objects = []
+            for dirpath, _, names in os.walk(os.path.join(self.root, 'objects')):
+                for name in names:
+                    try:
+                        objects.append((os.path.join(dirpath, name), os.stat(os.path.join(dirpath, name))))
+                    except OSError:
+                        continue
+            total = sum(st.st_size for _, st in objects)
+            freed = 0
+            for path, st in sorted(objects, key=lambda item: item[1].st_mtime):
+                if total - freed <= self.max_bytes:
+                    break
+                try:
+                    os.remove(path)
+                    freed += st.st_size
+                except OSError:
+                    continue
+        if freed:
+            logging.info(f"Evicted {freed / 1024 / 1024:.1f} MB from the capture store")
+        return freed
+
+
+def from_env() -> Optional[CaptureStore]:
+    """CaptureStore configured by $CAPTURE_STORE_DIR (None when unset)"""
+    root = os.environ.get('CAPTURE_STORE_DIR')
+    if not root:
+        return None
+    return CaptureStore(
+        root,
+        max_size_mb=int(os.environ.get('CAPTURE_STORE_MB', DEFAULT_MAX_SIZE_MB)),
+        settle_seconds=float(os.environ.get('CAPTURE_STORE_SETTLE', DEFAULT_SETTLE_SECONDS)),
+    )
@@ -0,0 +1,88 @@
+import re
+from typing import Dict, List, NamedTuple, Union
+
+# Extra resolutions of a capture from the page already loaded.
+#
+# After the main screenshot, each resolution is applied with CDP
+# Emulation.setDeviceMetricsOverride: the viewport (CSS pixels), the device scale
+# factor (so 1920x1080@2 is a 3840x2160 screenshot of the desktop layout and
+# 1920x1080@0.25 a 480x270 thumbnail of it) and, for phones, mobile emulation.
+# The dashboard re-lays itself out in place, with no navigation or login;
+# queries a re-layout starts (Grafana asks for as many points as a panel is
+# wide) are waited for like a variable switch.
+#
+# Each extra screenshot is saved next to the main one with the resolution in its
+# name: ..._20250101T000000_20250101T010000_2560x1440.png, ..._390x844@3x.png
+
+PRESETS = {
+    'qhd': '2560x1440',
+    'fhd': '1920x1080',
+    'hd': '1280x720',
+    'thumbnail': '1920x1080@0.25',
+    'mobile': '390x844@3:mobile',
+    'tablet': '820x1180@2:mobile',
+}
+SPEC = re.compile(r'^(\d+)x(\d+)(?:@(\d+(?:\.\d+)?)x?)?(:mobile)?$')
+# File name suffix of an extra resolution
+SUFFIX = re.compile(r'_\d+x\d+(?:@\d+(?:\.\d+)?x)?(?=\.png$)')
+# Set a flag two animation frames after the override, once the new layout has painted
+RELAYOUT_JS = """
+window.__captureRelayout = false;
+requestAnimationFrame(function () { requestAnimationFrame(function () { window.__captureRelayout = true; }); });
+"""
+
+
+class Resolution(NamedTuple):
+    width: int
+    height: int
+    scale: float = 1
+    mobile: bool = False
+
+    @property
+    def suffix(self) -> str:
+        scale = f"@{self.scale:g}x" if self.scale != 1 else ''
+        return f"_{self.width}x{self.height}{scale}"
+
+    @property
+    def metrics(self) -> Dict:
+        """Emulation.setDeviceMetricsOverride parameters"""
+        return {'width': self.width, 'height': self.height, 'deviceScaleFactor': self.scale, 'mobile': self.mobile}
+
+
+def parse(specs: Union[str, List[str], None]) -> List[Resolution]:
+    """Resolutions from 'WxH[@scale][:mobile]' specs or preset names, comma-separated or a list"""
+    if not specs:
+        return []
+    items = specs.split(',') if isinstance(specs, str) else specs
+    resolutions = []
+    for item in items:
+        spec = PRESETS.get(str(item).strip().lower(), str(item).strip())
+        match = SPEC.match(spec)
+        if not match or not int(match.group(1)) or not int(match.group(2)) or float(match.group(3) or 1) <= 0:
+            raise ValueError(f"Unsupported resolution: {item} (WxH[@scale][:mobile], "
+                             f"or one of {', '.join(PRESETS)})")
+        resolution = Resolution(int(match.group(1)), int(match.group(2)), float(match.group(3) or 1),
+                                bool(match.group(4)))
+        if resolution not in resolutions:
+            resolutions.append(resolution)
+    return resolutions
+
+
+def variant_path(file_path: str, resolution: Resolution) -> str:
+    """Where the screenshot at resolution goes, next to the main one"""
+    base, ext = file_path.rsplit('.', 1)
+    return f"{base}{resolution.suffix}.{ext}"
+
+
+def is_variant(file_path: str) -> bool:
+    """The file is an extra resolution of another capture"""
+    return bool(SUFFIX.search(file_path))
+
+
+def apply(driver, resolution: Resolution):
+    driver.execute_cdp_cmd('Emulation.setDeviceMetricsOverride', resolution.metrics)
+    driver.execute_script(RELAYOUT_JS)
+
+
+def clear(driver):
+    driver.execute_cdp_cmd('Emulation.clearDeviceMetricsOverride', {})
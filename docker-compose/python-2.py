@@ -3,18 +3,22 @@ import os, sys
 import csv
 import logging
 import json
-from datetime import datetime, timedelta
-from selenium import webdriver
+from datetime import datetime
 from selenium.webdriver.common.by import By
-from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
-from selenium.webdriver.chrome.options import Options
 import time
 import re
 
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import browser_profile
+import time_expr
+import timeouts
+
 class DashboardCapture:
     def __init__(self):
         self.driver = None
+        self.profile_name = None
+        self.timeouts = timeouts.policy_for('.')
         self.csv_file = "dashboard_metadata.csv"
         self._init_csv()
         
@@ -36,32 +40,12 @@ class DashboardCapture:
         """
         Parse time range input in format:
         Absolute: %Y%m%d-%H:%M:%S_%Y%m%d-%H:%M:%S
-        Relative: now-[value][unit] (e.g., now-2h)
+        Relative: now-[value][unit] (e.g., now-2h, now-1d/d); see time_expr for the rest
         """
-        if time_range.startswith('now-'):
-            unit_map = {
-                's': 'seconds',
-                'm': 'minutes',
-                'h': 'hours',
-                'd': 'days',
-                'w': 'weeks'
-            }
-            match = re.match(r'now-(\d+)(\w+)', time_range)
-            if match:
-                value, unit = match.groups()
-                delta = timedelta(**{unit_map[unit]: int(value)})
-                end_time = datetime.now()
-                start_time = end_time - delta
-                return start_time, end_time
-            raise ValueError("Invalid relative time format")
-        else:
-            try:
-                start_str, end_str = time_range.split('_')
-                start_time = datetime.strptime(start_str, "%Y%m%d-%H:%M:%S")
-                end_time = datetime.strptime(end_str, "%Y%m%d-%H:%M:%S")
-                return start_time, end_time
-            except ValueError:
-                raise ValueError("Time range must be in format %Y%m%d-%H:%M:%S_%Y%m%d-%H:%M:%S")
+        try:
+            return time_expr.parse_range(time_range)
+        except ValueError:
+            raise ValueError("Time range must be in format %Y%m%d-%H:%M:%S_%Y%m%d-%H:%M:%S or now-[value][unit]")
 
     def _generate_filename(self, platform: str, dashboard: str, datasource: str,
                          start: datetime, end: datetime) -> str:
@@ -86,20 +70,16 @@ class DashboardCapture:
                 url
             ])
 
-    def _setup_driver(self, headless=True):
+    def _setup_driver(self, headless=True, platform='default'):
         """Configure Chrome WebDriver"""
-        chrome_options = Options()
-        if headless:
-            chrome_options.add_argument("--headless=new")
-        chrome_options.add_argument("--no-sandbox")
-        chrome_options.add_argument("--disable-dev-shm-usage")
-        chrome_options.add_argument("--window-size=1920,1080")
-        self.driver = webdriver.Chrome(options=chrome_options)
+        profile = browser_profile.get_profile(self.profile_name, headless=headless, window_size=(1920, 1080))
+        self.driver = profile.create_driver(platform)
 
     def capture_grafana(self, args):
         """Capture Grafana dashboards"""
         try:
-            self._setup_driver(not args.debug)
+            self.timeouts = timeouts.policy_for(args.output_dir)
+            self._setup_driver(not args.debug, 'grafana')
             self._grafana_login(args.url, args.username, args.password)
             
             start_time, end_time = self._parse_time_range(args.time_range)
@@ -108,7 +88,7 @@ class DashboardCapture:
                 try:
                     url = f"{args.url}/d/{dashboard['uid']}?from={start_time.timestamp()*1000}&to={end_time.timestamp()*1000}"
                     self.driver.get(url)
-                    WebDriverWait(self.driver, 30).until(
+                    self.timeouts.wait(self.driver, 'grafana', dashboard['name'], 30,
                         EC.visibility_of_element_located((By.CLASS_NAME, "panel-container")))
                     
                     filename = self._generate_filename(
@@ -133,7 +113,8 @@ class DashboardCapture:
     def capture_dynatrace(self, args):
         """Capture Dynatrace dashboards"""
         try:
-            self._setup_driver(not args.debug)
+            self.timeouts = timeouts.policy_for(args.output_dir)
+            self._setup_driver(not args.debug, 'dynatrace')
             self._dynatrace_login(args.url, args.token)
             
             start_time, end_time = self._parse_time_range(args.time_range)
@@ -144,7 +125,7 @@ class DashboardCapture:
                 try:
                     url = f"{args.url}/#dashboard;gtf=c_{start_ts}_{end_ts};id={dashboard['id']}"
                     self.driver.get(url)
-                    WebDriverWait(self.driver, 45).until(
+                    self.timeouts.wait(self.driver, 'dynatrace', dashboard['name'], 45,
                         EC.visibility_of_element_located((By.CSS_SELECTOR, "div.dashboard"))
                     )
                     time.sleep(5)  # Dynatrace needs extra render time
@@ -171,7 +152,8 @@ class DashboardCapture:
     def capture_splunk(self, args):
         """Capture Splunk dashboards"""
         try:
-            self._setup_driver(not args.debug)
+            self.timeouts = timeouts.policy_for(args.output_dir)
+            self._setup_driver(not args.debug, 'splunk')
             self._splunk_login(args.url, args.username, args.password)
             
             start_time, end_time = self._parse_time_range(args.time_range)
@@ -180,7 +162,7 @@ class DashboardCapture:
                 try:
                     url = f"{args.url}/app/{args.app}/?earliest={start_time.timestamp()}&latest={end_time.timestamp()}"
                     self.driver.get(url)
-                    WebDriverWait(self.driver, 30).until(
+                    self.timeouts.wait(self.driver, 'splunk', dashboard['name'], 30,
                         EC.visibility_of_element_located((By.CSS_SELECTOR, "div.dashboard-view")))
                     
                     filename = self._generate_filename(
@@ -206,7 +188,7 @@ class DashboardCapture:
         login_url = f"{url.split('/d/')[0]}/login"
         self.driver.get(login_url)
         try: 
-            WebDriverWait(self.driver, 15).until(
+            self.timeouts.wait(self.driver, 'grafana', 'login', 15,
                 EC.presence_of_element_located((By.NAME, "user"))
             )
             self.driver.find_element(By.NAME, "user").send_keys(username)
@@ -223,7 +205,7 @@ class DashboardCapture:
         """Login to Dynatrace using API token"""
         login_url = f"{url}/#login;token={token}"
         self.driver.get(login_url)
-        WebDriverWait(self.driver, 30).until(
+        self.timeouts.wait(self.driver, 'dynatrace', 'login', 30,
             EC.presence_of_element_located((By.CSS_SELECTOR, ".dashboard")))
 
     def _splunk_login(self, url: str, username: str, password: str):
@@ -231,13 +213,13 @@ class DashboardCapture:
         login_url = f"{url}/account/login?return_to=/en-US/"
         self.driver.get(login_url)
         
-        WebDriverWait(self.driver, 15).until(
+        self.timeouts.wait(self.driver, 'splunk', 'login', 15,
             EC.presence_of_element_located((By.ID, "username")))
         self.driver.find_element(By.ID, "username").send_keys(username)
         self.driver.find_element(By.ID, "password").send_keys(password)
         self.driver.find_element(By.ID, "loginButton").click()
         
-        WebDriverWait(self.driver, 15).until(
+        self.timeouts.wait(self.driver, 'splunk', 'login:done', 15,
             EC.presence_of_element_located((By.CSS_SELECTOR, ".dashboard")))
 
 def main():
@@ -254,6 +236,8 @@ def main():
                              help="Output directory")
     parent_parser.add_argument("--debug", action="store_true",
                              help="Enable browser GUI for debugging")
+    parent_parser.add_argument("--browser-profile", choices=list(browser_profile.PROFILES),
+                             help="Chrome profile (default: $CAPTURE_BROWSER_PROFILE or 'screenshot')")
 
     # Platform subparsers
     subparsers = parser.add_subparsers(dest="platform", required=True)
@@ -278,6 +262,7 @@ def main():
     splunk_parser.add_argument("--password", required=True, help="Splunk password")
 
     args = parser.parse_args()
+    capture.profile_name = args.browser_profile
 
     try:
         os.makedirs(args.output_dir, exist_ok=True)
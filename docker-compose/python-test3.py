@@ -4,18 +4,28 @@ import os
 import sys
 import csv
 import time
-from datetime import datetime, timedelta
-from selenium import webdriver
+from datetime import datetime
 from selenium.webdriver.common.by import By
-from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
-from selenium.webdriver.chrome.options import Options
 from urllib.parse import urlparse
 from typing import Tuple, List
 
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import browser_profile
+import browser_watchdog
+import dynatrace_api
+import dynatrace_export
+import splunk_api
+import splunk_export
+import time_expr
+import timeouts
+
 class MonitoringCapture:
     def __init__(self):
         self.driver = None
+        self.profile_name = None
+        self.timeouts = timeouts.policy_for('.')
+        self.watchdog = None
         self.csv_file = "dashboard_links.csv"
         self._init_csv()
 
@@ -57,60 +67,55 @@ class MonitoringCapture:
 
     def _parse_time_range(self, time_range: str) -> Tuple[datetime, datetime]:
         """Parse time range string into start/end datetimes"""
-        now = datetime.now()
-        
-        if time_range.startswith("now-"):
-            parts = time_range.split()
-            duration = parts[0][4:]  # Remove "now-"
-            
-            # Parse duration (e.g., "2h" -> 2 hours)
-            unit = duration[-1]
-            value = int(duration[:-1])
-            
-            time_units = {
-                's': 'seconds',
-                'm': 'minutes',
-                'h': 'hours',
-                'd': 'days',
-                'w': 'weeks'
-            }
-            
-            delta = timedelta(**{time_units[unit]: value})
-            start_time = now - delta
-            end_time = now if len(parts) == 1 else now  # Default to now
-            
-            return start_time, end_time
+        return time_expr.parse_range(time_range)
 
-        # Handle absolute time ranges
-        if " to " in time_range:
-            start_str, end_str = time_range.split(" to ")
-            start_time = datetime.strptime(start_str, "%Y-%m-%dT%H:%M:%S")
-            end_time = datetime.strptime(end_str, "%Y-%m-%dT%H:%M:%S")
-            return (
-                int(start_time.timestamp() * 1000),
-                int(end_time.timestamp() * 1000)
-            )
-        
-        raise ValueError(f"Unsupported time range format: {time_range}")
-
-    def _setup_driver(self, headless=True):
+    def _setup_driver(self, headless=True, platform='default'):
         """Configure Selenium WebDriver"""
-        chrome_options = Options()
-        if headless:
-            chrome_options.add_argument("--headless=new")
-        chrome_options.add_argument("--no-sandbox")
-        chrome_options.add_argument("--disable-dev-shm-usage")
-        chrome_options.add_argument("--window-size=1920,1080")
-        self.driver = webdriver.Chrome(options=chrome_options)
+        profile = browser_profile.get_profile(self.profile_name, headless=headless, window_size=(1920, 1080))
+        self.driver = profile.create_driver(platform)
+        self.watchdog = browser_watchdog.from_env(self.driver)
+
+    def _quit_driver(self):
+        watchdog, self.watchdog = self.watchdog, None
+        if watchdog:
+            watchdog.stop()
+        try:
+            if self.driver:
+                self.driver.quit()
+        except Exception as e:
+            logging.debug(f"Quit failed: {str(e)}")
+        finally:
+            self.driver = None
+
+    def _watch(self, dashboard: str):
+        if self.watchdog:
+            self.watchdog.begin(dashboard)
+
+    def _recover(self, args, platform: str, dashboard: str, pending: List[str], retried: set, login):
+        """After a crash or watchdog kill: new browser, log in again, queue the dashboard once more"""
+        if not self.watchdog or not self.watchdog.diagnose():
+            return
+        self._quit_driver()
+        self._setup_driver(not args.debug, platform)
+        login()
+        if dashboard not in retried:
+            retried.add(dashboard)
+            pending.append(dashboard)
+            logging.info(f"Re-queued {dashboard} on a fresh browser")
 
     def capture_grafana(self, args):
         """Capture Grafana dashboards with Selenium"""
         try:
-            self._setup_driver(not args.debug)
+            self.timeouts = timeouts.policy_for(args.output_dir)
+            self._setup_driver(not args.debug, 'grafana')
             self._grafana_login(args.url, args.username, args.password)
             
-            for dashboard in args.dashboards:
+            pending, retried = list(args.dashboards), set()
+            while pending:
+                dashboard = pending.pop(0)
                 try:
+                    self._watch(dashboard)
+                    self.timeouts.check('grafana', dashboard)
                     # Construct URL with time range
                     start, end = self._parse_time_range(args.time_range)
                     start_ms = int(start.timestamp() * 1000)
@@ -130,11 +135,14 @@ class MonitoringCapture:
                     
                     # Capture screenshot
                     self.driver.get(dashboard_url)
-                    WebDriverWait(self.driver, 30).until(
+                    self.timeouts.wait(self.driver, 'grafana', dashboard, 30,
                         EC.visibility_of_element_located((By.CLASS_NAME, "panel-container"))
                     )
                     time.sleep(2)  # Allow for rendering
                     self.driver.save_screenshot(output_path)
+                    self.driver.collect_network_stats()
+                    if self.watchdog:
+                        self.watchdog.end()
                     
                     # Record metadata
                     self._append_to_csv({
@@ -149,20 +157,58 @@ class MonitoringCapture:
                     
                 except Exception as e:
                     logging.error(f"Failed to capture {dashboard}: {str(e)}")
+                    self._recover(args, 'grafana', dashboard, pending, retried,
+                                  lambda: self._grafana_login(args.url, args.username, args.password))
                     continue
 
         finally:
-            if self.driver:
-                self.driver.quit()
+            self._quit_driver()
+
+    def export_dynatrace(self, args):
+        """Export Dynatrace dashboards' tile data through the config and metrics v2 APIs instead of screenshots"""
+        api = dynatrace_api.DynatraceAPI(args.url, args.token)
+        start, end = self._parse_time_range(args.time_range)
+        failed = []
+        for dashboard in args.dashboards:
+            job = {
+                'platform': 'dynatrace',
+                'url': args.url,
+                'dashboard_id': dashboard,
+                'management_zone': args.management_zone,
+                'output_dir': args.output_dir,
+                'export': args.export,
+                'chart_image': args.chart_image,
+            }
+            try:
+                _, path = dynatrace_export.export_job(job, start, end, api)
+                self._append_to_csv({
+                    'platform': 'dynatrace',
+                    'dashboard_name': dashboard,
+                    'datasource': "dynatrace",
+                    'time_range': args.time_range,
+                    'url': path
+                })
+            except Exception as e:
+                logging.error(f"Failed to export {dashboard}: {str(e)}")
+                failed.append(dashboard)
+        if failed:
+            raise RuntimeError(f"Export failed for {', '.join(failed)}")
 
     def capture_dynatrace(self, args):
         """Capture Dynatrace dashboards as screenshots"""
+        if args.export:
+            return self.export_dynatrace(args)
         try:
-            self._setup_driver(not args.debug)
+            self.timeouts = timeouts.policy_for(args.output_dir)
+            self._setup_driver(not args.debug, 'dynatrace')
             self._dynatrace_login(args.url, args.token)
             
-            for dashboard in args.dashboards:
+            pending, retried = list(args.dashboards), set()
+            while pending:
+                dashboard = pending.pop(0)
                 try:
+                    self._watch(dashboard)
+                    self.timeouts.check('dynatrace', dashboard)
                     # Construct Dynatrace URL
                     dashboard_url = (
                         f"{args.url}/#dashboard;id={dashboard};"
@@ -177,11 +223,14 @@ class MonitoringCapture:
                     
                     # Capture screenshot
                     self.driver.get(dashboard_url)
-                    WebDriverWait(self.driver, 45).until(
+                    self.timeouts.wait(self.driver, 'dynatrace', dashboard, 45,
                         EC.visibility_of_element_located((By.CSS_SELECTOR, ".dashboard"))
                     )
                     time.sleep(5)  # Dynatrace needs more time to render
                     self.driver.save_screenshot(output_path)
+                    self.driver.collect_network_stats()
+                    if self.watchdog:
+                        self.watchdog.end()
                     
                     # Record metadata
                     self._append_to_csv({
@@ -196,25 +245,68 @@ class MonitoringCapture:
                     
                 except Exception as e:
                     logging.error(f"Failed to capture {dashboard}: {str(e)}")
+                    self._recover(args, 'dynatrace', dashboard, pending, retried,
+                                  lambda: self._dynatrace_login(args.url, args.token))
                     continue
 
         finally:
-            if self.driver:
-                self.driver.quit()
+            self._quit_driver()
+
+    def _splunk_window(self, time_range: str) -> Tuple[str, str]:
+        """earliest/latest as epoch seconds, or as given when they are Splunk's own syntax ('-7d@d now')"""
+        try:
+            return splunk_api.time_bounds(*self._parse_time_range(time_range))
+        except ValueError:
+            parts = time_range.split()
+            return parts[0], parts[1] if len(parts) > 1 else 'now'
+
+    def export_splunk(self, args):
+        """Export Splunk dashboard searches through the REST API instead of screenshots"""
+        api = splunk_api.SplunkAPI(splunk_api.rest_url(args.url), args.username, args.password, app=args.app)
+        earliest, latest = self._splunk_window(args.time_range)
+        start, end = self._parse_time_range(args.time_range)
+        labels = (start.strftime("%Y%m%d-%H%M%S"), end.strftime("%Y%m%d-%H%M%S"))
+        failed = []
+        for dashboard in args.dashboards:
+            try:
+                paths = splunk_export.export_dashboard(api, dashboard, earliest, latest, args.output_dir,
+                                                       args.export, args.table_image, labels)
+                for path in paths:
+                    self._append_to_csv({
+                        'platform': 'splunk',
+                        'dashboard_name': dashboard,
+                        'datasource': "splunk",
+                        'time_range': args.time_range,
+                        'url': path
+                    })
+                logging.info(f"Exported {len(paths)} Splunk searches of {dashboard}")
+            except Exception as e:
+                logging.error(f"Failed to export {dashboard}: {str(e)}")
+                failed.append(dashboard)
+        if failed:
+            raise RuntimeError(f"Export failed for {', '.join(failed)}")
 
     def capture_splunk(self, args):
         """Capture Splunk dashboards as screenshots"""
+        if args.export:
+            return self.export_splunk(args)
         try:
-            self._setup_driver(not args.debug)
+            self.timeouts = timeouts.policy_for(args.output_dir)
+            self._setup_driver(not args.debug, 'splunk')
             self._splunk_login(args.url, args.username, args.password)
             
-            for dashboard in args.dashboards:
+            pending, retried = list(args.dashboards), set()
+            while pending:
+                dashboard = pending.pop(0)
                 try:
+                    self._watch(dashboard)
+                    self.timeouts.check('splunk', dashboard)
                     # Construct Splunk URL
+                    earliest, latest = self._splunk_window(args.time_range)
                     dashboard_url = (
                         f"{args.url}/app/{args.app}/"
-                        f"?earliest={args.time_range.split()[0]}"
-                        f"&latest={args.time_range.split()[1]}" 
+                        f"?earliest={earliest}"
+                        f"&latest={latest}" 
                         f"&q=search%20{dashboard}"
                     )
                     
@@ -226,11 +318,14 @@ class MonitoringCapture:
                     
                     # Capture screenshot
                     self.driver.get(dashboard_url)
-                    WebDriverWait(self.driver, 30).until(
+                    self.timeouts.wait(self.driver, 'splunk', dashboard, 30,
                         EC.visibility_of_element_located((By.CSS_SELECTOR, ".dashboard"))
                     )
                     time.sleep(3)  # Allow for rendering
                     self.driver.save_screenshot(output_path)
+                    self.driver.collect_network_stats()
+                    if self.watchdog:
+                        self.watchdog.end()
                     
                     # Record metadata
                     self._append_to_csv({
@@ -245,18 +340,19 @@ class MonitoringCapture:
                     
                 except Exception as e:
                     logging.error(f"Failed to capture {dashboard}: {str(e)}")
+                    self._recover(args, 'splunk', dashboard, pending, retried,
+                                  lambda: self._splunk_login(args.url, args.username, args.password))
                     continue
 
         finally:
-            if self.driver:
-                self.driver.quit()
+            self._quit_driver()
 
     def _grafana_login(self, url: str, username: str, password: str):
         """Login to Grafana"""
         login_url = f"{url.split('/d/')[0]}/login"
         self.driver.get(login_url)
         try: 
-            WebDriverWait(self.driver, 15).until(
+            self.timeouts.wait(self.driver, 'grafana', 'login', 15,
                 EC.presence_of_element_located((By.NAME, "user"))
             )
             self.driver.find_element(By.NAME, "user").send_keys(username)
@@ -273,7 +369,7 @@ class MonitoringCapture:
         """Login to Dynatrace using API token"""
         login_url = f"{url}/#login;token={token}"
         self.driver.get(login_url)
-        WebDriverWait(self.driver, 30).until(
+        self.timeouts.wait(self.driver, 'dynatrace', 'login', 30,
             EC.presence_of_element_located((By.CSS_SELECTOR, ".dashboard")))
 
     def _splunk_login(self, url: str, username: str, password: str):
@@ -281,13 +377,13 @@ class MonitoringCapture:
         login_url = f"{url}/account/login?return_to=/en-US/"
         self.driver.get(login_url)
         
-        WebDriverWait(self.driver, 15).until(
+        self.timeouts.wait(self.driver, 'splunk', 'login', 15,
             EC.presence_of_element_located((By.ID, "username")))
         self.driver.find_element(By.ID, "username").send_keys(username)
         self.driver.find_element(By.ID, "password").send_keys(password)
         self.driver.find_element(By.ID, "loginButton").click()
         
-        WebDriverWait(self.driver, 15).until(
+        self.timeouts.wait(self.driver, 'splunk', 'login:done', 15,
             EC.presence_of_element_located((By.CSS_SELECTOR, ".dashboard")))
 
 def main():
@@ -304,6 +400,8 @@ def main():
                              help="Output directory")
     parent_parser.add_argument("--debug", action="store_true",
                              help="Enable browser GUI for debugging")
+    parent_parser.add_argument("--browser-profile", choices=list(browser_profile.PROFILES),
+                             help="Chrome profile (default: $CAPTURE_BROWSER_PROFILE or 'screenshot')")
 
     # Platform subparsers
     subparsers = parser.add_subparsers(dest="platform", required=True)
@@ -321,6 +419,12 @@ def main():
                          help="Dynatrace environment URL")
     dt_parser.add_argument("-k", "--token", required=True,
                          help="Dynatrace API token")
+    dt_parser.add_argument("-m", "--management-zone",
+                         help="Management zone id or name applied to the exported tiles")
+    dt_parser.add_argument("--export", choices=dynatrace_export.EXPORT_FORMATS,
+                         help="Write each dashboard's tile data (metrics v2 API) instead of screenshots")
+    dt_parser.add_argument("--chart-image", action="store_true",
+                         help="With --export, also draw each chart tile as a PNG")
 
     # Splunk
     splunk_parser = subparsers.add_parser("splunk", parents=[parent_parser])
@@ -328,8 +432,13 @@ def main():
     splunk_parser.add_argument("-a", "--app", required=True, help="Splunk app name")
     splunk_parser.add_argument("--username", required=True, help="Splunk username")
     splunk_parser.add_argument("--password", required=True, help="Splunk password")
+    splunk_parser.add_argument("--export", choices=splunk_export.EXPORT_FORMATS,
+                             help="Write each dashboard search's results (REST export endpoint) instead of screenshots")
+    splunk_parser.add_argument("--table-image", action="store_true",
+                             help="With --export, also draw each search's first rows as a PNG table")
 
     args = parser.parse_args()
+    capture.profile_name = args.browser_profile
 
     try:
         # Create output directory
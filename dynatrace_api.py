@@ -0,0 +1,80 @@
+import re
+import logging
+from typing import Dict, List, Optional
+
+import requests
+
+# Dynatrace API client: dashboards through the config v1 API, tile data through
+# metrics v2. Authenticates with an API token the way get-management-zones does
+# (Authorization: Api-Token ...); the token needs the ReadConfig and
+# metrics.read scopes.
+#
+# The job URL is the environment URL, https://HOST/e/ENVIRONMENT for Managed or
+# https://ENVIRONMENT.live.dynatrace.com for SaaS; the APIs live under it.
+
+# Management zone ids are (possibly negative) 64-bit numbers, anything else is a name
+ZONE_ID = re.compile(r'^-?\d+$')
+
+
+def zone_selector(zone: str) -> str:
+    """mzSelector for a management zone given by id or by name"""
+    zone = str(zone).strip()
+    if ZONE_ID.match(zone):
+        return f"mzId({zone})"
+    return 'mzName("{}")'.format(zone.replace('\\', '\\\\').replace('"', '\\"'))
+
+
+class DynatraceAPI:
+    """Pooled session against one Dynatrace environment, API token auth"""
+    def __init__(self, base_url: str, token: str, timeout: float = 30):
+        # UI links (…/#dashboard;id=…, …/ui/dashboards/…) point into the same environment
+        self.base_url = base_url.split('#')[0].split('/ui/')[0].rstrip('/')
+        self.timeout = timeout
+        self.session = requests.Session()
+        self.session.headers['Authorization'] = f"Api-Token {token}"
+
+    @classmethod
+    def for_job(cls, job: Dict) -> 'DynatraceAPI':
+        if not job.get('token'):
+            raise ValueError("Dynatrace API access requires an API token (--token)")
+        return cls(job['url'], job['token'])
+
+    def get(self, path: str, **params):
+        response = self.session.get(f"{self.base_url}{path}", params=params or None, timeout=self.timeout)
+        response.raise_for_status()
+        return response.json()
+
+    def dashboard(self, dashboard_id: str) -> Dict:
+        return self.get(f"/api/config/v1/dashboards/{dashboard_id}")
+
+    def metrics_query(self, selector: str, start_ms: int, end_ms: int, resolution: str = None,
+                      mz_selector: str = None) -> List[Dict]:
+        """Run a metric selector over the window; one {'metricId', 'data': [...]} per metric,
+        data series of every page merged"""
+        params = {'metricSelector': selector, 'from': start_ms, 'to': end_ms}
+        if resolution:
+            params['resolution'] = resolution
+        if mz_selector:
+            params['mzSelector'] = mz_selector
+        results: Dict[str, Dict] = {}
+        while True:
+            page = self.get("/api/v2/metrics/query", **params)
+            for result in page.get('result', []):
+                merged = results.setdefault(result['metricId'], {'metricId': result['metricId'], 'data': []})
+                merged['data'].extend(result.get('data', []))
+                for warning in result.get('warnings', []):
+                    logging.warning(f"{result['metricId']}: {warning}")
+            if not page.get('nextPageKey'):
+                break
+            # Follow-up pages take nothing but the page key
+            params = {'nextPageKey': page['nextPageKey']}
+        return list(results.values())
+
+    @staticmethod
+    def tiles(dashboard: Dict) -> List[Dict]:
+        return dashboard.get('tiles', [])
+
+    @staticmethod
+    def dashboard_zone(dashboard: Dict) -> Optional[Dict]:
+        """The management zone the dashboard is filtered by, if any"""
+        return ((dashboard.get('dashboardMetadata') or {}).get('dashboardFilter') or {}).get('managementZone')
@@ -0,0 +1,197 @@
+import os
+import re
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import panel_export
+from dynatrace_api import DynatraceAPI, zone_selector
+
+# Chart images are optional
+try:
+    from PIL import Image, ImageDraw, ImageFont
+except ImportError:
+    Image = None
+
+# Dynatrace dashboards as data: the dashboard definition comes from the config
+# API, each chart tile's metric selectors run through /api/v2/metrics/query
+# concurrently, and the series are written in the same long format as Grafana
+# panel exports (time, ref_id, series, value), ref_id being the tile name.
+#
+# Management zone: a tile's own filter wins, then the job's management_zone,
+# then the dashboard's filter, as in the UI. Tiles other than Data Explorer and
+# custom charts (markdown, headers, problem lists...) have no metrics to export.
+
+EXPORT_FORMATS = panel_export.EXPORT_FORMATS
+DEFAULT_WORKERS = 8
+# resolution=Inf&(selector):limit(100):names
+EXPRESSION_PARAMS = re.compile(r'^((?:\w+=[^&()]*&)*)(.*)$', re.S)
+CHART_SIZE = (960, 400)
+CHART_MARGIN = 48
+CHART_LEGEND_SERIES = 8
+CHART_COLORS = ['#1496ff', '#ff8b00', '#2ab06f', '#dc172a', '#9355b7', '#f5d30f', '#00a1b2', '#7c38a1']
+
+
+def _zone(filter_zone: Optional[Dict]) -> Optional[str]:
+    if not filter_zone:
+        return None
+    return str(filter_zone['id']) if filter_zone.get('id') not in (None, '') else filter_zone.get('name')
+
+
+def _aggregation(series: Dict) -> str:
+    aggregation = (series.get('aggregation') or series.get('spaceAggregation') or '').lower()
+    if aggregation.startswith('percentile'):
+        return f":percentile({series.get('percentile') or aggregation.split('_')[-1]})"
+    return f":{aggregation}" if aggregation in ('avg', 'sum', 'min', 'max', 'count', 'median', 'value') else ''
+
+
+def _selector(metric: str, dimensions: List[str], series: Dict) -> str:
+    split = ','.join(f'"{d}"' for d in dimensions)
+    return f"{metric}{f':splitBy({split})' if split else ''}{_aggregation(series)}"
+
+
+def tile_selectors(tile: Dict) -> List[Tuple[str, Optional[str]]]:
+    """(metric selector, resolution) for each metric a chart tile shows"""
+    if tile.get('tileType') == 'DATA_EXPLORER':
+        if tile.get('metricExpressions'):
+            selectors = []
+            for expression in tile['metricExpressions']:
+                params, selector = EXPRESSION_PARAMS.match(expression).groups()
+                params = dict(p.split('=', 1) for p in params.split('&') if p)
+                if selector.strip():
+                    resolution = params.get('resolution')
+                    selectors.append((selector.strip(), None if resolution in (None, '', 'null') else resolution))
+            return selectors
+        return [(_selector(q['metric'], q.get('splitBy') or [], q), None)
+                for q in tile.get('queries', []) if q.get('metric') and q.get('enabled', True)]
+    if tile.get('tileType') == 'CUSTOM_CHARTING':
+        chart = ((tile.get('filterConfig') or {}).get('chartConfig') or {})
+        return [(_selector(s['metric'], [d['name'] for d in s.get('dimensions', []) if d.get('name')], s), None)
+                for s in chart.get('series', []) if s.get('metric')]
+    return []
+
+
+def tile_queries(dashboard: Dict, job: Dict) -> List[Dict]:
+    """Metric queries of the dashboard's chart tiles, management zone applied:
+    [{'tile', 'name', 'selector', 'resolution', 'mz_selector'}]"""
+    dashboard_zone = job.get('management_zone') or _zone(DynatraceAPI.dashboard_zone(dashboard))
+    queries = []
+    for n, tile in enumerate(DynatraceAPI.tiles(dashboard)):
+        zone = _zone((tile.get('tileFilter') or {}).get('managementZone')) or dashboard_zone
+        for selector, resolution in tile_selectors(tile):
+            queries.append({
+                'tile': n,
+                'name': tile.get('name') or f"tile-{n}",
+                'selector': selector,
+                'resolution': resolution,
+                'mz_selector': zone_selector(zone) if zone else None,
+            })
+    return queries
+
+
+def series(results: List[Dict]) -> Iterator[Tuple[str, List[int], List]]:
+    """(series name, timestamps, values) per returned data series"""
+    for result in results:
+        for data in result.get('data', []):
+            dimensions = data.get('dimensionMap') or {}
+            name = result['metricId'] + ('{' + ', '.join(f'{k}="{v}"' for k, v in sorted(dimensions.items())) + '}'
+                                         if dimensions else '')
+            yield name, data.get('timestamps', []), data.get('values', [])
+
+
+def rows(tile_name: str, results: List[Dict]) -> Iterator[Tuple[datetime, str, str, object]]:
+    """(time, ref_id, series, value) rows, ref_id being the tile name"""
+    for name, timestamps, values in series(results):
+        for at, value in zip(timestamps, values):
+            yield datetime.fromtimestamp(at / 1000, timezone.utc), tile_name, name, value
+
+
+def render_chart(title: str, results: List[Dict], file_path: str):
+    """Line chart of a tile's series (needs Pillow)"""
+    if Image is None:
+        raise ValueError("Chart images need Pillow (pip install pillow)")
+    width, height = CHART_SIZE
+    lines = [(name, [(at, v) for at, v in zip(timestamps, values) if v is not None])
+             for name, timestamps, values in series(results)]
+    points = [p for _, line in lines for p in line]
+    font = ImageFont.load_default()
+    image = Image.new('RGB', CHART_SIZE, 'white')
+    draw = ImageDraw.Draw(image)
+    draw.text((CHART_MARGIN, 12), title, fill='black', font=font)
+    left, top, right, bottom = CHART_MARGIN, CHART_MARGIN, width - 16, height - CHART_MARGIN
+    draw.rectangle([left, top, right, bottom], outline='#d0d0d0')
+    if points:
+        t0, t1 = min(p[0] for p in points), max(p[0] for p in points)
+        v0, v1 = min(min(p[1] for p in points), 0), max(p[1] for p in points)
+        x = lambda at: left + (right - left) * (at - t0) / ((t1 - t0) or 1)
+        y = lambda v: bottom - (bottom - top) * (v - v0) / ((v1 - v0) or 1)
+        draw.text((4, top), f"{v1:g}", fill='#666666', font=font)
+        draw.text((4, bottom - 10), f"{v0:g}", fill='#666666', font=font)
+        draw.text((left, bottom + 4), datetime.fromtimestamp(t0 / 1000).strftime('%Y-%m-%d %H:%M'),
+                  fill='#666666', font=font)
+        draw.text((right - 100, bottom + 4), datetime.fromtimestamp(t1 / 1000).strftime('%Y-%m-%d %H:%M'),
+                  fill='#666666', font=font)
+        for n, (name, line) in enumerate(lines):
+            color = CHART_COLORS[n % len(CHART_COLORS)]
+            if len(line) > 1:
+                draw.line([(x(at), y(v)) for at, v in line], fill=color, width=2)
+            elif line:
+                draw.ellipse([x(line[0][0]) - 2, y(line[0][1]) - 2, x(line[0][0]) + 2, y(line[0][1]) + 2], fill=color)
+            if n < CHART_LEGEND_SERIES:
+                draw.text((left + 8, top + 6 + n * 12), name[:120], fill=color, font=font)
+    else:
+        draw.text((left + 8, top + 6), "No data", fill='#666666', font=font)
+    image.save(file_path)
+
+
+def export_filename(job: Dict, dashboard: Dict, start_date: datetime, end_date: datetime, fmt: str) -> str:
+    """Named like the dashboard's screenshot, plus the job's management zone"""
+    name = (dashboard.get('dashboardMetadata') or {}).get('name') or job['dashboard_id']
+    safe_name = name.replace(' ', '_').replace('/', '-')
+    zone = re.sub(r'[^\w.-]', '_', f"_mz-{job['management_zone']}") if job.get('management_zone') else ''
+    return (f"{safe_name}_{job['dashboard_id']}{zone}_"
+            f"{start_date.strftime('%Y%m%dT%H%M%S')}_{end_date.strftime('%Y%m%dT%H%M%S')}.{fmt}")
+
+
+def export_job(job: Dict, start_date: datetime, end_date: datetime, api: DynatraceAPI = None,
+               workers: int = DEFAULT_WORKERS) -> Tuple[Dict, str]:
+    """Export every chart tile of a Dynatrace dashboard to one file; returns the dashboard and file path"""
+    fmt = job.get('export') or 'csv'
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"Unknown export format: {fmt} (choose from {', '.join(EXPORT_FORMATS)})")
+    if fmt == 'parquet' and panel_export.pa is None:
+        raise ValueError("Parquet export needs pyarrow (pip install pyarrow)")
+    api = api or DynatraceAPI.for_job(job)
+    dashboard = api.dashboard(job['dashboard_id'])
+    queries = tile_queries(dashboard, job)
+    if not queries:
+        raise ValueError(f"Dashboard {job['dashboard_id']} has no chart tiles to export")
+    start_ms, end_ms = int(start_date.timestamp() * 1000), int(end_date.timestamp() * 1000)
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='dynatrace-query') as pool:
+        futures = [pool.submit(api.metrics_query, q['selector'], start_ms, end_ms, q['resolution'], q['mz_selector'])
+                   for q in queries]
+    results, failed = [], 0
+    for query, future in zip(queries, futures):
+        error = future.exception()
+        if error:
+            # One broken selector shouldn't lose the rest of the dashboard
+            logging.warning(f"Tile {query['name']}: {query['selector']} failed: {str(error)}")
+            failed += 1
+        results.append([] if error else future.result())
+    if failed == len(queries):
+        raise RuntimeError(f"Every metric query of dashboard {job['dashboard_id']} failed")
+
+    output_dir = os.path.join(job['output_dir'], 'dynatrace')
+    os.makedirs(output_dir, exist_ok=True)
+    file_path = os.path.join(output_dir, export_filename(job, dashboard, start_date, end_date, fmt))
+    count = panel_export.write_rows((row for query, result in zip(queries, results)
+                                     for row in rows(query['name'], result)), file_path, fmt)
+    if job.get('chart_image'):
+        tiles: Dict[int, Tuple[str, List[Dict]]] = {}
+        for query, result in zip(queries, results):
+            tiles.setdefault(query['tile'], (query['name'], []))[1].extend(result)
+        for n, (name, tile_results) in tiles.items():
+            render_chart(name, tile_results, f"{os.path.splitext(file_path)[0]}_tile-{n}.png")
+    logging.info(f"Exported {count} values of {len(queries)} metric queries to {file_path}")
+    return dashboard, file_path
@@ -0,0 +1,157 @@
+import os
+import re
+import itertools
+import logging
+from typing import Dict, List, Optional
+
+import requests
+from requests.auth import HTTPBasicAuth
+
+# Grafana HTTP API client shared by the capture modes that don't need a browser
+# for everything: template variable listing (matrix captures), panel listing
+# (solo captures), panel queries (data export).
+
+# label_values(label) / label_values(metric, label)
+LABEL_VALUES = re.compile(r'^\s*label_values\(\s*(?:(?P<metric>[^,()]+(?:\{[^}]*\})?)\s*,\s*)?(?P<label>\w+)\s*\)\s*$')
+
+
+class GrafanaAPI:
+    """Pooled session against one Grafana, basic auth or API token"""
+    def __init__(self, base_url: str, username: str = None, password: str = None, token: str = None,
+                 timeout: float = 30):
+        self.base_url = base_url.split('/d/')[0].rstrip('/')
+        self.timeout = timeout
+        self.session = requests.Session()
+        if token:
+            self.session.headers['Authorization'] = f"Bearer {token}"
+        elif username:
+            self.session.auth = HTTPBasicAuth(username, password)
+
+    @classmethod
+    def for_job(cls, job: Dict) -> 'GrafanaAPI':
+        return cls(job['url'], job.get('username'), job.get('password'), job.get('token'))
+
+    def get(self, path: str, **params):
+        response = self.session.get(f"{self.base_url}{path}", params=params or None, timeout=self.timeout)
+        response.raise_for_status()
+        return response.json()
+
+    def post(self, path: str, payload: Dict):
+        response = self.session.post(f"{self.base_url}{path}", json=payload, timeout=self.timeout)
+        response.raise_for_status()
+        return response.json()
+
+    def query(self, queries: List[Dict], start_ms: int, end_ms: int) -> Dict:
+        """Run panel targets through the datasource query API; results by refId"""
+        return self.post("/api/ds/query", {'queries': queries, 'from': str(start_ms), 'to': str(end_ms)}
+                         ).get('results', {})
+
+    def dashboard(self, uid: str) -> Dict:
+        return self.get(f"/api/dashboards/uid/{uid}")['dashboard']
+
+    def datasources(self) -> List[Dict]:
+        return self.get("/api/datasources")
+
+    @staticmethod
+    def panels(dashboard: Dict) -> List[Dict]:
+        """Every panel, including those nested in collapsed rows (rows themselves excluded)"""
+        panels = []
+        for panel in dashboard.get('panels', []):
+            panels.extend(p for p in [panel] + panel.get('panels', []) if p.get('type') != 'row')
+        return panels
+
+    def variables(self, dashboard: Dict) -> Dict[str, Dict]:
+        """Template variables of a dashboard JSON, by name"""
+        return {v['name']: v for v in dashboard.get('templating', {}).get('list', [])}
+
+    def variable_values(self, variable: Dict) -> List[str]:
+        """Every value a template variable can take"""
+        kind = variable.get('type')
+        if kind == 'datasource':
+            pattern = re.compile(variable.get('regex') or '.*')
+            return [ds['name'] for ds in self.datasources()
+                    if ds.get('type') == variable.get('query') and pattern.search(ds['name'])]
+        if kind == 'query':
+            values = self._query_values(variable)
+            if values is not None:
+                return values
+        if kind in ('custom', 'interval') and not variable.get('options'):
+            return [v.strip() for v in str(variable.get('query', '')).split(',') if v.strip()]
+        values = [str(o['value']) for o in variable.get('options', []) if o.get('value') not in (None, '$__all')]
+        if not values and variable.get('current', {}).get('value'):
+            current = variable['current']['value']
+            values = [str(v) for v in (current if isinstance(current, list) else [current])]
+        return values
+
+    def _query_values(self, variable: Dict) -> Optional[List[str]]:
+        """Prometheus label_values() through the datasource proxy; None if not resolvable here"""
+        query = variable.get('query')
+        if isinstance(query, dict):
+            query = query.get('query')
+        match = LABEL_VALUES.match(query or '')
+        datasource = variable.get('datasource') or {}
+        uid = datasource.get('uid') if isinstance(datasource, dict) else None
+        if not match or not uid:
+            return None
+        params = {'match[]': match.group('metric')} if match.group('metric') else {}
+        try:
+            result = self.get(f"/api/datasources/proxy/uid/{uid}/api/v1/label/{match.group('label')}/values",
+                              **params)
+        except requests.RequestException as e:
+            logging.warning(f"Could not list values of ${variable['name']}: {str(e)}")
+            return None
+        values = result.get('data', [])
+        if variable.get('regex'):
+            pattern = re.compile(variable['regex'].strip('/'))
+            values = [v for v in values if pattern.search(v)]
+        return values
+
+
+def expand_matrix(job: Dict, api: GrafanaAPI = None) -> List[Dict]:
+    """One job per combination of template variable values.
+
+    job['variables'] maps variable name to a list of values, or to None/"*" for
+    every value Grafana knows; a plain list of names means all values of each."""
+    variables = job.get('variables')
+    if not variables:
+        return [job]
+    if isinstance(variables, list):
+        variables = {name: None for name in variables}
+    wanted = {}
+    dashboard_vars = None
+    for name, values in variables.items():
+        if values in (None, '*'):
+            if dashboard_vars is None:
+                api = api or GrafanaAPI.for_job(job)
+                dashboard_vars = api.variables(api.dashboard(job['dashboard_id']))
+            if name not in dashboard_vars:
+                raise ValueError(f"Dashboard {job['dashboard_id']} has no variable ${name}")
+            values = api.variable_values(dashboard_vars[name])
+        wanted[name] = [values] if isinstance(values, str) else list(values)
+        if not wanted[name]:
+            raise ValueError(f"No values for ${name} on dashboard {job['dashboard_id']}")
+    names = list(wanted)
+    combos = list(itertools.product(*(wanted[name] for name in names)))
+    logging.info(f"Matrix for {job['dashboard_id']}: {' x '.join(f'{n}({len(wanted[n])})' for n in names)} "
+                 f"= {len(combos)} captures")
+    return [{**job, 'variables': dict(zip(names, combo))} for combo in combos]
+
+
+def expand_panels(job: Dict, api: GrafanaAPI = None) -> List[Dict]:
+    """Solo render mode or data export without a panel_id (or with "*"): one job per panel"""
+    solo = (job.get('render') or os.environ.get('CAPTURE_RENDER_MODE')) == 'solo'
+    if not (solo or job.get('export')) or job.get('panel_id') not in (None, '*'):
+        return [job]
+    api = api or GrafanaAPI.for_job(job)
+    panels = api.panels(api.dashboard(job['dashboard_id']))
+    if not solo:
+        # Text, news etc. have nothing to export
+        panels = [panel for panel in panels if panel.get('targets')]
+    return [{**job, 'panel_id': panel['id']} for panel in panels]
+
+
+def expand_job(job: Dict, api: GrafanaAPI = None) -> List[Dict]:
+    """A Grafana job as the single captures it describes (variable matrix x solo/exported panels)"""
+    if job.get('platform') != 'grafana':
+        return [job]
+    return [panel_job for matrix_job in expand_matrix(job, api) for panel_job in expand_panels(matrix_job, api)]
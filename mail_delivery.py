@@ -0,0 +1,312 @@
+import os
+import io
+import time
+import socket
+import logging
+import smtplib
+import mimetypes
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import datetime
+from email.message import EmailMessage
+from email.utils import getaddresses
+from typing import Dict, Iterable, List, Optional, Tuple, Union
+from urllib.parse import quote
+
+import capture_report
+
+# Screenshots are re-encoded smaller when Pillow is there, attached as they are otherwise
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+# Email delivery of captures and reports to $MAIL_RECEIVERS (the Jenkins job's
+# comma-separated recipient list).
+#
+# Recipients are deduplicated (case-insensitively, display names dropped) and
+# each delivery is built once: one message, sent to every recipient over the
+# mailer's single SMTP connection, RCPT_CHUNK envelope recipients per SMTP
+# transaction. The connection stays open between deliveries and is checked with
+# a NOOP after it has been idle, reconnecting when the server has dropped it.
+#
+# Screenshots are attached as JPEGs no larger than CAPTURE_MAIL_IMAGE_PX; files
+# are attached in order until the message would outgrow CAPTURE_MAIL_MAX_MB and
+# the rest are listed as links under CAPTURE_MAIL_LINK_BASE (the URL the output
+# dir is served at) or as paths. Deliveries run on the mailer's own thread, so
+# capture workers don't wait for the SMTP server.
+
+DEFAULT_SMTP_PORT = 25
+DEFAULT_MAX_MB = 10
+DEFAULT_IMAGE_PX = 1600
+IMAGE_JPEG_QUALITY = 80
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg')
+# Recipients per SMTP transaction (servers commonly cap RCPT TO at 100)
+RCPT_CHUNK = 50
+# Check a connection idle this long with a NOOP before reusing it
+IDLE_CHECK_SECONDS = 30
+
+
+def recipients(*lists: Union[str, Iterable[str], None]) -> List[str]:
+    """Addresses from comma/semicolon/space separated strings or lists, first occurrence kept"""
+    seen, result = set(), []
+    for value in lists:
+        if not value:
+            continue
+        items = value if not isinstance(value, str) else [value]
+        for item in items:
+            # "Ops Team <ops@example.com>" keeps its address only
+            for _, field in getaddresses([item.replace(';', ',')]):
+                for address in field.split():
+                    if '@' not in address:
+                        logging.warning(f"Ignoring mail recipient without a domain: {address}")
+                        continue
+                    if address.lower() not in seen:
+                        seen.add(address.lower())
+                        result.append(address)
+    return result
+
+
+class SMTPPool:
+    """One SMTP connection, opened on first use and reused until closed"""
+    def __init__(self, host: str = 'localhost', port: int = DEFAULT_SMTP_PORT, username: str = None,
+                 password: str = None, starttls: bool = None, timeout: float = 30):
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        # Submission port: STARTTLS unless told otherwise; 465 is TLS from the start
+        self.starttls = port == 587 if starttls is None else starttls
+        self.timeout = timeout
+        self.smtp: Optional[smtplib.SMTP] = None
+        self.last_used = 0.0
+        self.connections = 0
+
+    def _connect(self) -> smtplib.SMTP:
+        if self.port == 465:
+            smtp = smtplib.SMTP_SSL(self.host, self.port, timeout=self.timeout)
+        else:
+            smtp = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+            if self.starttls:
+                smtp.starttls()
+        if self.username:
+            smtp.login(self.username, self.password or '')
+        self.connections += 1
+        logging.info(f"Connected to SMTP server {self.host}:{self.port}")
+        return smtp
+
+    def connection(self) -> smtplib.SMTP:
+        """Open connection, reconnecting when an idle one no longer answers"""
+        if self.smtp is not None and time.monotonic() - self.last_used > IDLE_CHECK_SECONDS:
+            try:
+                if self.smtp.noop()[0] != 250:
+                    raise smtplib.SMTPServerDisconnected()
+            except (smtplib.SMTPException, OSError):
+                self._drop()
+        if self.smtp is None:
+            self.smtp = self._connect()
+        return self.smtp
+
+    def send(self, message: EmailMessage, to_addrs: List[str]) -> Dict[str, Tuple[int, bytes]]:
+        """Send message to to_addrs in RCPT_CHUNK transactions; returns the refused recipients"""
+        refused = {}
+        for n in range(0, len(to_addrs), RCPT_CHUNK):
+            chunk = to_addrs[n:n + RCPT_CHUNK]
+            for attempt in (1, 2):
+                try:
+                    refused.update(self.connection().send_message(message, to_addrs=chunk))
+                    break
+                except smtplib.SMTPRecipientsRefused as e:
+                    refused.update(e.recipients)
+                    break
+                except (smtplib.SMTPServerDisconnected, ConnectionError):
+                    # Dropped between deliveries despite the NOOP: one fresh connection
+                    self._drop()
+                    if attempt == 2:
+                        raise
+                finally:
+                    self.last_used = time.monotonic()
+        return refused
+
+    def _drop(self):
+        try:
+            self.smtp.close()
+        except (AttributeError, OSError):
+            pass
+        self.smtp = None
+
+    def close(self):
+        if self.smtp is not None:
+            try:
+                self.smtp.quit()
+            except (smtplib.SMTPException, OSError):
+                pass
+            self._drop()
+
+
+def _encoded_size(size: int) -> int:
+    """Size of an attachment once base64 encoded (76-character lines)"""
+    encoded = (size + 2) // 3 * 4
+    return encoded + encoded // 76 * 2
+
+
+def _attachment(file_path: str, image_px: int) -> Tuple[str, bytes, str, str]:
+    """(filename, content, maintype, subtype); screenshots scaled down to JPEG when Pillow is there"""
+    name = os.path.basename(file_path)
+    if Image is not None and file_path.lower().endswith(IMAGE_EXTENSIONS):
+        with Image.open(file_path) as image:
+            image = image.convert('RGB')
+        image.thumbnail((image_px, image_px))
+        buffer = io.BytesIO()
+        image.save(buffer, 'JPEG', quality=IMAGE_JPEG_QUALITY, optimize=True)
+        return f"{os.path.splitext(name)[0]}.jpg", buffer.getvalue(), 'image', 'jpeg'
+    maintype, _, subtype = (mimetypes.guess_type(name)[0] or 'application/octet-stream').partition('/')
+    with open(file_path, 'rb') as f:
+        return name, f.read(), maintype, subtype
+
+
+class Mailer:
+    """Delivers captures over one SMTP connection from a background thread"""
+    def __init__(self, pool: SMTPPool, sender: str, max_mb: float = DEFAULT_MAX_MB,
+                 image_px: int = DEFAULT_IMAGE_PX, link_base: str = None):
+        self.pool = pool
+        self.sender = sender
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self.image_px = image_px
+        self.link_base = link_base
+        # One thread: deliveries queue up behind each other on the one connection
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='mail')
+
+    def _link(self, file_path: str, output_dir: str = None) -> str:
+        path = os.path.relpath(file_path, output_dir) if output_dir else file_path
+        if self.link_base and not path.startswith('..'):
+            return f"{self.link_base.rstrip('/')}/{quote(path.replace(os.sep, '/'))}"
+        return os.path.abspath(file_path)
+
+    def message(self, to: List[str], subject: str, files: List[str], links: List[str] = None,
+                output_dir: str = None, body: str = '') -> Tuple[EmailMessage, Dict]:
+        """Message with files attached while they fit the size cap, linked after that"""
+        message = EmailMessage()
+        message['Subject'] = subject
+        message['From'] = self.sender
+        message['To'] = ', '.join(to)
+        attachments, linked, total = [], list(links or []), 0
+        for file_path in files:
+            try:
+                if _encoded_size(os.path.getsize(file_path)) > self.max_bytes - total and not (
+                        Image is not None and file_path.lower().endswith(IMAGE_EXTENSIONS)):
+                    # Too big even before reading it
+                    linked.append(file_path)
+                    continue
+                attachment = _attachment(file_path, self.image_px)
+            except Exception as e:
+                logging.warning(f"Mail: linking {file_path} instead of attaching it: {str(e)}")
+                linked.append(file_path)
+                continue
+            size = _encoded_size(len(attachment[1]))
+            if total + size > self.max_bytes:
+                linked.append(file_path)
+                continue
+            attachments.append(attachment)
+            total += size
+        lines = [body] if body else []
+        if attachments:
+            lines.append(f"Attached: {', '.join(name for name, *_ in attachments)}")
+        if linked:
+            lines.append("Links:")
+            lines.extend(f"  {self._link(path, output_dir)}" for path in linked)
+        message.set_content('\n'.join(lines) + '\n')
+        for name, content, maintype, subtype in attachments:
+            message.add_attachment(content, maintype=maintype, subtype=subtype, filename=name)
+        return message, {'attached': len(attachments), 'linked': len(linked), 'bytes': total}
+
+    def deliver(self, to: Union[str, List[str]], subject: str, files: List[str], links: List[str] = None,
+                output_dir: str = None, body: str = '') -> Dict:
+        """Build and send one message to every recipient; returns delivery counts and refused addresses"""
+        to = recipients(to)
+        if not to:
+            raise ValueError("No mail recipients")
+        message, counts = self.message(to, subject, files, links, output_dir, body)
+        refused = self.pool.send(message, to)
+        for address, (code, reply) in refused.items():
+            logging.warning(f"Mail to {address} refused: {code} {reply.decode(errors='replace')}")
+        logging.info(f"Mailed {subject!r} to {len(to) - len(refused)} of {len(to)} recipients "
+                     f"({counts['attached']} attached, {counts['linked']} linked, "
+                     f"{counts['bytes'] / 1024 / 1024:.1f} MB)")
+        return {**counts, 'recipients': len(to), 'refused': sorted(refused)}
+
+    def submit(self, *args, **kwargs) -> Future:
+        """deliver() on the mail thread; the future holds its result or error"""
+        future = self._executor.submit(self.deliver, *args, **kwargs)
+        future.add_done_callback(lambda f: f.exception() and logging.error(f"Mail delivery failed: {f.exception()}"))
+        return future
+
+    def close(self):
+        """Finish queued deliveries and close the connection"""
+        self._executor.shutdown(wait=True)
+        self.pool.close()
+
+
+class Batch:
+    """Mails the outputs of a group of jobs once the last of them is over"""
+    def __init__(self, mailer: Mailer, to: List[str], subject: str, output_dir: str = None, jobs: int = 0):
+        self.mailer = mailer
+        self.to = to
+        self.subject = subject
+        self.output_dir = output_dir
+        self.remaining = jobs
+        self.files: List[str] = []
+        self.failed = 0
+        self._lock = threading.Lock()
+
+    def finished(self, file_path: str = None):
+        """One job is over (file_path None: it failed or was cancelled)"""
+        with self._lock:
+            if file_path:
+                self.files.append(file_path)
+            else:
+                self.failed += 1
+            self.remaining -= 1
+            if self.remaining:
+                return
+        if not self.files:
+            logging.warning(f"Mail {self.subject!r}: every job failed, nothing to send")
+            return
+        body = f"{len(self.files)} captures" + (f", {self.failed} failed" if self.failed else '')
+        self.mailer.submit(self.to, self.subject, self.files, output_dir=self.output_dir, body=body)
+
+
+def deliver_captures(mailer: Mailer, to: Union[str, List[str]], output_dir: str, run_id: str = None,
+                     since: datetime = None, report: Dict[str, str] = None) -> Optional[Future]:
+    """Mail a run's captures (or those since a time): the PDF report when there is one, with the
+    HTML contact sheet linked, else the captures themselves. None when there is nothing to send"""
+    rows = capture_report.captures(output_dir, run_id, since)
+    if not rows:
+        logging.warning("No captures to mail")
+        return None
+    if report:
+        files, links = [report['pdf']], [report['html']]
+    else:
+        files, links = [row['file_path'] for row in rows], []
+    dashboards = len({(row['platform'], row['dashboard_id'], row['dashboard_name']) for row in rows})
+    subject = f"Dashboard captures{f' - run {run_id}' if run_id else ''}"
+    return mailer.submit(to, subject, files, links=links, output_dir=output_dir,
+                         body=f"{len(rows)} captures of {dashboards} dashboards.")
+
+
+def from_env() -> Mailer:
+    """Mailer configured by $CAPTURE_SMTP_* and $CAPTURE_MAIL_*"""
+    starttls = os.environ.get('CAPTURE_SMTP_STARTTLS')
+    return Mailer(
+        SMTPPool(
+            host=os.environ.get('CAPTURE_SMTP_HOST', 'localhost'),
+            port=int(os.environ.get('CAPTURE_SMTP_PORT', DEFAULT_SMTP_PORT)),
+            username=os.environ.get('CAPTURE_SMTP_USER'),
+            password=os.environ.get('CAPTURE_SMTP_PASSWORD'),
+            starttls=None if starttls is None else starttls.lower() not in ('0', 'false', 'no', ''),
+        ),
+        sender=os.environ.get('CAPTURE_MAIL_FROM') or f"captures@{socket.getfqdn()}",
+        max_mb=float(os.environ.get('CAPTURE_MAIL_MAX_MB', DEFAULT_MAX_MB)),
+        image_px=int(os.environ.get('CAPTURE_MAIL_IMAGE_PX', DEFAULT_IMAGE_PX)),
+        link_base=os.environ.get('CAPTURE_MAIL_LINK_BASE'),
+    )
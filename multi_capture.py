@@ -0,0 +1,214 @@
+import json
+import os
+import time
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Callable, Dict, List
+
+import auto_crop
+import capture_report
+import mail_delivery
+import remote_driver
+import run_journal
+import s3_sink
+import superfake
+
+# Combined mode: capture several platforms in one run, one pipeline (browser + login)
+# per platform running concurrently, merged into one capture history and one summary.
+
+# Concurrent data export jobs ($CAPTURE_EXPORT_WORKERS)
+EXPORT_WORKERS = 4
+
+
+def load_jobs(path: str, defaults: Dict = None, credentials: Callable[[str], Dict] = None) -> List[Dict]:
+    """Read a JSON list of jobs; list-valued dashboard_id/dashboard_name expand to one job each,
+    Grafana template variables to one job per combination of values, exports to one job per
+    panel/search. credentials(platform) supplies logins for entries that have none"""
+    with open(path) as f:
+        entries = json.load(f)
+    if isinstance(entries, dict):
+        entries = [entries]
+    jobs = []
+    for entry in entries:
+        entry = {**run_journal.defaults_for(defaults, entry.get('platform')),
+                 **(credentials(entry.get('platform') or '') if credentials else {}), **entry}
+        key = 'dashboard_name' if entry.get('platform') == 'splunk' else 'dashboard_id'
+        values = entry.get(key)
+        for value in (values if isinstance(values, list) else [values]):
+            # Combinations stay adjacent so one pipeline switches them in place
+            for job in superfake.expand_job({**entry, key: value}):
+                jobs.append(superfake.validate_job(job))
+    return jobs
+
+
+def _capture(app: superfake.CaptureApp, job: Dict, headless: bool,
+             journal: run_journal.RunJournal = None) -> Dict:
+    """Run one job on app, journal it, and describe the outcome"""
+    platform = job['platform']
+    dashboard = job.get('dashboard_id') or job.get('dashboard_name')
+    started = time.perf_counter()
+    result = {'platform': platform, 'dashboard': dashboard, 'url': job['url']}
+    try:
+        result['file_path'] = app.run_job(job, headless=headless)
+        result['status'] = 'ok'
+        if journal:
+            journal.record(job, result['file_path'])
+    except Exception as e:
+        logging.error(f"[{platform}] Failed to capture {dashboard}: {str(e)}")
+        result['status'] = 'failed'
+        result['error'] = str(e)
+    result['seconds'] = round(time.perf_counter() - started, 3)
+    return result
+
+
+def _run_pipeline(platform: str, jobs: List[Dict], profile_name: str, headless: bool,
+                  journal: run_journal.RunJournal = None) -> List[Dict]:
+    """Run one platform's jobs in order on its own browser session"""
+    app = superfake.CaptureApp(profile_name=profile_name)
+    results = []
+    try:
+        for n, job in enumerate(jobs):
+            if app.prefetcher:
+                app.prefetcher.upcoming(jobs[n + 1:])
+            result = _capture(app, job, headless, journal)
+            if result['status'] != 'ok':
+                # Don't let one broken page poison the rest of the pipeline
+                app.close()
+            results.append(result)
+    finally:
+        app.close()
+    return results
+
+
+def run_on_grid(jobs: List[Dict], profile_name: str = None, headless: bool = True,
+                sessions: int = None, journal: run_journal.RunJournal = None) -> List[Dict]:
+    """Spread jobs over as many grid sessions as the grid has slots, reusing logins"""
+    router = remote_driver.SessionRouter(sessions or remote_driver.grid_capacity(), profile_name)
+    logging.info(f"Routing {len(jobs)} jobs over {router.size} grid sessions")
+
+    def routed(n: int, job: Dict) -> Dict:
+        app = router.acquire(job)
+        if app.prefetcher:
+            # Jobs up to n + size are already running on the other sessions
+            app.prefetcher.upcoming(jobs[n + router.size:])
+        result = _capture(app, job, headless, journal)
+        router.release(app, broken=result['status'] != 'ok')
+        return result
+
+    try:
+        with ThreadPoolExecutor(max_workers=router.size, thread_name_prefix='grid') as pool:
+            return list(pool.map(routed, range(len(jobs)), jobs))
+    finally:
+        router.close()
+
+
+def run_exports(jobs: List[Dict], journal: run_journal.RunJournal = None, workers: int = None) -> List[Dict]:
+    """Data export jobs need no browser: run them side by side on one CaptureApp"""
+    app = superfake.CaptureApp()
+    workers = workers or int(os.environ.get('CAPTURE_EXPORT_WORKERS', EXPORT_WORKERS))
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='export') as pool:
+        return list(pool.map(lambda job: _capture(app, job, True, journal), jobs))
+
+
+def run_concurrently(jobs: List[Dict], profile_name: str = None, headless: bool = True,
+                     journal: run_journal.RunJournal = None) -> List[Dict]:
+    """Run per-platform pipelines in parallel (or route over the grid), exports alongside
+    on their own pool, and return all results"""
+    exports = [job for job in jobs if job.get('export')]
+    jobs = [job for job in jobs if not job.get('export')]
+    with ThreadPoolExecutor(max_workers=1, thread_name_prefix='exports') as pool:
+        exported = pool.submit(run_exports, exports, journal) if exports else None
+        if remote_driver.grid_url():
+            results = run_on_grid(jobs, profile_name=profile_name, headless=headless, journal=journal) if jobs else []
+        else:
+            results = _run_pipelines(jobs, profile_name, headless, journal)
+        return results + (exported.result() if exported else [])
+
+
+def _run_pipelines(jobs: List[Dict], profile_name: str, headless: bool,
+                   journal: run_journal.RunJournal = None) -> List[Dict]:
+    """One pipeline per platform, each on its own browser"""
+    by_platform: Dict[str, List[Dict]] = {}
+    for job in jobs:
+        by_platform.setdefault(job['platform'], []).append(job)
+    if not by_platform:
+        return []
+    with ThreadPoolExecutor(max_workers=len(by_platform), thread_name_prefix='pipeline') as pool:
+        futures = {
+            platform: pool.submit(_run_pipeline, platform, platform_jobs, profile_name, headless, journal)
+            for platform, platform_jobs in by_platform.items()
+        }
+        return [result for future in futures.values() for result in future.result()]
+
+
+def write_summary(results: List[Dict], output_dir: str, started_at: datetime, wall_seconds: float,
+                  run_id: str = None, skipped: int = 0) -> str:
+    """Write run_summary.json next to the merged capture_history.csv"""
+    platforms = {}
+    for result in results:
+        counts = platforms.setdefault(result['platform'], {'ok': 0, 'failed': 0})
+        counts[result['status']] += 1
+    summary = {
+        'run_id': run_id,
+        'started_at': started_at.isoformat(),
+        'skipped_completed': skipped,
+        'wall_seconds': round(wall_seconds, 3),
+        'platforms': platforms,
+        'results': results,
+    }
+    os.makedirs(output_dir, exist_ok=True)
+    path = os.path.join(output_dir, 'run_summary.json')
+    with open(path, 'w') as f:
+        json.dump(summary, f, indent=2)
+    for platform, counts in platforms.items():
+        logging.info(f"{platform}: {counts['ok']} captured, {counts['failed']} failed")
+    logging.info(f"Run summary: {path}")
+    return path
+
+
+def run(jobs_path: str, defaults: Dict, profile_name: str = None, resume: str = None,
+        report: bool = False, mail_to: str = None, crop: bool = False) -> bool:
+    """Combined-mode entry point; True when every capture succeeded.
+    With resume, continue the journalled run of that id instead of reading jobs_path.
+    With crop, the run's captures are cropped and split into panels afterwards (auto_crop);
+    with report, they are assembled into a PDF and HTML report;
+    with mail_to, the report (or the captures) are mailed to those addresses"""
+    # One run, one history: every job writes to the same output dir
+    output_dir = defaults.get('output_dir') or './captures'
+    if resume:
+        journal = run_journal.RunJournal.open(output_dir, resume)
+        jobs = journal.remaining(defaults)
+        skipped = len(journal.jobs) - len(jobs)
+        logging.info(f"Resuming run {resume}: {skipped} of {len(journal.jobs)} captures already done")
+    else:
+        jobs = load_jobs(jobs_path, defaults)
+        for job in jobs:
+            job['output_dir'] = output_dir
+        journal = run_journal.RunJournal.create(output_dir, jobs, superfake.CaptureApp.parse_time_range)
+        jobs, skipped = journal.jobs, 0
+        logging.info(f"Run id {journal.run_id} (continue an interrupted run with --resume {journal.run_id})")
+    logging.info(f"Capturing {len(jobs)} dashboards across {len({j['platform'] for j in jobs})} platforms")
+    started_at, started = datetime.now(), time.perf_counter()
+    results = run_concurrently(jobs, profile_name=profile_name, journal=journal)
+    summary = write_summary(results, output_dir, started_at, time.perf_counter() - started,
+                            run_id=journal.run_id, skipped=skipped)
+    if crop:
+        auto_crop.process_run(output_dir, run_id=journal.run_id)
+    paths = capture_report.build_report(output_dir, run_id=journal.run_id) if report else None
+    sink = s3_sink.shared()
+    if sink:
+        files = [summary, journal.path]
+        if paths:
+            files += [os.path.join(dirpath, name) for dirpath, _, names in os.walk(os.path.dirname(paths['pdf']))
+                      for name in names]
+        for path in files:
+            sink.put(path, output_dir)
+    if mail_to:
+        mailer = mail_delivery.from_env()
+        try:
+            mail_delivery.deliver_captures(mailer, mail_to, output_dir, run_id=journal.run_id, report=paths)
+        finally:
+            # A failed delivery is logged; the captures themselves are fine
+            mailer.close()
+    return all(result['status'] == 'ok' for result in results)
@@ -0,0 +1,234 @@
+import os
+import re
+import csv
+import logging
+from datetime import datetime, timezone
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from grafana_api import GrafanaAPI
+
+# Parquet output is optional
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = pq = None
+
+# Data export: the numbers behind Grafana panels instead of a screenshot.
+#
+# Each panel's targets are resolved (datasource, template variables) and sent to
+# /api/ds/query for the job's time window. The returned data frames are written
+# one panel per file in long format: time, ref_id, series, value. Numeric fields
+# become values, string fields (table columns) become series labels.
+
+EXPORT_FORMATS = ['csv', 'parquet']
+EXPORT_COLUMNS = ['time', 'ref_id', 'series', 'value']
+DEFAULT_MAX_DATA_POINTS = 1000
+# $var, ${var}, ${var:format}, [[var]]
+VARIABLE_REF = re.compile(r'\$\{(\w+)(?::\w+)?\}|\[\[(\w+)\]\]|\$(\w+)')
+MIXED_DATASOURCE = '-- Mixed --'
+
+
+def dashboard_variables(dashboard: Dict, job: Dict) -> Dict[str, List[str]]:
+    """Current value of each template variable, job['variables'] taking precedence"""
+    values = {}
+    for variable in dashboard.get('templating', {}).get('list', []):
+        current = (variable.get('current') or {}).get('value')
+        if current in (None, '', '$__all'):
+            continue
+        values[variable['name']] = [str(v) for v in current] if isinstance(current, list) else [str(current)]
+    if job.get('datasource'):
+        # Datasource variables (${DS_PROMETHEUS}) follow the job's datasource
+        for variable in dashboard.get('templating', {}).get('list', []):
+            if variable.get('type') == 'datasource':
+                values[variable['name']] = [job['datasource']]
+    values.update({name: [str(value)] for name, value in (job.get('variables') or {}).items()})
+    return values
+
+
+def interpolate(value, variables: Dict[str, List[str]]):
+    """Substitute template variables in a target field; unknown and $__builtin refs are left to Grafana"""
+    if isinstance(value, dict):
+        return {k: interpolate(v, variables) for k, v in value.items()}
+    if isinstance(value, list):
+        return [interpolate(v, variables) for v in value]
+    if not isinstance(value, str):
+        return value
+
+    def substitute(match):
+        name = next(group for group in match.groups() if group)
+        if name not in variables:
+            return match.group(0)
+        values = variables[name]
+        # Multi-value: regex alternation, as Grafana formats it for Prometheus/Loki
+        return values[0] if len(values) == 1 else f"({'|'.join(values)})"
+    return VARIABLE_REF.sub(substitute, value)
+
+
+class PanelExporter:
+    """Export Grafana panel data through the datasource query API"""
+    def __init__(self, api: GrafanaAPI, fmt: str = 'csv', max_data_points: int = DEFAULT_MAX_DATA_POINTS):
+        if fmt not in EXPORT_FORMATS:
+            raise ValueError(f"Unknown export format: {fmt} (choose from {', '.join(EXPORT_FORMATS)})")
+        if fmt == 'parquet' and pa is None:
+            raise ValueError("Parquet export needs pyarrow (pip install pyarrow)")
+        self.api = api
+        self.fmt = fmt
+        self.max_data_points = max_data_points
+        self._datasources: Optional[List[Dict]] = None
+
+    def _datasource(self, ref, job: Dict, variables: Dict[str, List[str]]) -> Optional[Dict]:
+        """{'uid', 'type'} for a panel/target datasource reference (uid dict, name, variable or default)"""
+        if isinstance(ref, dict) and ref.get('uid') and '$' not in ref['uid']:
+            return {'uid': ref['uid'], 'type': ref.get('type')}
+        name = ref.get('uid') if isinstance(ref, dict) else ref
+        name = interpolate(name, variables) if name else job.get('datasource')
+        if self._datasources is None:
+            self._datasources = self.api.datasources()
+        for ds in self._datasources:
+            if name in (ds.get('uid'), ds.get('name')):
+                return {'uid': ds['uid'], 'type': ds.get('type')}
+        default = next((ds for ds in self._datasources if ds.get('isDefault')), None)
+        if name in (None, 'default') and default:
+            return {'uid': default['uid'], 'type': default.get('type')}
+        return None
+
+    def queries(self, panel: Dict, job: Dict, variables: Dict[str, List[str]],
+                start_ms: int, end_ms: int) -> List[Dict]:
+        """The panel's visible targets as /api/ds/query queries"""
+        panel_ds = panel.get('datasource')
+        max_data_points = panel.get('maxDataPoints') or self.max_data_points
+        interval_ms = max(1, (end_ms - start_ms) // max_data_points)
+        queries = []
+        for n, target in enumerate(panel.get('targets', [])):
+            if target.get('hide'):
+                continue
+            mixed = (panel_ds.get('uid') if isinstance(panel_ds, dict) else panel_ds) == MIXED_DATASOURCE
+            datasource = self._datasource(target.get('datasource') if mixed or target.get('datasource')
+                                          else panel_ds, job, variables)
+            if datasource is None:
+                logging.warning(f"Panel {panel.get('id')}: no datasource for target {target.get('refId', n)}, skipped")
+                continue
+            queries.append({
+                **interpolate(target, variables),
+                'refId': target.get('refId') or chr(ord('A') + n),
+                'datasource': datasource,
+                'intervalMs': interval_ms,
+                'maxDataPoints': max_data_points,
+            })
+        return queries
+
+    @staticmethod
+    def rows(results: Dict) -> Iterator[Tuple[Optional[datetime], str, str, object]]:
+        """(time, ref_id, series, value) for every value of every returned frame"""
+        for ref_id, result in results.items():
+            if result.get('error'):
+                logging.warning(f"Query {ref_id} failed: {result['error']}")
+                continue
+            for frame in result.get('frames', []):
+                fields = frame.get('schema', {}).get('fields', [])
+                columns = frame.get('data', {}).get('values', [])
+                time_index = next((i for i, f in enumerate(fields) if f.get('type') == 'time'), None)
+                label_indexes = [i for i, f in enumerate(fields) if f.get('type') == 'string']
+                for i, field in enumerate(fields):
+                    if i == time_index or i in label_indexes or i >= len(columns):
+                        continue
+                    name = ((field.get('config') or {}).get('displayNameFromDS')
+                            or frame['schema'].get('name') or field['name'])
+                    labels = field.get('labels') or {}
+                    for row, value in enumerate(columns[i]):
+                        row_labels = {**labels, **{fields[j]['name']: columns[j][row] for j in label_indexes}}
+                        series = name + ('{' + ', '.join(f'{k}="{v}"' for k, v in sorted(row_labels.items())) + '}'
+                                         if row_labels else '')
+                        at = columns[time_index][row] if time_index is not None else None
+                        yield (datetime.fromtimestamp(at / 1000, timezone.utc) if at is not None else None,
+                               ref_id, series, value)
+
+    def write(self, rows: Iterator[Tuple], file_path: str) -> int:
+        """Stream rows to CSV or Parquet; returns the row count"""
+        return write_rows(rows, file_path, self.fmt)
+
+    def export_panel(self, job: Dict, dashboard: Dict, panel: Dict,
+                     start_date: datetime, end_date: datetime) -> str:
+        """Query one panel and write its data next to where its screenshot would go"""
+        variables = dashboard_variables(dashboard, job)
+        start_ms, end_ms = int(start_date.timestamp() * 1000), int(end_date.timestamp() * 1000)
+        queries = self.queries(panel, job, variables, start_ms, end_ms)
+        if not queries:
+            raise ValueError(f"Panel {panel.get('id')} of {dashboard['uid']} has no queries to export")
+        results = self.api.query(queries, start_ms, end_ms)
+        output_path = os.path.join(job['output_dir'], 'grafana', job['datasource'].replace(' ', '_'))
+        os.makedirs(output_path, exist_ok=True)
+        file_path = os.path.join(output_path, export_filename(job, dashboard, panel, start_date, end_date, self.fmt))
+        count = self.write(self.rows(results), file_path)
+        logging.info(f"Exported {count} values of panel {panel.get('id')} ({panel.get('title', '')}) to {file_path}")
+        return file_path
+
+
+def write_rows(rows: Iterator[Tuple], file_path: str, fmt: str) -> int:
+    """Stream (time, ref_id, series, value) rows to CSV or Parquet; returns the row count.
+    Times are UTC-aware datetimes"""
+    count = 0
+    if fmt == 'csv':
+        with open(file_path, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(EXPORT_COLUMNS)
+            for at, ref_id, series, value in rows:
+                writer.writerow([at.isoformat() if at else '', ref_id, series, value])
+                count += 1
+        return count
+    schema = pa.schema([('time', pa.timestamp('ms', tz='UTC')), ('ref_id', pa.string()),
+                        ('series', pa.string()), ('value', pa.float64())])
+    with pq.ParquetWriter(file_path, schema) as writer:
+        batch = []
+        for row in rows:
+            batch.append(row)
+            if len(batch) >= 65536:
+                writer.write_table(_table(batch, schema))
+                count += len(batch)
+                batch = []
+        if batch or not count:
+            writer.write_table(_table(batch, schema))
+            count += len(batch)
+    return count
+
+
+def _table(batch: List[Tuple], schema):
+    columns = list(zip(*batch)) if batch else [[] for _ in EXPORT_COLUMNS]
+    values = [float(v) if v is not None else None for v in columns[3]]
+    return pa.Table.from_arrays([pa.array(columns[0], pa.timestamp('ms', tz='UTC')), pa.array(columns[1], pa.string()),
+                                 pa.array(columns[2], pa.string()), pa.array(values, pa.float64())],
+                                schema=schema)
+
+
+def export_filename(job: Dict, dashboard: Dict, panel: Dict, start_date: datetime, end_date: datetime,
+                    fmt: str) -> str:
+    """Same name as the panel's solo screenshot, with the export format's extension"""
+    safe_name = dashboard['title'].replace(' ', '_').replace('/', '-')
+    ds_name = job['datasource'].replace(' ', '_')
+    var_str = re.sub(r'[^\w.-]', '_', ''.join(
+        f"_{name}-{value}" for name, value in (job.get('variables') or {}).items()))
+    return (f"{safe_name}_{dashboard['uid']}_{ds_name}{var_str}_panel-{panel['id']}_"
+            f"{start_date.strftime('%Y%m%dT%H%M%S')}_{end_date.strftime('%Y%m%dT%H%M%S')}.{fmt}")
+
+
+def export_job(job: Dict, parse_time_range, api: GrafanaAPI = None) -> Tuple[Dict, List[str]]:
+    """Export a Grafana job's panel (or every panel without panel_id): dashboard JSON and file paths"""
+    api = api or GrafanaAPI.for_job(job)
+    exporter = PanelExporter(api, job.get('export') or 'csv')
+    dashboard = api.dashboard(job['dashboard_id'])
+    start_date, end_date = parse_time_range(job['time_range'])
+    panels = GrafanaAPI.panels(dashboard)
+    if job.get('panel_id') not in (None, '*'):
+        panels = [p for p in panels if str(p.get('id')) == str(job['panel_id'])]
+        if not panels:
+            raise ValueError(f"Dashboard {job['dashboard_id']} has no panel {job['panel_id']}")
+    exported = []
+    for panel in panels:
+        if not panel.get('targets'):
+            logging.debug(f"Panel {panel.get('id')} has no targets, skipped")
+            continue
+        exported.append(exporter.export_panel(job, dashboard, panel, start_date, end_date))
+    if job.get('panel_id') not in (None, '*') and not exported:
+        raise ValueError(f"Panel {job['panel_id']} of {job['dashboard_id']} has no queries to export")
+    return dashboard, exported
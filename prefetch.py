@@ -0,0 +1,224 @@
+import os
+import csv
+import time
+import logging
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from dynatrace_api import DynatraceAPI
+from dynatrace_export import tile_queries
+from grafana_api import GrafanaAPI
+from panel_export import PanelExporter, dashboard_variables
+from run_journal import job_key
+
+# Query prefetch: warm the backends of the next dashboards before the browser gets there.
+#
+# A dashboard's queries (Grafana panel targets through /api/ds/query, Dynatrace
+# tile metrics through /api/v2/metrics/query when the job has an API token) are
+# fired concurrently lead_seconds before its estimated capture time, so
+# datasource/result caches are hot when the page asks for the same data one panel
+# after another. Splunk is not warmed: a dashboard dispatches its own search jobs
+# and never reuses ad-hoc ones, so warming would only double the search load. Batch pipelines and
+# queue workers call upcoming() with the jobs queued behind the current one;
+# a job nobody scheduled is warmed just before navigation. Each capture's
+# prefetch and capture timings go to prefetch_history.csv in its output dir.
+#
+# Relative windows ("now-1h") snap to $CAPTURE_TIME_ALIGN (time_expr), so a warm
+# up and its capture within the same step ask for exactly the same window; across
+# a step boundary step-aligned caches (Prometheus/Thanos, Grafana query caching)
+# still reuse most of it.
+
+HISTORY_COLUMNS = ['recorded_at', 'platform', 'dashboard', 'queries', 'failed', 'prefetch_seconds',
+                   'lead_seconds', 'capture_seconds']
+# Browser viewport width; Grafana asks each panel for about one point per pixel
+VIEWPORT_WIDTH = 1920
+GRAFANA_GRID_COLUMNS = 24
+CAPTURE_SAMPLES = 20
+
+
+class Prefetcher:
+    """Fire dashboards' backend queries ahead of their captures"""
+    def __init__(self, parse_time_range, lead_seconds: float = 30.0, workers: int = 2, query_workers: int = 8):
+        self.parse_time_range = parse_time_range
+        self.lead_seconds = lead_seconds
+        self._jobs = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='prefetch')
+        self._queries = ThreadPoolExecutor(max_workers=query_workers, thread_name_prefix='prefetch-query')
+        self._lock = threading.Lock()
+        self._warming: Dict[str, Dict] = {}
+        self._capture_seconds = deque(maxlen=CAPTURE_SAMPLES)
+
+    def schedule(self, job: Dict, capture_at: float = None):
+        """Warm job's queries lead_seconds before capture_at (now if that has passed or is unknown)"""
+        key = job_key(job)
+        with self._lock:
+            if key in self._warming:
+                return
+            entry = {'job': job, 'queries': 0, 'failed': 0, 'done': threading.Event()}
+            self._warming[key] = entry
+        delay = max(0.0, capture_at - self.lead_seconds - time.time()) if capture_at else 0.0
+        if delay:
+            entry['timer'] = threading.Timer(delay, self._start, (entry,))
+            entry['timer'].daemon = True
+            entry['timer'].start()
+        else:
+            self._start(entry)
+
+    def _start(self, entry: Dict):
+        with self._lock:
+            if entry.get('future'):
+                return
+            entry['future'] = self._jobs.submit(self._warm, entry)
+
+    def upcoming(self, jobs: List[Dict]):
+        """Schedule the jobs queued behind the current one whose estimated start is within the
+        lead time (jobs in run order, spaced by the average recent capture time)"""
+        with self._lock:
+            average = sum(self._capture_seconds) / len(self._capture_seconds) if self._capture_seconds else None
+        capture_at = time.time() + (average or 0)
+        for job in jobs:
+            if capture_at - self.lead_seconds > time.time():
+                break
+            self.schedule(job, capture_at)
+            if average is None:
+                # No capture timed yet: only the next job is known to be close
+                break
+            capture_at += average
+
+    def before_capture(self, job: Dict):
+        """Call right before navigating: makes sure job's queries were fired and
+        waits up to lead_seconds for a warm still in flight"""
+        key = job_key(job)
+        self.schedule(job)
+        with self._lock:
+            entry = self._warming.get(key)
+        if entry is None:
+            # Same dashboard captured concurrently elsewhere and already recorded
+            return
+        if entry.get('timer'):
+            # Capture came earlier than estimated
+            entry['timer'].cancel()
+            self._start(entry)
+        if not entry['done'].wait(self.lead_seconds):
+            logging.warning(f"Prefetch for {key} still running after {self.lead_seconds}s, capturing anyway")
+        entry['capture_started'] = time.time()
+
+    def after_capture(self, job: Dict):
+        """Record the capture time (navigation to screenshot) next to its prefetch timings"""
+        with self._lock:
+            entry = self._warming.pop(job_key(job), None)
+        if entry is None or 'capture_started' not in entry:
+            return
+        seconds = time.time() - entry['capture_started']
+        with self._lock:
+            self._capture_seconds.append(seconds)
+        if 'finished' not in entry:
+            return
+        path = os.path.join(job['output_dir'], 'prefetch_history.csv')
+        with self._lock:
+            os.makedirs(job['output_dir'], exist_ok=True)
+            file_exists = os.path.exists(path)
+            with open(path, 'a', newline='') as f:
+                writer = csv.DictWriter(f, fieldnames=HISTORY_COLUMNS)
+                if not file_exists:
+                    writer.writeheader()
+                writer.writerow({
+                    'recorded_at': datetime.now().isoformat(),
+                    'platform': job['platform'],
+                    'dashboard': job.get('dashboard_id') or job.get('dashboard_name'),
+                    'queries': entry['queries'],
+                    'failed': entry['failed'],
+                    'prefetch_seconds': f"{entry['finished'] - entry['started']:.3f}",
+                    'lead_seconds': f"{entry.get('capture_started', entry['finished']) - entry['finished']:.3f}",
+                    'capture_seconds': f"{seconds:.3f}",
+                })
+
+    def discard(self, job: Dict):
+        """Forget a job that was not captured"""
+        with self._lock:
+            entry = self._warming.pop(job_key(job), None)
+        if entry and entry.get('timer'):
+            entry['timer'].cancel()
+
+    def _warm(self, entry: Dict):
+        job = entry['job']
+        entry['started'] = time.time()
+        try:
+            warm = getattr(self, f"_warm_{job['platform']}", None)
+            futures = warm(job) if warm else []
+            entry['queries'] = len(futures)
+            wait(futures)
+            entry['failed'] = sum(1 for f in futures if f.exception())
+            for f in futures:
+                if f.exception():
+                    logging.debug(f"Prefetch query failed: {str(f.exception())}")
+        except Exception as e:
+            entry['failed'] += 1
+            logging.warning(f"Prefetch for {job_key(job)} failed: {str(e)}")
+        finally:
+            entry['finished'] = time.time()
+            entry['done'].set()
+        logging.info(f"Prefetched {entry['queries']} queries for {job['platform']} "
+                     f"{job.get('dashboard_id') or job.get('dashboard_name')} "
+                     f"in {entry['finished'] - entry['started']:.2f}s ({entry['failed']} failed)")
+
+    def _warm_grafana(self, job: Dict) -> List:
+        """One /api/ds/query per panel, as the dashboard page sends them"""
+        api = GrafanaAPI.for_job(job)
+        exporter = PanelExporter(api)
+        dashboard = api.dashboard(job['dashboard_id'])
+        variables = dashboard_variables(dashboard, job)
+        start_date, end_date = self.parse_time_range(job['time_range'])
+        start_ms, end_ms = int(start_date.timestamp() * 1000), int(end_date.timestamp() * 1000)
+        futures = []
+        for panel in GrafanaAPI.panels(dashboard):
+            if job.get('panel_id') and str(panel.get('id')) != str(job['panel_id']):
+                continue
+            width = (panel.get('gridPos') or {}).get('w', GRAFANA_GRID_COLUMNS)
+            panel = {'maxDataPoints': int(VIEWPORT_WIDTH * width / GRAFANA_GRID_COLUMNS), **panel}
+            queries = exporter.queries(panel, job, variables, start_ms, end_ms)
+            if queries:
+                futures.append(self._queries.submit(api.query, queries, start_ms, end_ms))
+        return futures
+
+    def _warm_dynatrace(self, job: Dict) -> List:
+        """Each chart tile's metric selectors (needs an API token; the UI login is not enough)"""
+        if not job.get('token'):
+            return []
+        api = DynatraceAPI.for_job(job)
+        start_date, end_date = self.parse_time_range(job['time_range'])
+        start_ms, end_ms = int(start_date.timestamp() * 1000), int(end_date.timestamp() * 1000)
+        return [self._queries.submit(api.metrics_query, query['selector'], start_ms, end_ms,
+                                     query['resolution'], query['mz_selector'])
+                for query in tile_queries(api.dashboard(job['dashboard_id']), job)]
+
+    def close(self):
+        with self._lock:
+            for entry in self._warming.values():
+                if entry.get('timer'):
+                    entry['timer'].cancel()
+            self._warming.clear()
+        self._jobs.shutdown(wait=False)
+        self._queries.shutdown(wait=False)
+
+
+_shared: Optional[Prefetcher] = None
+_shared_lock = threading.Lock()
+
+
+def shared(parse_time_range) -> Optional[Prefetcher]:
+    """Process-wide prefetcher, or None unless $CAPTURE_PREFETCH_LEAD is set (seconds, > 0)"""
+    global _shared
+    lead = float(os.environ.get('CAPTURE_PREFETCH_LEAD') or 0)
+    if lead <= 0:
+        return None
+    with _shared_lock:
+        if _shared is not None and _shared.lead_seconds != lead:
+            _shared.close()
+            _shared = None
+        if _shared is None:
+            _shared = Prefetcher(parse_time_range, lead_seconds=lead,
+                                 query_workers=int(os.environ.get('CAPTURE_PREFETCH_WORKERS', 8)))
+        return _shared
@@ -0,0 +1,107 @@
+import os
+import signal
+import logging
+from typing import Dict, List
+
+# Process tree helpers (Linux /proc, psutil when installed)
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+
+def _children_map() -> Dict[int, List[int]]:
+    """Build a ppid -> [pid] map from /proc"""
+    children = {}
+    for entry in os.listdir('/proc'):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                # comm may contain spaces, ppid follows the closing paren
+                fields = f.read().rsplit(')', 1)[1].split()
+            children.setdefault(int(fields[1]), []).append(int(entry))
+        except (OSError, IndexError, ValueError):
+            continue
+    return children
+
+
+def descendants(pid: int) -> List[int]:
+    """Return all descendant PIDs of a process"""
+    if psutil:
+        try:
+            return [p.pid for p in psutil.Process(pid).children(recursive=True)]
+        except psutil.Error:
+            return []
+    if not os.path.isdir('/proc'):
+        return []
+    children = _children_map()
+    result, stack = [], [pid]
+    while stack:
+        for child in children.get(stack.pop(), []):
+            result.append(child)
+            stack.append(child)
+    return result
+
+
+def rss_bytes(pid: int) -> int:
+    """Resident set size of one process in bytes (0 if gone)"""
+    if psutil:
+        try:
+            return psutil.Process(pid).memory_info().rss
+        except psutil.Error:
+            return 0
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return 0
+
+
+def tree_rss_bytes(pid: int, include_root: bool = True) -> int:
+    """Summed RSS of a process and all its descendants"""
+    pids = descendants(pid)
+    if include_root:
+        pids.append(pid)
+    return sum(rss_bytes(p) for p in pids)
+
+
+def kill_tree(pid: int, include_root: bool = True):
+    """SIGKILL a process and all its descendants, children first"""
+    pids = list(reversed(descendants(pid)))
+    if include_root:
+        pids.append(pid)
+    for p in pids:
+        try:
+            os.kill(p, signal.SIGKILL)
+        except (ProcessLookupError, PermissionError):
+            continue
+        except OSError as e:
+            logging.warning(f"Could not kill pid {p}: {str(e)}")
+
+
+def cpu_seconds(pid: int) -> float:
+    """User + system CPU time of one process (0 if gone)"""
+    if psutil:
+        try:
+            times = psutil.Process(pid).cpu_times()
+            return times.user + times.system
+        except psutil.Error:
+            return 0.0
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            fields = f.read().rsplit(')', 1)[1].split()
+        return (int(fields[11]) + int(fields[12])) / os.sysconf('SC_CLK_TCK')
+    except (OSError, IndexError, ValueError):
+        return 0.0
+
+
+def tree_cpu_seconds(pid: int, include_root: bool = True) -> float:
+    """Summed CPU time of a process and its live descendants"""
+    pids = descendants(pid)
+    if include_root:
+        pids.append(pid)
+    return sum(cpu_seconds(p) for p in pids)
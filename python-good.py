@@ -4,14 +4,15 @@ import sys
 import time
 import logging
 import requests
-from datetime import datetime, timedelta
-from selenium import webdriver
+from datetime import datetime
 from selenium.webdriver.common.by import By
-from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
 from requests.auth import HTTPBasicAuth
 from urllib.parse import urlparse
 from typing import Tuple
+import browser_profile
+import time_expr
+import timeouts
 
 # Logging
 logging.basicConfig(
@@ -24,6 +25,8 @@ class CaptureApp:
     # Init Nothing
     def __init__(self):
         self.driver = None
+        self.profile_name = None
+        self.timeouts = timeouts.policy_for('.')
         self.csv_file = "dashboard_links.csv"
         self._init_csv()
     # CSV
@@ -52,13 +55,8 @@ class CaptureApp:
 
     # Init Chrome Driver
     def configure_driver(self, headless=True):
-        options = webdriver.ChromeOptions()
-        # options.add_argument("--headless=new") # Headless
-        options.add_argument("--start-maximized")
-        options.add_argument("--no-sandbox")
-        options.add_argument("--disable-dev-shm-usage")
-        options.add_argument("--window-size=2560,1440") # 2K
-        self.driver = webdriver.Chrome(options=options)
+        profile = browser_profile.get_profile(self.profile_name, headless=headless, window_size=(2560, 1440)) # 2K
+        self.driver = profile.create_driver('grafana')
 
     # Find Dashboard Name by UID
     def find_dashboard_by_uid(self, grafana_url: str, grafana_username: str, grafana_password: str):
@@ -86,12 +84,13 @@ class CaptureApp:
     def capture_grafana(self, args):
         """Capture Grafana dashboards with Selenium"""
         try:
+            self.timeouts = timeouts.policy_for(args.grafana_output_dir)
             self.configure_driver(headless=not args.debug)
             #### LOGIN GRAFANA
             grafana_login_url = f"{args.grafana_url.split('/d/')[0]}/login"
             self.driver.get(grafana_login_url)
             try:
-                WebDriverWait(self.driver, 15).until(
+                self.timeouts.wait(self.driver, 'grafana', 'login', 15,
                     EC.presence_of_element_located((By.NAME, "user")))
                 self.driver.find_element(By.NAME, "user").send_keys(args.grafana_username)
                 self.driver.find_element(By.NAME, "password").send_keys(args.grafana_password)
@@ -133,6 +132,7 @@ class CaptureApp:
                     output_path = os.path.join(args.grafana_output_dir, f"grafana_{dashboard}_{start_time}_{end_time}.png")
                     os.makedirs(args.grafana_output_dir, exist_ok=True)
                     self.driver.save_screenshot(output_path)
+                    self.driver.collect_network_stats()
                     logging.info(f"Saved Grafana screenshot: {output_path}")
                     
                 except Exception as e:
@@ -146,48 +146,13 @@ class CaptureApp:
     @staticmethod
     def parse_time_range(time_range: str) -> Tuple[int, int]:
         """Parse various time range formats to epoch milliseconds"""
-        now = datetime.now()
-        
-        if time_range.lower() == "now":
-            return int(now.timestamp() * 1000), int(now.timestamp() * 1000)
         try:
-            # Handle relative time ranges
-            if time_range.startswith("now-"):
-                parts = time_range.split()
-                duration = parts[0].split("-")[1]
-                unit = duration[-1]
-                value = int(duration[:-1])
-                # Time units
-                time_units = {
-                    's': 'seconds',
-                    'm': 'minutes',
-                    'h': 'hours',
-                    'd': 'days',
-                    'w': 'weeks'
-                }
-                # 
-                delta = timedelta(**{time_units[unit]: value})
-                start_time = now - delta
-                end_time = now if len(parts) == 1 else datetime.strptime(parts[1], "%Y:%m:%d-%H:%M:%S")
-                # Return time as Unix epoch
-                return (
-                    int(start_time.timestamp() * 1000),
-                    int(end_time.timestamp() * 1000)
-                )
-            # Handle absolute time ranges
-            if " to " in time_range:
-                start_str, end_str = time_range.split(" to ")
-                start_time = datetime.strptime(start_str, "%Y:%m:%d-%H:%M:%S")
-                end_time = datetime.strptime(end_str, "%Y:%m:%d-%H:%M:%S")
-                # Return time as Unix epoch
-                return (
-                    int(start_time.timestamp() * 1000),
-                    int(end_time.timestamp() * 1000)
-                )
-        except Exception as e:
+            start_time, end_time = time_expr.parse_range(time_range)
+        except ValueError as e:
             logging.error(f"Invalid time format: {time_range}")
             raise ValueError(f"Unsupported time range format: {time_range}") from e
-        return 0, 0
+        # Return time as Unix epoch
+        return int(start_time.timestamp() * 1000), int(end_time.timestamp() * 1000)
 
 def main():
     app = CaptureApp()
@@ -197,6 +162,8 @@ def main():
     parent_parser = argparse.ArgumentParser(add_help=False)
     parent_parser.add_argument("--debug", action="store_true",
                               help="Debug mode")
+    parent_parser.add_argument("--browser-profile", choices=list(browser_profile.PROFILES),
+                              help="Chrome profile (default: $CAPTURE_BROWSER_PROFILE or 'screenshot')")
 
     # Platform subparsers
     subparsers = parser.add_subparsers(dest="platform", required=True)
@@ -228,6 +195,7 @@ def main():
     splunk_parser.add_argument("--splunk-time-range", default="now-1h", help="Time range (e.g., 'now-2h now', 'today')")
 
     args = parser.parse_args()
+    app.profile_name = args.browser_profile
 
     try:
         # Dispatch to appropriate capture method
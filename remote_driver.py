@@ -0,0 +1,95 @@
+import os
+import json
+import logging
+import threading
+from typing import Dict, List, Optional
+from urllib.request import urlopen
+
+import superfake
+
+# Selenium Grid backend: browsers run on grid nodes (CAPTURE_SELENIUM_GRID, e.g.
+# http://selenium-hub:4444), each CaptureApp holds one remote session, and jobs are
+# routed to the app that already has a login for the job's platform and base URL.
+# When the grid is down, browser_profile falls back to local Chrome.
+
+DEFAULT_LOCAL_SESSIONS = 2
+
+
+def grid_url() -> Optional[str]:
+    return os.environ.get('CAPTURE_SELENIUM_GRID') or None
+
+
+def grid_status(url: str, timeout: float = 5.0) -> Dict:
+    """Selenium Grid 4 /status payload"""
+    with urlopen(f"{url.rstrip('/')}/status", timeout=timeout) as response:
+        return json.load(response)['value']
+
+
+def grid_capacity(url: Optional[str] = None, default: int = DEFAULT_LOCAL_SESSIONS) -> int:
+    """Chrome session slots across all UP grid nodes (default when no grid is reachable)"""
+    url = url or grid_url()
+    if not url:
+        return default
+    try:
+        status = grid_status(url)
+    except Exception as e:
+        logging.warning(f"Selenium Grid {url} status unavailable: {str(e)}")
+        return default
+    slots = 0
+    for node in status.get('nodes', []):
+        if node.get('availability', 'UP') != 'UP':
+            continue
+        for slot in node.get('slots', []):
+            if slot.get('stereotype', {}).get('browserName', 'chrome') == 'chrome':
+                slots += 1
+    if not slots:
+        logging.warning(f"Selenium Grid {url} has no chrome slots, using {default} sessions")
+    return slots or default
+
+
+class SessionRouter:
+    """Pool of CaptureApps (one browser session each), capped at the grid's capacity"""
+    def __init__(self, size: int, profile_name: str = None):
+        self.size = size
+        self.profile_name = profile_name
+        self._cond = threading.Condition()
+        self._idle: List[superfake.CaptureApp] = []
+        self._created = 0
+        self.hits = 0
+        self.misses = 0
+
+    def acquire(self, job: Dict) -> superfake.CaptureApp:
+        """Take the idle app already logged in to the job's site, else a fresh or unused one"""
+        key = (job['platform'], job['url'])
+        with self._cond:
+            while True:
+                for app in self._idle:
+                    if key in app.sessions:
+                        self.hits += 1
+                        self._idle.remove(app)
+                        return app
+                if self._created < self.size:
+                    self._created += 1
+                    self.misses += 1
+                    return superfake.CaptureApp(profile_name=self.profile_name)
+                if self._idle:
+                    # Prefer evicting an app with no logins over one with useful sessions
+                    app = min(self._idle, key=lambda a: len(a.sessions))
+                    self._idle.remove(app)
+                    self.misses += 1
+                    return app
+                self._cond.wait()
+
+    def release(self, app: superfake.CaptureApp, broken: bool = False):
+        if broken:
+            # Don't route the next job onto a wedged session
+            app.close()
+        with self._cond:
+            self._idle.append(app)
+            self._cond.notify()
+
+    def close(self):
+        with self._cond:
+            for app in self._idle:
+                app.close()
+            logging.info(f"Session router: {self.hits} session reuses, {self.misses} new logins or sessions")
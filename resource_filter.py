@@ -0,0 +1,203 @@
+import os
+import re
+import json
+import logging
+import threading
+from typing import Dict, List, Optional
+from urllib.parse import urlsplit
+
+# Per-platform blocking of resources that never show up in a captured panel:
+# fonts, avatars, news feeds, telemetry beacons and update checks.
+# Patterns use Network.setBlockedURLs wildcard syntax ('*' only).
+
+PLATFORM_FILTERS: Dict[str, List[str]] = {
+    'grafana': [
+        "*/public/fonts/*",
+        "*/avatar/*",
+        "*gravatar.com*",
+        "*/api/news*",
+        "*/api/frontend-metrics*",
+        "*/api/live/*",
+        "*/api/gnet/*",
+        "*://grafana.com/api/*",
+        "*/public/img/bg/*",
+    ],
+    'dynatrace': [
+        "*/rb_*",
+        "*/bf?type=*",
+        "*/ui/api/v1/notifications*",
+        "*/whatsnew*",
+        "*/fonts/*",
+        "*gravatar.com*",
+        "*/ui/api/v1/user/avatar*",
+    ],
+    'splunk': [
+        "*/static/fonts/*",
+        "*/splunkd/__raw/services/messages*",
+        "*/splunkd/__raw/services/apps/local?*update*",
+        "*quickdraw.splunk.com*",
+        "*/splunkd/__raw/servicesNS/*/data/ui/nav*",
+        "*/account/insecurelogin*",
+        "*gravatar.com*",
+    ],
+}
+
+MODES = ('block', 'observe', 'off')
+
+
+def _compile(pattern: str) -> re.Pattern:
+    return re.compile('.*'.join(re.escape(part) for part in pattern.split('*')) + r'\Z')
+
+
+def _size_key(url: str) -> str:
+    parts = urlsplit(url)
+    return f"{parts.netloc}{parts.path}"
+
+
+class FilterStats:
+    """Counters for one filter session"""
+    def __init__(self):
+        self.requests_total = 0
+        self.bytes_transferred = 0
+        self.requests_blocked = 0
+        self.bytes_saved = 0
+        self.by_pattern: Dict[str, int] = {}
+
+    def as_dict(self) -> Dict:
+        return {
+            'requests_total': self.requests_total,
+            'bytes_transferred': self.bytes_transferred,
+            'requests_blocked': self.requests_blocked,
+            'bytes_saved': self.bytes_saved,
+            'by_pattern': dict(self.by_pattern),
+        }
+
+
+class ResourceFilter:
+    """Block (or just observe) non-essential requests for one platform"""
+    _sizes_lock = threading.Lock()
+
+    def __init__(self, platform: str, patterns: Optional[List[str]] = None, mode: str = 'block',
+                 sizes_path: Optional[str] = None):
+        if mode not in MODES:
+            raise ValueError(f"Unknown resource filter mode: {mode} (choose from {', '.join(MODES)})")
+        self.platform = platform
+        self.mode = mode
+        self.patterns = list(PLATFORM_FILTERS.get(platform, []) if patterns is None else patterns)
+        self._compiled = [(p, _compile(p)) for p in self.patterns]
+        self.sizes_path = sizes_path
+        self.stats = FilterStats()
+        self._urls: Dict[str, str] = {}
+        self._observed: Dict[str, int] = {}
+
+    def match(self, url: str) -> Optional[str]:
+        """Return the first pattern matching url, if any"""
+        for pattern, regex in self._compiled:
+            if regex.match(url):
+                return pattern
+        return None
+
+    @property
+    def blocked_urls(self) -> List[str]:
+        return self.patterns if self.mode == 'block' else []
+
+    def _load_sizes(self) -> Dict[str, int]:
+        if not self.sizes_path or not os.path.exists(self.sizes_path):
+            return {}
+        try:
+            with open(self.sizes_path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _save_sizes(self, observed: Dict[str, int]):
+        if not self.sizes_path or not observed:
+            return
+        with self._sizes_lock:
+            sizes = self._load_sizes()
+            sizes.update(observed)
+            tmp_path = f"{self.sizes_path}.tmp"
+            with open(tmp_path, 'w') as f:
+                json.dump(sizes, f, indent=1, sort_keys=True)
+            os.replace(tmp_path, self.sizes_path)
+
+    def collect(self, driver):
+        """Drain Chrome's performance log into the stats (needs goog:loggingPrefs)"""
+        if self.mode == 'off':
+            return
+        try:
+            entries = driver.get_log('performance')
+        except Exception as e:
+            logging.debug(f"No performance log available: {str(e)}")
+            return
+        known_sizes = self._load_sizes() if self.mode == 'block' else {}
+        for entry in entries:
+            try:
+                message = json.loads(entry['message'])['message']
+            except (KeyError, ValueError):
+                continue
+            method, params = message.get('method'), message.get('params', {})
+            request_id = params.get('requestId')
+            if method == 'Network.requestWillBeSent':
+                self._urls[request_id] = params['request']['url']
+            elif method == 'Network.loadingFinished':
+                url = self._urls.pop(request_id, '')
+                size = int(params.get('encodedDataLength', 0))
+                self.stats.requests_total += 1
+                self.stats.bytes_transferred += size
+                pattern = self.match(url) if url else None
+                if pattern and self.mode == 'observe':
+                    # Would have been blocked: count it as the saving blocking buys
+                    self._count(pattern, size)
+                    self._observed[_size_key(url)] = size
+            elif method == 'Network.loadingFailed':
+                url = self._urls.pop(request_id, '')
+                if params.get('blockedReason') == 'inspector':
+                    self._count(self.match(url) or 'blocklist', known_sizes.get(_size_key(url), 0))
+        if self._observed:
+            self._save_sizes(self._observed)
+            self._observed = {}
+
+    def _count(self, pattern: str, size: int):
+        self.stats.requests_blocked += 1
+        self.stats.bytes_saved += size
+        self.stats.by_pattern[pattern] = self.stats.by_pattern.get(pattern, 0) + 1
+
+    def report(self):
+        """Log what this filter saved"""
+        if self.mode == 'off':
+            return
+        stats = self.stats
+        verb = 'blocked' if self.mode == 'block' else 'would block'
+        # Blocked requests never finish, observed ones are already in requests_total
+        total = stats.requests_total + (stats.requests_blocked if self.mode == 'block' else 0)
+        logging.info(
+            f"Resource filter [{self.platform}]: {verb} {stats.requests_blocked}/{total} requests, "
+            f"saved ~{stats.bytes_saved / 1024:.1f} KB "
+            f"({stats.bytes_transferred / 1024:.1f} KB transferred)"
+        )
+        for pattern, count in sorted(stats.by_pattern.items(), key=lambda item: -item[1]):
+            logging.info(f"  {pattern}: {count}")
+
+
+def load_filters(path: str) -> Dict[str, List[str]]:
+    """Read {platform: [patterns]} overrides from a JSON file"""
+    with open(path) as f:
+        filters = json.load(f)
+    if not isinstance(filters, dict):
+        raise ValueError(f"Resource filter file must map platform to pattern list: {path}")
+    return filters
+
+
+def from_env(platform: str) -> ResourceFilter:
+    """Filter configured by $CAPTURE_RESOURCE_FILTER (block/observe/off),
+    $CAPTURE_RESOURCE_FILTER_FILE and $CAPTURE_RESOURCE_SIZES"""
+    patterns = None
+    if os.environ.get('CAPTURE_RESOURCE_FILTER_FILE'):
+        patterns = load_filters(os.environ['CAPTURE_RESOURCE_FILTER_FILE']).get(platform)
+    return ResourceFilter(
+        platform,
+        patterns=patterns,
+        mode=os.environ.get('CAPTURE_RESOURCE_FILTER', 'block'),
+        sizes_path=os.environ.get('CAPTURE_RESOURCE_SIZES', 'resource_sizes.json'),
+    )
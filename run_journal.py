@@ -0,0 +1,172 @@
+import os
+import json
+import uuid
+import hashlib
+import logging
+import threading
+from datetime import datetime
+from typing import Dict, List, Optional, Set
+
+import device_metrics
+import time_expr
+
+# Journal for batch (--jobs) runs, so a run killed halfway can be resumed.
+#
+# <output_dir>/runs/<run_id>.jsonl starts with the run's job list, with every
+# relative time range pinned to the absolute window it had when the run started;
+# each completed capture then appends its (dashboard, window) key, file path,
+# size and sha256, and those of its extra resolutions. --resume <run_id> re-runs
+# only the jobs without an entry whose file is still present and intact.
+
+SECRET_FIELDS = ('password', 'token')
+# CLI defaults that only apply to one platform's jobs (--token is a Dynatrace API token)
+PLATFORM_DEFAULTS = {'token': 'dynatrace', 'management_zone': 'dynatrace'}
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+
+
+def job_key(job: Dict) -> str:
+    dashboard = job.get('dashboard_id') or job.get('dashboard_name')
+    variables = ''.join(f"&{name}={value}" for name, value in sorted((job.get('variables') or {}).items()))
+    if job.get('panel_id'):
+        variables += f"#panel{job['panel_id']}"
+    if job.get('search_id'):
+        variables += f"#search{job['search_id']}"
+    if job.get('management_zone'):
+        variables += f"@mz{job['management_zone']}"
+    render = f"|{job['render']}" if job.get('render') else ''
+    if job.get('resolutions'):
+        render += f"|res.{job['resolutions'] if isinstance(job['resolutions'], str) else ','.join(job['resolutions'])}"
+    if job.get('export'):
+        render += f"|export.{job['export']}"
+    return f"{job['platform']}|{job['url']}|{dashboard}{variables}|{job['time_range']}{render}"
+
+
+def defaults_for(defaults: Dict, platform: str) -> Dict:
+    """The set defaults that apply to a job of platform"""
+    return {k: v for k, v in (defaults or {}).items()
+            if v is not None and PLATFORM_DEFAULTS.get(k, platform) == platform}
+
+
+def pin_window(job: Dict, parse_time_range) -> Dict:
+    """Replace a relative time range with the absolute window it means now"""
+    start, end = parse_time_range(job['time_range'])
+    return {**job, 'time_range': time_expr.format_range(start, end)}
+
+
+def file_digest(path: str) -> str:
+    sha = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+def file_entry(path: str) -> Dict:
+    return {'file_path': path, 'bytes': os.path.getsize(path), 'sha256': file_digest(path)}
+
+
+def intact(entry: Dict) -> bool:
+    """The recorded capture and its extra resolutions are still on disk with the same sizes and checksums"""
+    return _intact_file(entry) and all(_intact_file(variant) for variant in entry.get('variants', []))
+
+
+def _intact_file(entry: Dict) -> bool:
+    path = entry.get('file_path')
+    try:
+        if not path or os.path.getsize(path) != entry['bytes']:
+            return False
+        if path.endswith('.png'):
+            with open(path, 'rb') as f:
+                if f.read(len(PNG_SIGNATURE)) != PNG_SIGNATURE:
+                    return False
+        return file_digest(path) == entry['sha256']
+    except (OSError, KeyError):
+        return False
+
+
+class RunJournal:
+    """Append-only progress log of one batch run"""
+    def __init__(self, path: str, run_id: str, jobs: List[Dict], done: Optional[Dict[str, Dict]] = None):
+        self.path = path
+        self.run_id = run_id
+        self.jobs = jobs
+        self.done = done or {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _path(output_dir: str, run_id: str) -> str:
+        return os.path.join(output_dir, 'runs', f"{run_id}.jsonl")
+
+    @classmethod
+    def create(cls, output_dir: str, jobs: List[Dict], parse_time_range) -> 'RunJournal':
+        """Start a new run: pin time windows and write the job list"""
+        run_id = f"{datetime.now().strftime('%Y%m%dT%H%M%S')}-{uuid.uuid4().hex[:6]}"
+        jobs = [pin_window(job, parse_time_range) for job in jobs]
+        journal = cls(cls._path(output_dir, run_id), run_id, jobs)
+        os.makedirs(os.path.dirname(journal.path), exist_ok=True)
+        journal._append({
+            'type': 'run',
+            'run_id': run_id,
+            'started_at': datetime.now().isoformat(),
+            'jobs': [{k: v for k, v in job.items() if k not in SECRET_FIELDS} for job in jobs],
+        })
+        return journal
+
+    @classmethod
+    def open(cls, output_dir: str, run_id: str) -> 'RunJournal':
+        """Load an earlier run's jobs and completed captures"""
+        path = cls._path(output_dir, run_id)
+        if not os.path.exists(path):
+            raise ValueError(f"No journal for run {run_id} in {os.path.dirname(path)}")
+        jobs, done = [], {}
+        with open(path) as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # Last line may be cut short by the crash that ended the run
+                    continue
+                if entry.get('type') == 'run':
+                    jobs = entry['jobs']
+                elif entry.get('type') == 'done':
+                    done[entry['key']] = entry
+        return cls(path, run_id, jobs, done)
+
+    def remaining(self, defaults: Dict = None) -> List[Dict]:
+        """Jobs still to capture; credentials come from defaults since the journal has none"""
+        jobs = []
+        for job in self.jobs:
+            entry = self.done.get(job_key(job))
+            if entry and intact(entry):
+                continue
+            if entry:
+                logging.warning(f"Recapturing {job_key(job)}: {entry['file_path']} (or one of its extra "
+                                f"resolutions) is missing or damaged")
+            credentials = defaults_for(defaults, job.get('platform'))
+            jobs.append({**{k: v for k, v in credentials.items() if k in SECRET_FIELDS + ('username',)}, **job})
+        return jobs
+
+    def record(self, job: Dict, file_path: str):
+        """Note a completed capture and its extra resolutions (call after the files are written)"""
+        entry = {
+            'type': 'done',
+            'key': job_key(job),
+            **file_entry(file_path),
+            'at': datetime.now().isoformat(),
+        }
+        if job.get('resolutions'):
+            entry['variants'] = [file_entry(device_metrics.variant_path(file_path, resolution))
+                                 for resolution in device_metrics.parse(job['resolutions'])]
+        with self._lock:
+            self._append(entry)
+            self.done[entry['key']] = entry
+
+    def files(self) -> Set[str]:
+        """Every file the run's completed captures wrote, extra resolutions included"""
+        return {item['file_path'] for entry in self.done.values() for item in [entry, *entry.get('variants', [])]}
+
+    def _append(self, entry: Dict):
+        with open(self.path, 'a') as f:
+            f.write(json.dumps(entry) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
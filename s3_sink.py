@@ -0,0 +1,168 @@
+import os
+import io
+import time
+import queue
+import logging
+import mimetypes
+import threading
+from typing import List, Optional, Set
+
+# S3 upload needs boto3
+try:
+    import boto3
+    from boto3.s3.transfer import TransferConfig
+    from botocore.config import Config
+except ImportError:
+    boto3 = None
+
+# Output sink: captures and the capture history also go to S3-compatible object
+# storage (AWS S3, MinIO, Ceph RGW...), so they outlive ephemeral Jenkins agents.
+#
+# Screenshots are uploaded from the PNG bytes the browser returned rather than
+# read back from disk; data exports and the history are streamed from their
+# files. Uploads run on CAPTURE_S3_WORKERS threads behind a queue of at most
+# CAPTURE_S3_QUEUE files: a slow bucket holds captures back instead of piling up
+# screenshots in memory. Files over CAPTURE_S3_PART_MB go up as multipart
+# uploads, several parts at a time; failed uploads are retried with backoff.
+# Keys are $CAPTURE_S3_PREFIX plus the path relative to the output dir.
+# Credentials come from the usual AWS_* variables or config files.
+
+DEFAULT_WORKERS = 4
+DEFAULT_QUEUE = 16
+DEFAULT_PART_MB = 8
+# Parts of one upload in flight at once
+DEFAULT_PART_CONCURRENCY = 4
+DEFAULT_RETRIES = 3
+
+
+class S3Sink:
+    """Background uploader of capture outputs to one bucket"""
+    def __init__(self, bucket: str, prefix: str = '', endpoint_url: str = None,
+                 workers: int = DEFAULT_WORKERS, queue_size: int = DEFAULT_QUEUE,
+                 part_mb: int = DEFAULT_PART_MB, part_concurrency: int = DEFAULT_PART_CONCURRENCY,
+                 retries: int = DEFAULT_RETRIES, client=None):
+        if client is None and boto3 is None:
+            raise ValueError("S3 upload needs boto3 (pip install boto3)")
+        self.bucket = bucket
+        self.prefix = prefix.strip('/')
+        self.retries = retries
+        # One retry layer, _upload's: botocore's own retries would multiply with it
+        self.client = client or boto3.client('s3', endpoint_url=endpoint_url, config=Config(
+            retries={'total_max_attempts': 1, 'mode': 'standard'},
+            max_pool_connections=workers * part_concurrency,
+        ))
+        self.transfer = TransferConfig(multipart_threshold=part_mb * 1024 * 1024,
+                                       multipart_chunksize=part_mb * 1024 * 1024,
+                                       max_concurrency=part_concurrency)
+        self.uploaded = 0
+        self.failed: List[str] = []
+        self._queue = queue.Queue(maxsize=queue_size)
+        # Files queued to upload from disk: queueing one again before it starts is a no-op
+        self._queued_files: Set[str] = set()
+        self._lock = threading.Lock()
+        self._threads = [threading.Thread(target=self._worker, name=f"s3-upload-{n}", daemon=True)
+                         for n in range(workers)]
+        for thread in self._threads:
+            thread.start()
+
+    def key(self, file_path: str, output_dir: str) -> str:
+        path = os.path.relpath(file_path, output_dir).replace(os.sep, '/')
+        if path.startswith('../'):
+            path = os.path.basename(file_path)
+        return f"{self.prefix}/{path}" if self.prefix else path
+
+    def put(self, file_path: str, output_dir: str, data: bytes = None):
+        """Queue an upload of file_path (or of data, its contents); blocks while the queue is full"""
+        if data is None:
+            with self._lock:
+                if file_path in self._queued_files:
+                    return
+                self._queued_files.add(file_path)
+        self._queue.put((file_path, output_dir, data))
+
+    def _worker(self):
+        while True:
+            item = self._queue.get()
+            try:
+                if item is None:
+                    return
+                file_path, output_dir, data = item
+                if data is None:
+                    with self._lock:
+                        self._queued_files.discard(file_path)
+                self._upload(file_path, self.key(file_path, output_dir), data)
+            finally:
+                self._queue.task_done()
+
+    def _upload(self, file_path: str, key: str, data: bytes = None):
+        extra = {'ContentType': mimetypes.guess_type(file_path)[0] or 'application/octet-stream'}
+        for attempt in range(1, self.retries + 1):
+            try:
+                with (io.BytesIO(data) if data is not None else open(file_path, 'rb')) as body:
+                    self.client.upload_fileobj(body, self.bucket, key, ExtraArgs=extra, Config=self.transfer)
+                with self._lock:
+                    self.uploaded += 1
+                logging.debug(f"Uploaded s3://{self.bucket}/{key}")
+                return
+            except Exception as e:
+                # A file gone from disk won't come back by retrying
+                if attempt == self.retries or isinstance(e, FileNotFoundError):
+                    logging.error(f"Upload of {file_path} to s3://{self.bucket}/{key} failed: {str(e)}")
+                    with self._lock:
+                        self.failed.append(key)
+                    return
+                logging.warning(f"Upload of {file_path} failed ({str(e)}), retrying")
+                time.sleep(2 ** attempt)
+
+    def flush(self) -> List[str]:
+        """Wait for queued uploads; returns the keys that failed so far"""
+        self._queue.join()
+        return list(self.failed)
+
+    def close(self):
+        """Finish queued uploads and stop the workers"""
+        self.flush()
+        for _ in self._threads:
+            self._queue.put(None)
+        for thread in self._threads:
+            thread.join()
+        logging.info(f"Uploaded {self.uploaded} files to s3://{self.bucket}/{self.prefix}"
+                     f"{f', {len(self.failed)} failed' if self.failed else ''}")
+
+
+def from_env() -> Optional[S3Sink]:
+    """S3Sink configured by $CAPTURE_S3_* (None unless CAPTURE_S3_BUCKET is set)"""
+    bucket = os.environ.get('CAPTURE_S3_BUCKET')
+    if not bucket:
+        return None
+    return S3Sink(
+        bucket,
+        prefix=os.environ.get('CAPTURE_S3_PREFIX', ''),
+        endpoint_url=os.environ.get('CAPTURE_S3_ENDPOINT'),
+        workers=int(os.environ.get('CAPTURE_S3_WORKERS', DEFAULT_WORKERS)),
+        queue_size=int(os.environ.get('CAPTURE_S3_QUEUE', DEFAULT_QUEUE)),
+        part_mb=int(os.environ.get('CAPTURE_S3_PART_MB', DEFAULT_PART_MB)),
+        retries=int(os.environ.get('CAPTURE_S3_RETRIES', DEFAULT_RETRIES)),
+    )
+
+
+_shared: Optional[S3Sink] = None
+_shared_lock = threading.Lock()
+
+
+def shared() -> Optional[S3Sink]:
+    """Process-wide sink, or None unless $CAPTURE_S3_BUCKET is set"""
+    global _shared
+    with _shared_lock:
+        if _shared is None:
+            _shared = from_env()
+        return _shared
+
+
+def close_shared():
+    """Finish the process-wide sink's uploads (call before exiting)"""
+    global _shared
+    with _shared_lock:
+        sink, _shared = _shared, None
+    if sink:
+        sink.close()
@@ -0,0 +1,152 @@
+import os
+import re
+import logging
+import xml.etree.ElementTree as ET
+from datetime import datetime
+from typing import Dict, Iterator, List, Tuple
+from urllib.parse import urlparse
+
+import requests
+from requests.auth import HTTPBasicAuth
+
+# Splunk REST API client (management port, 8089 by default).
+#
+# Dashboards are read as Simple XML from data/ui/views; their searches are run
+# through the export endpoint with the same earliest/latest the capture URLs use.
+# $CAPTURE_SPLUNK_REST_URL overrides the REST address derived from the web URL,
+# CAPTURE_SPLUNK_VERIFY=0 accepts Splunk's default self-signed certificate.
+
+DEFAULT_REST_PORT = 8089
+# $token$ references in Simple XML searches
+TOKEN_REF = re.compile(r'\$([^$\s]+)\$')
+
+
+def rest_url(web_url: str) -> str:
+    """REST base URL for a Splunk web URL (same host, management port)"""
+    if os.environ.get('CAPTURE_SPLUNK_REST_URL'):
+        return os.environ['CAPTURE_SPLUNK_REST_URL'].rstrip('/')
+    parsed = urlparse(web_url if '://' in web_url else f"https://{web_url}")
+    return f"https://{parsed.hostname}:{DEFAULT_REST_PORT}"
+
+
+def time_bounds(start_date: datetime, end_date: datetime) -> Tuple[str, str]:
+    """earliest/latest as epoch seconds, as in the dashboard capture URLs"""
+    return str(start_date.timestamp()), str(end_date.timestamp())
+
+
+class SplunkAPI:
+    """Pooled session against one Splunk management endpoint, basic auth or token"""
+    def __init__(self, base_url: str, username: str = None, password: str = None, token: str = None,
+                 app: str = 'search', timeout: float = 30):
+        self.base_url = base_url.rstrip('/')
+        self.app = app
+        self.timeout = timeout
+        self.session = requests.Session()
+        self.session.verify = os.environ.get('CAPTURE_SPLUNK_VERIFY', '1') != '0'
+        if token:
+            self.session.headers['Authorization'] = f"Bearer {token}"
+        elif username:
+            self.session.auth = HTTPBasicAuth(username, password)
+
+    @classmethod
+    def for_job(cls, job: Dict) -> 'SplunkAPI':
+        return cls(rest_url(job['url']), job.get('username'), job.get('password'), job.get('token'),
+                   job.get('app') or 'search')
+
+    def get(self, path: str, **params):
+        response = self.session.get(f"{self.base_url}{path}", params={'output_mode': 'json', **params},
+                                    timeout=self.timeout)
+        response.raise_for_status()
+        return response.json()
+
+    def post(self, path: str, data: Dict):
+        response = self.session.post(f"{self.base_url}{path}", data={'output_mode': 'json', **data},
+                                     timeout=self.timeout)
+        response.raise_for_status()
+        return response.json()
+
+    def dashboard_xml(self, name: str) -> str:
+        result = self.get(f"/servicesNS/-/{self.app}/data/ui/views/{name}")
+        return result['entry'][0]['content']['eai:data']
+
+    def dashboard_version(self, name: str) -> str:
+        """When the dashboard was last changed"""
+        return self.get(f"/servicesNS/-/{self.app}/data/ui/views/{name}")['entry'][0]['updated']
+
+    def dashboard_searches(self, name: str, earliest: str, latest: str) -> List[Dict]:
+        """Searches of a Simple XML dashboard, tokens filled in:
+        [{'id', 'search', 'earliest', 'latest', 'post_process', 'has_post_process'}]"""
+        return dashboard_searches(self.dashboard_xml(name), earliest, latest)
+
+    def export(self, search: str, earliest: str, latest: str, output_mode: str = 'csv') -> Iterator[str]:
+        """Run a search through the export endpoint and yield its result lines as Splunk streams them,
+        line endings and blank lines kept (quoted CSV fields span lines: multi-line _raw events)"""
+        response = self.session.post(f"{self.base_url}/servicesNS/-/{self.app}/search/jobs/export", data={
+            'search': _search_command(search), 'earliest_time': earliest, 'latest_time': latest,
+            'output_mode': output_mode,
+        }, timeout=self.timeout, stream=True)
+        with response:
+            response.raise_for_status()
+            # Splunk sends UTF-8 whatever the Content-Type says; split on \n only, so \r\n stays whole
+            response.encoding = 'utf-8'
+            pending = ''
+            for chunk in response.iter_content(chunk_size=64 * 1024, decode_unicode=True):
+                *lines, pending = (pending + chunk).split('\n')
+                for line in lines:
+                    yield f"{line}\n"
+            if pending:
+                yield pending
+
+
+def _search_command(search: str) -> str:
+    """Searches from dashboards may leave out the leading search command"""
+    return search if search.lstrip().startswith(('search ', '|')) else f"search {search}"
+
+
+def dashboard_searches(xml: str, earliest: str, latest: str) -> List[Dict]:
+    """Searches in Simple XML: base searches, post-process searches (base | query) and saved search refs.
+    Time tokens ($x.earliest$/$x.latest$) become the window, other tokens their input default or *"""
+    root = ET.fromstring(xml)
+    tokens = {}
+    for field in root.iter('input'):
+        default = field.find('default')
+        if field.get('token') and default is not None and default.text:
+            tokens[field.get('token')] = default.text.strip()
+
+    def fill(text: str) -> str:
+        def substitute(match):
+            token = match.group(1)
+            if token.endswith('.earliest'):
+                return earliest
+            if token.endswith('.latest'):
+                return latest
+            return tokens.get(token, tokens.get(token.replace('form.', '', 1), '*'))
+        return TOKEN_REF.sub(substitute, text or '').strip()
+
+    searches, by_id = [], {}
+    for n, search in enumerate(root.iter('search')):
+        query = search.findtext('query') or search.findtext('searchString')
+        if search.get('ref'):
+            query = f"| savedsearch \"{search.get('ref')}\""
+        if not query:
+            continue
+        entry = {
+            'id': search.get('id') or f"search{n}",
+            'search': fill(query),
+            'earliest': fill(search.findtext('earliest')) or earliest,
+            'latest': fill(search.findtext('latest')) or latest,
+            'base': search.get('base'),
+            'has_post_process': False,
+        }
+        by_id[entry['id']] = entry
+        searches.append(entry)
+    for entry in searches:
+        base = by_id.get(entry.pop('base') or '')
+        entry['post_process'] = base is not None
+        if base:
+            base['has_post_process'] = True
+            # Post-process searches run on their base search's results
+            entry['search'] = f"{base['search']} | {entry['search'].lstrip('|').strip()}"
+            entry['earliest'], entry['latest'] = base['earliest'], base['latest']
+    logging.debug(f"Dashboard has {len(searches)} searches")
+    return searches
@@ -0,0 +1,148 @@
+import os
+import re
+import csv
+import json
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Dict, List, Tuple
+
+import splunk_api
+from splunk_api import SplunkAPI
+
+# Table images are optional
+try:
+    from PIL import Image, ImageDraw, ImageFont
+except ImportError:
+    Image = None
+
+# Splunk dashboards as data: each panel search runs through the REST export
+# endpoint and its results stream straight to CSV or JSON, no browser.
+#
+# Base searches that only feed post-process searches are not exported on their
+# own; the post-process search is run as "<base> | <post-process>". With
+# table_image a PNG of the first rows is drawn next to the data file (Pillow).
+
+EXPORT_FORMATS = ['csv', 'json']
+TABLE_IMAGE_ROWS = 40
+TABLE_IMAGE_CELL_CHARS = 40
+DEFAULT_WORKERS = 4
+
+
+def panel_searches(searches: List[Dict]) -> List[Dict]:
+    """Searches whose results a panel shows (bases feeding post-process searches left out)"""
+    return [s for s in searches if not s['has_post_process']]
+
+
+def export_search(api: SplunkAPI, search: Dict, fmt: str, file_path: str, table_image: bool = False) -> int:
+    """Stream one search's results to file_path; returns the row count"""
+    header, sample, count = [], [], 0
+    lines = api.export(search['search'], search['earliest'], search['latest'], output_mode=fmt)
+    with open(file_path, 'w', newline='') as f:
+        if fmt == 'csv':
+            writer = csv.writer(f)
+            for row in csv.reader(lines):
+                writer.writerow(row)
+                if not header:
+                    header = row
+                    continue
+                count += 1
+                if len(sample) < TABLE_IMAGE_ROWS:
+                    sample.append(row)
+        else:
+            # One JSON object per line from Splunk; previews of reporting searches are skipped
+            f.write('[')
+            for line in lines:
+                if not line.strip():
+                    continue
+                message = json.loads(line)
+                if message.get('preview') or 'result' not in message:
+                    continue
+                result = message['result']
+                f.write((',\n' if count else '\n') + json.dumps(result))
+                count += 1
+                header = header or list(result)
+                if len(sample) < TABLE_IMAGE_ROWS:
+                    sample.append([_cell(result.get(column)) for column in header])
+            f.write('\n]\n')
+    if table_image:
+        render_table(header, sample, count, f"{os.path.splitext(file_path)[0]}.png")
+    logging.info(f"Exported {count} rows of search {search['id']} to {file_path}")
+    return count
+
+
+def _cell(value) -> str:
+    # Multivalue fields come back as lists
+    return ', '.join(value) if isinstance(value, list) else '' if value is None else str(value)
+
+
+def render_table(header: List[str], rows: List[List[str]], total: int, file_path: str):
+    """Plain PNG table of the first rows (needs Pillow)"""
+    if Image is None:
+        raise ValueError("Table images need Pillow (pip install pillow)")
+    font = ImageFont.load_default()
+    clip = [[str(cell)[:TABLE_IMAGE_CELL_CHARS] for cell in row] for row in [header] + rows]
+    widths = [max(font.getbbox(row[i] if i < len(row) else '')[2] for row in clip) + 16
+              for i in range(len(header))]
+    row_height = font.getbbox('Ag')[3] + 10
+    footer = f"{len(rows)} of {total} rows" if total > len(rows) else ''
+    image = Image.new('RGB', (max(sum(widths), 200), row_height * (len(clip) + (1 if footer else 0))), 'white')
+    draw = ImageDraw.Draw(image)
+    draw.rectangle([0, 0, image.width, row_height], fill='#e8e8e8')
+    for n, row in enumerate(clip):
+        x, y = 0, n * row_height
+        for width, cell in zip(widths, row):
+            draw.text((x + 8, y + 5), cell, fill='black', font=font)
+            x += width
+        draw.line([0, y + row_height - 1, image.width, y + row_height - 1], fill='#d0d0d0')
+    if footer:
+        draw.text((8, len(clip) * row_height + 5), footer, fill='#666666', font=font)
+    image.save(file_path)
+
+
+def export_filename(dashboard_name: str, search_id: str, start_label: str, end_label: str, fmt: str) -> str:
+    safe_name = dashboard_name.replace(' ', '_').replace('/', '-')
+    return re.sub(r'[^\w.@-]', '_', f"{safe_name}_search-{search_id}_{start_label}_{end_label}") + f".{fmt}"
+
+
+def export_dashboard(api: SplunkAPI, dashboard_name: str, earliest: str, latest: str, output_dir: str,
+                     fmt: str = 'csv', table_image: bool = False, labels: Tuple[str, str] = None,
+                     workers: int = DEFAULT_WORKERS) -> List[str]:
+    """Export every panel search of a dashboard, searches running in parallel; returns the files written"""
+    searches = panel_searches(api.dashboard_searches(dashboard_name, earliest, latest))
+    os.makedirs(output_dir, exist_ok=True)
+    start_label, end_label = labels or (earliest, latest)
+    paths = [os.path.join(output_dir, export_filename(dashboard_name, s['id'], start_label, end_label, fmt))
+             for s in searches]
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='splunk-export') as pool:
+        futures = [pool.submit(export_search, api, search, fmt, path, table_image)
+                   for search, path in zip(searches, paths)]
+        for future in futures:
+            future.result()
+    return paths
+
+
+def expand_job(job: Dict, api: SplunkAPI = None) -> List[Dict]:
+    """Splunk export job without a search_id (or with "*"): one job per panel search"""
+    if job.get('platform') != 'splunk' or not job.get('export') or job.get('search_id') not in (None, '*'):
+        return [job]
+    api = api or SplunkAPI.for_job(job)
+    # Search ids don't depend on the window; tokens are filled with placeholders here
+    searches = panel_searches(api.dashboard_searches(job['dashboard_name'], 'earliest', 'latest'))
+    return [{**job, 'search_id': search['id']} for search in searches]
+
+
+def export_job(job: Dict, start_date: datetime, end_date: datetime, api: SplunkAPI = None) -> str:
+    """Export the job's one search over the window; returns the file written"""
+    api = api or SplunkAPI.for_job(job)
+    earliest, latest = splunk_api.time_bounds(start_date, end_date)
+    searches = {s['id']: s for s in api.dashboard_searches(job['dashboard_name'], earliest, latest)}
+    if job.get('search_id') not in searches:
+        raise ValueError(f"Dashboard {job['dashboard_name']} has no search {job.get('search_id')}")
+    output_dir = os.path.join(job['output_dir'], 'splunk')
+    os.makedirs(output_dir, exist_ok=True)
+    file_path = os.path.join(output_dir, export_filename(
+        job['dashboard_name'], job['search_id'], start_date.strftime('%Y%m%dT%H%M%S'),
+        end_date.strftime('%Y%m%dT%H%M%S'), job['export']))
+    export_search(api, searches[job['search_id']], job['export'], file_path, bool(job.get('table_image')))
+    return file_path
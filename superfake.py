@@ -1,17 +1,37 @@
 import argparse
+import atexit
 import csv
 import os
 import sys
+import re
 import json
-from datetime import datetime, timedelta
+import hashlib
+import threading
+from datetime import datetime
 from pathlib import Path
-from selenium import webdriver
 from selenium.webdriver.common.by import By
-from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
-from urllib.parse import urlparse
+from urllib.parse import urlparse, quote
 import logging
-from typing import Tuple, Dict
+from typing import Tuple, Dict, List, Optional
+import auto_crop
+import browser_profile
+import browser_watchdog
+import capture_report
+import capture_store
+import device_metrics
+import dynatrace_api
+import dynatrace_export
+import grafana_api
+import mail_delivery
+import panel_export
+import prefetch
+import s3_sink
+import splunk_api
+import splunk_export
+import time_expr
+import timelapse
+import timeouts
 
 logging.basicConfig(
     level=logging.INFO,
@@ -19,44 +39,244 @@ logging.basicConfig(
     handlers=[logging.FileHandler("capture.log"), logging.StreamHandler()]
 )
 
+PLATFORMS = ['grafana', 'dynatrace', 'splunk']
+
+# full: the dashboard as a user sees it. kiosk: the platform's chromeless view, with the
+# viewport grown to the whole dashboard so lazily loaded panels render too.
+# solo: one Grafana panel per capture via /d-solo/ (other platforms use kiosk).
+RENDER_MODES = ['full', 'kiosk', 'solo']
+CHROMELESS_PARAMS = {
+    'grafana': '&kiosk',
+    'dynatrace': '&kioskMode=true',
+    'splunk': '&hideChrome=true&hideEdit=true&hideSplunkBar=true&hideAppBar=true&hideFooter=true',
+}
+MAX_PAGE_HEIGHT = 16384
+WINDOW_SIZE = (1920, 1080)
+# Grafana grid: 24 columns across the viewport, 30 px rows plus 8 px gutters
+GRAFANA_ROW_PX = 38
+
+# Counts in-flight Grafana datasource queries so a variable switch can wait for just those
+TRACK_QUERIES_JS = """
+if (!window.__captureQueries) {
+  var c = window.__captureQueries = {started: 0, pending: 0, switchedAt: 0};
+  var isQuery = function (u) { return /\\/api\\/(ds\\/query|datasources\\/proxy|tsdb)/.test(String(u)); };
+  var done = function () { c.pending = Math.max(0, c.pending - 1); };
+  var fetch0 = window.fetch;
+  window.fetch = function (input) {
+    var q = isQuery(input && input.url || input);
+    if (q) { c.started++; c.pending++; }
+    var p = fetch0.apply(this, arguments);
+    if (q) { p.then(done, done); }
+    return p;
+  };
+  var open0 = XMLHttpRequest.prototype.open, send0 = XMLHttpRequest.prototype.send;
+  XMLHttpRequest.prototype.open = function (m, u) { this.__captureQuery = isQuery(u); return open0.apply(this, arguments); };
+  XMLHttpRequest.prototype.send = function () {
+    if (this.__captureQuery) { c.started++; c.pending++; this.addEventListener('loadend', done); }
+    return send0.apply(this, arguments);
+  };
+}
+"""
+
+# Change the URL in place and let Grafana's router pick it up, without a reload
+SWITCH_VARIABLES_JS = """
+var c = window.__captureQueries;
+if (!c) { return -1; }
+c.switchedAt = Date.now();
+window.history.pushState(window.history.state, '', arguments[0]);
+window.dispatchEvent(new PopStateEvent('popstate', {state: window.history.state}));
+return c.started;
+"""
+
+# Settled once the switch started queries (or stayed quiet for a second) and all returned
+QUERIES_SETTLED_JS = """
+var c = window.__captureQueries;
+return (c.started > arguments[0] || Date.now() - c.switchedAt > 1000) && c.pending === 0;
+"""
+
+# Start a settle window for QUERIES_SETTLED_JS; returns the query count so far
+MARK_SWITCH_JS = "var c = window.__captureQueries; c.switchedAt = Date.now(); return c.started;"
+
+# Tallest scroll container on the page (Grafana scrolls inside a div, not the body)
+PAGE_HEIGHT_JS = """
+var h = document.documentElement.scrollHeight;
+document.querySelectorAll('div').forEach(function (e) { if (e.scrollHeight > h) { h = e.scrollHeight; } });
+return h;
+"""
+
+# Outermost panel elements by platform, reported with their titles for auto_crop ($CAPTURE_PANEL_BOXES)
+PANEL_SELECTORS = {
+    'grafana': '.react-grid-item, .panel-container',
+    'dynatrace': '[data-tile-id], .tile',
+    'splunk': '.dashboard-panel',
+}
+PANEL_BOXES_JS = """
+var selector = arguments[0], boxes = [];
+document.querySelectorAll(selector).forEach(function (e) {
+  if (e.parentElement && e.parentElement.closest(selector)) { return; }
+  var r = e.getBoundingClientRect();
+  if (r.width < 1 || r.height < 1) { return; }
+  var title = e.querySelector('h2, h6, .panel-title, .tile-title, .panel-head h3');
+  boxes.push({x: r.left, y: r.top, width: r.width, height: r.height, title: title ? title.textContent.trim() : ''});
+});
+return {ratio: window.devicePixelRatio || 1, boxes: boxes};
+"""
+
+# Data export (--export) formats by platform
+EXPORT_FORMATS = {'grafana': panel_export.EXPORT_FORMATS, 'dynatrace': dynatrace_export.EXPORT_FORMATS,
+                  'splunk': splunk_export.EXPORT_FORMATS}
+
+# Several CaptureApps (daemon workers, parallel platforms) may share one history file
+_history_lock = threading.Lock()
+
+def validate_job(job: Dict) -> Dict:
+    """Check a capture job dict (same keys as the CLI options) and fill defaults"""
+    job = dict(job)
+    if job.get('platform') not in PLATFORMS:
+        raise ValueError(f"Unknown platform: {job.get('platform')}")
+    if not job.get('url'):
+        raise ValueError("Job requires url")
+    job.setdefault('time_range', 'now-1h')
+    job.setdefault('output_dir', './captures')
+    if job['platform'] == 'grafana' and (not job.get('dashboard_id') or not job.get('datasource')):
+        raise ValueError("Grafana requires --dashboard-id and --datasource")
+    if job['platform'] == 'dynatrace' and not job.get('dashboard_id'):
+        raise ValueError("Dynatrace requires --dashboard-id")
+    if job['platform'] == 'splunk' and not job.get('dashboard_name'):
+        raise ValueError("Splunk requires --dashboard-name")
+    if job.get('render') and job['render'] not in RENDER_MODES:
+        raise ValueError(f"Unknown render mode: {job['render']} (choose from {', '.join(RENDER_MODES)})")
+    if job.get('export'):
+        formats = EXPORT_FORMATS[job['platform']]
+        if job['export'] not in formats:
+            raise ValueError(f"Unknown {job['platform']} export format: {job['export']} "
+                             f"(choose from {', '.join(formats)})")
+        if job['platform'] == 'dynatrace' and not job.get('token'):
+            raise ValueError("Dynatrace data export requires an API token (--token)")
+    if job.get('window_step') and not time_expr.STEP.match(str(job['window_step'])):
+        raise ValueError(f"Unsupported window step: {job['window_step']} (e.g. 1h, 1d, 1w, 1M)")
+    if job.get('resolutions'):
+        if job.get('export'):
+            raise ValueError("Extra resolutions are for screenshots, not data exports")
+        device_metrics.parse(job['resolutions'])
+    if job.get('management_zone') and job['platform'] != 'dynatrace':
+        raise ValueError("Management zones are Dynatrace only")
+    if job.get('variables'):
+        if job['platform'] != 'grafana':
+            raise ValueError("Template variables are Grafana only")
+        if not isinstance(job['variables'], dict) or any(
+                v is None or v == '*' or isinstance(v, (list, dict)) for v in job['variables'].values()):
+            raise ValueError("Job variables must map each name to one value (expand matrices first)")
+    return job
+
+def expand_job(job: Dict) -> List[Dict]:
+    """A job as the single captures it describes: Grafana variable matrix x solo/exported panels,
+    Splunk exported searches, each over every window of a window_step"""
+    return [single for grafana_job in grafana_api.expand_job(job)
+            for splunk_job in splunk_export.expand_job(grafana_job)
+            for single in time_expr.expand_job(splunk_job)]
+
+def render_mode(job: Dict) -> str:
+    """Job's render mode, else $CAPTURE_RENDER_MODE, else full; solo is Grafana only"""
+    mode = job.get('render') or os.environ.get('CAPTURE_RENDER_MODE') or 'full'
+    return 'kiosk' if mode == 'solo' and job['platform'] != 'grafana' else mode
+
 class CaptureApp:
-    def __init__(self):
+    def __init__(self, profile_name: str = None):
         self.driver = None
+        self.profile_name = profile_name
+        # (platform, base_url) pairs logged in on the current browser
+        self.sessions = set()
+        # When set, history rows wait in pending_history until flush_history()
+        self.defer_history = False
+        self.pending_history = []
+        # Adaptive waits, backed by render_history.csv in the current output dir
+        self.timeouts = timeouts.policy_for('./captures')
+        self.watchdog = None
+        # Warms backend queries ahead of captures when $CAPTURE_PREFETCH_LEAD is set
+        self.prefetcher = prefetch.shared(self.parse_time_range)
+        # Dashboard currently loaded for in-place variable switching
+        self.grafana_page = None
+        # Serves captures of past windows again without a browser when $CAPTURE_STORE_DIR is set
+        self.store = capture_store.from_env()
+        # Metadata of the capture the current thread just saved (export jobs run on several threads)
+        self._last_capture = threading.local()
+        # Uploads captures and the history to object storage when $CAPTURE_S3_BUCKET is set
+        self.sink = s3_sink.shared()
         self.csv_columns = [
             'platform', 'dashboard_name', 'dashboard_id', 'datasource',
             'start_date', 'end_date', 'capture_time', 'file_path', 'url'
         ]
 
-    def _init_webdriver(self, headless=True):
-        options = webdriver.ChromeOptions()
-        if headless:
-            options.add_argument("--headless=new")
-        options.add_argument("--no-sandbox")
-        options.add_argument("--disable-dev-shm-usage")
-        options.add_argument("--window-size=1920,1080")
-        self.driver = webdriver.Chrome(options=options)
+    def _init_webdriver(self, headless=True, platform='default'):
+        profile = browser_profile.get_profile(self.profile_name, headless=headless, window_size=WINDOW_SIZE)
+        self.driver = profile.create_driver(platform)
+        self.watchdog = browser_watchdog.from_env(self.driver)
+        self.sessions = set()
+        self.grafana_page = None
+        self.window_size = WINDOW_SIZE
+
+    def close(self):
+        """Quit the browser and forget its logins"""
+        watchdog, self.watchdog = self.watchdog, None
+        if watchdog:
+            watchdog.stop()
+        try:
+            if self.driver:
+                self.driver.quit()
+        except Exception as e:
+            # A browser the watchdog killed can't be quit cleanly
+            if not (watchdog and watchdog.tripped):
+                raise
+            logging.debug(f"Quit after watchdog kill: {str(e)}")
+        finally:
+            self.driver = None
+            self.sessions = set()
 
     def _save_metadata(self, args: Dict, start_date: datetime, end_date: datetime, file_path: str):
         """Save dashboard metadata to CSV with append mode"""
+        self._last_capture.metadata = args
+        self._last_capture.window = (start_date, end_date)
+        if self.defer_history:
+            self.pending_history.append((args, start_date, end_date, file_path))
+            return
         csv_path = os.path.join(args['output_dir'], 'capture_history.csv')
-        file_exists = os.path.exists(csv_path)
         
-        with open(csv_path, 'a', newline='') as csvfile:
-            writer = csv.DictWriter(csvfile, fieldnames=self.csv_columns)
-            if not file_exists:
-                writer.writeheader()
-            
-            writer.writerow({
-                'platform': args['platform'],
-                'dashboard_name': args['dashboard_name'],
-                'dashboard_id': args['dashboard_id'],
-                'datasource': args.get('datasource', 'N/A'),
-                'start_date': start_date.isoformat(),
-                'end_date': end_date.isoformat(),
-                'capture_time': datetime.now().isoformat(),
-                'file_path': file_path,
-                'url': args['url']
-            })
+        with _history_lock:
+            file_exists = os.path.exists(csv_path)
+            with open(csv_path, 'a', newline='') as csvfile:
+                writer = csv.DictWriter(csvfile, fieldnames=self.csv_columns)
+                if not file_exists:
+                    writer.writeheader()
+                
+                writer.writerow({
+                    'platform': args['platform'],
+                    'dashboard_name': args['dashboard_name'],
+                    'dashboard_id': args['dashboard_id'],
+                    'datasource': args.get('datasource', 'N/A'),
+                    'start_date': start_date.isoformat(),
+                    'end_date': end_date.isoformat(),
+                    'capture_time': datetime.now().isoformat(),
+                    'file_path': file_path,
+                    'url': args['url']
+                })
+        if self.sink:
+            # Screenshots go up from the bytes the browser returned, anything else from its file
+            png, self._last_capture.png = getattr(self._last_capture, 'png', None), None
+            self.sink.put(file_path, args['output_dir'], png[1] if png and png[0] == file_path else None)
+            self.sink.put(csv_path, args['output_dir'])
+
+    def flush_history(self, discard: bool = False):
+        """Write (or drop) deferred history rows"""
+        pending, self.pending_history = self.pending_history, []
+        if discard:
+            return
+        defer, self.defer_history = self.defer_history, False
+        try:
+            for row in pending:
+                self._save_metadata(*row)
+        finally:
+            self.defer_history = defer
 
     def _construct_filename(self, args: Dict, start_date: datetime, end_date: datetime) -> str:
         """Generate filename based on requirements"""
@@ -64,242 +284,603 @@ class CaptureApp:
         ds_name = args.get('datasource', 'unknown').replace(' ', '_')
         start_str = start_date.strftime('%Y%m%dT%H%M%S')
         end_str = end_date.strftime('%Y%m%dT%H%M%S')
+        # Template variable values and solo panel, e.g. _host-web01_env-prod_panel-4
+        var_str = re.sub(r'[^\w.-]', '_', ''.join(
+            f"_{name}-{value}" for name, value in (args.get('variables') or {}).items()))
+        if args.get('panel_id'):
+            var_str += f"_panel-{args['panel_id']}"
         
-        return f"{safe_name}_{args['dashboard_id']}_{ds_name}_{start_str}_{end_str}.png"
+        return f"{safe_name}_{args['dashboard_id']}_{ds_name}{var_str}_{start_str}_{end_str}.png"
 
-    def capture_grafana(self, base_url: str, dashboard_uid: str, time_range: str, 
-                       datasource: str, output_dir: str, credentials: Dict):
-        """Capture Grafana dashboard with Selenium"""
+    def _screenshot(self, file_path: str):
+        """Save the page screenshot, keeping the PNG for the output sink"""
+        png = self.driver.get_screenshot_as_png()
+        # Replace rather than rewrite: the old file may share its inode with a capture store object
+        temp_path = f"{file_path}.part-{threading.get_ident()}"
+        with open(temp_path, 'wb') as f:
+            f.write(png)
+        os.replace(temp_path, file_path)
+        if self.sink:
+            self._last_capture.png = (file_path, png)
+
+    def _wait(self, platform: str, dashboard: str, default: float, condition):
+        return self.timeouts.wait(self.driver, platform, dashboard, default, condition)
+
+    def _resize(self, width: int, height: int):
+        if (width, height) != self.window_size:
+            self.driver.set_window_size(width, height)
+            self.window_size = (width, height)
+
+    def _render_eagerly(self, platform: str, dashboard: str):
+        """Grow the viewport to the whole dashboard so panels below the fold load too"""
+        self.driver.execute_script(TRACK_QUERIES_JS)
+        height = min(int(self.driver.execute_script(PAGE_HEIGHT_JS)), MAX_PAGE_HEIGHT)
+        if height <= self.window_size[1]:
+            return
+        before = self.driver.execute_script(MARK_SWITCH_JS)
+        self._resize(WINDOW_SIZE[0], height)
+        self._wait(platform, f"{dashboard}:eager", 30,
+                   lambda driver: driver.execute_script(QUERIES_SETTLED_JS, before))
+
+    def _record_panel_boxes(self, platform: str, file_path: str):
+        """Write where the page's panels are (for auto_crop) next to the screenshot just taken"""
         try:
-            self._init_webdriver()
-            # Login
-            self.driver.get(f"{base_url.split('/d/'[0])}/login")
-            # login_url = f"{url.split('/d/')[0]}/login"
-            WebDriverWait(self.driver, 15).until(EC.presence_of_element_located((By.NAME, "user")))
-            self.driver.find_element(By.NAME, "user").send_keys(credentials['username'])
-            self.driver.find_element(By.NAME, "password").send_keys(credentials['password'])
-            self.driver.find_element(By.CSS_SELECTOR, "button[type='submit']").click()
-            
+            boxes = self.driver.execute_script(PANEL_BOXES_JS, PANEL_SELECTORS[platform])
+            with open(auto_crop.boxes_path(file_path), 'w') as f:
+                json.dump(boxes, f)
+        except Exception as e:
+            logging.warning(f"Could not record panel boxes for {file_path}: {str(e)}")
+
+    def _capture_resolutions(self, job: Dict, file_path: str):
+        """Screenshots of the page just captured at the job's extra resolutions, without reloading it"""
+        metadata, (start_date, end_date) = self._last_capture.metadata, self._last_capture.window
+        dashboard = job.get('dashboard_id') or job['dashboard_name']
+        self.driver.execute_script(TRACK_QUERIES_JS)
+        try:
+            for resolution in device_metrics.parse(job['resolutions']):
+                before = self.driver.execute_script(MARK_SWITCH_JS)
+                device_metrics.apply(self.driver, resolution)
+                self._wait(job['platform'], f"{dashboard}:resolution", 30,
+                           lambda driver: driver.execute_script("return window.__captureRelayout === true;")
+                           and driver.execute_script(QUERIES_SETTLED_JS, before))
+                variant = device_metrics.variant_path(file_path, resolution)
+                self._screenshot(variant)
+                if os.environ.get('CAPTURE_PANEL_BOXES'):
+                    self._record_panel_boxes(job['platform'], variant)
+                self._save_metadata(metadata, start_date, end_date, variant)
+        finally:
+            device_metrics.clear(self.driver)
+
+    def login(self, platform: str, base_url: str, credentials: Dict):
+        """Log in unless this browser already holds a session for base_url"""
+        if (platform, base_url) in self.sessions:
+            return
+        getattr(self, f"_login_{platform}")(base_url, credentials)
+        self.sessions.add((platform, base_url))
+
+    def _login_grafana(self, base_url: str, credentials: Dict):
+        self.driver.get(f"{base_url.split('/d/')[0]}/login")
+        self._wait('grafana', 'login', 15, EC.presence_of_element_located((By.NAME, "user")))
+        self.driver.find_element(By.NAME, "user").send_keys(credentials['username'])
+        self.driver.find_element(By.NAME, "password").send_keys(credentials['password'])
+        self.driver.find_element(By.CSS_SELECTOR, "button[type='submit']").click()
+
+    def _login_dynatrace(self, base_url: str, credentials: Dict):
+        self.driver.get(f"{base_url}/login")
+        self._wait('dynatrace', 'login', 15, EC.presence_of_element_located((By.ID, "email")))
+        self.driver.find_element(By.ID, "email").send_keys(credentials['username'])
+        self.driver.find_element(By.ID, "password").send_keys(credentials['password'])
+        self.driver.find_element(By.CSS_SELECTOR, "button[type='submit']").click()
+
+    def _login_splunk(self, base_url: str, credentials: Dict):
+        self.driver.get(f"{base_url}/en-GB/account/login")
+        self._wait('splunk', 'login', 15, EC.presence_of_element_located((By.ID, "username")))
+        self.driver.find_element(By.ID, "username").send_keys(credentials['username'])
+        self.driver.find_element(By.ID, "password").send_keys(credentials['password'])
+        self.driver.find_element(By.CSS_SELECTOR, "button[type='submit']").click()
+
+    def _grafana_page(self, base_url: str, dashboard_uid: str, time_range: str,
+                      datasource: str, output_dir: str, variables: Dict = None,
+                      render: str = 'full', panel_id: int = None) -> str:
+        """Screenshot a Grafana dashboard (or one panel, in solo mode) on the logged-in browser.
+        With template variables, a dashboard that is already loaded is switched in place"""
+        if render == 'solo' and not panel_id:
+            raise ValueError("Solo render mode needs a panel_id")
+        page = self.grafana_page
+        if not (variables and render != 'solo' and page
+                and page['key'] == (base_url, dashboard_uid, time_range, render)
+                and f"/d/{dashboard_uid}" in self.driver.current_url):
+            page = None
+        if page:
+            dashboard_name, start_date, end_date = page['name'], page['start'], page['end']
+        else:
             # Get dashboard info
             self.driver.get(f"{base_url}/api/dashboards/uid/{dashboard_uid}")
             dashboard_info = json.loads(self.driver.find_element(By.TAG_NAME, 'pre').text)
             dashboard_name = dashboard_info['dashboard']['title']
-            
-            # Construct URL with time range
             start_date, end_date = self.parse_time_range(time_range)
-            url = (f"{base_url}/d/{dashboard_uid}"
-                  f"?from={int(start_date.timestamp() * 1000)}"
-                  f"&to={int(end_date.timestamp() * 1000)}")
-            
-            # Capture screenshot
+        
+        # Construct URL with time range
+        window = f"from={int(start_date.timestamp() * 1000)}&to={int(end_date.timestamp() * 1000)}"
+        if render == 'solo':
+            url = f"{base_url}/d-solo/{dashboard_uid}?panelId={panel_id}&{window}"
+        else:
+            url = f"{base_url}/d/{dashboard_uid}?{window}"
+        url += ''.join(f"&var-{quote(str(name))}={quote(str(value))}" for name, value in (variables or {}).items())
+        if render == 'kiosk':
+            url += CHROMELESS_PARAMS['grafana']
+        
+        # Capture screenshot
+        before = self.driver.execute_script(SWITCH_VARIABLES_JS, url) if page else -1
+        if before >= 0:
+            self._wait('grafana', f"{dashboard_uid}:variables", 30,
+                       lambda driver: driver.execute_script(QUERIES_SETTLED_JS, before))
+        else:
+            if render == 'solo':
+                # Viewport the size the panel has on its dashboard
+                grid = self._grafana_panel(dashboard_info['dashboard'], panel_id).get('gridPos', {})
+                self._resize(WINDOW_SIZE[0] * grid.get('w', 12) // 24, GRAFANA_ROW_PX * grid.get('h', 8))
+            else:
+                self._resize(*WINDOW_SIZE)
             self.driver.get(url)
-            WebDriverWait(self.driver, 30).until(
-                EC.visibility_of_element_located((By.CLASS_NAME, "panel-container"))
-            )
-            # Create directory structure
-            save_dir = os.path.join(output_dir, 'grafana', datasource)
-            os.makedirs(save_dir, exist_ok=True)
-            
-            filename = self._construct_filename({
-                'platform': 'grafana',
-                'dashboard_name': dashboard_name,
-                'dashboard_id': dashboard_uid,
-                'datasource': datasource,
-                'url': url
-            }, start_date, end_date)
-            
-            file_path = os.path.join(save_dir, filename)
-            self.driver.save_screenshot(file_path)
-            
-            # Save metadata
-            self._save_metadata({
-                'platform': 'grafana',
-                'dashboard_name': dashboard_name,
-                'dashboard_id': dashboard_uid,
-                'datasource': datasource,
-                'output_dir': output_dir,
-                'url': url
-            }, start_date, end_date, file_path)
-            
-            return file_path
-            
+            self._wait('grafana', f"{dashboard_uid}:{panel_id}" if panel_id else dashboard_uid, 30,
+                       EC.visibility_of_element_located((By.CLASS_NAME, "panel-container")))
+            if render == 'kiosk':
+                self._render_eagerly('grafana', dashboard_uid)
+            self.grafana_page = None
+            if variables and render != 'solo':
+                self.driver.execute_script(TRACK_QUERIES_JS)
+                self.grafana_page = {'key': (base_url, dashboard_uid, time_range, render), 'name': dashboard_name,
+                                     'start': start_date, 'end': end_date}
+        # Create directory structure
+        save_dir = os.path.join(output_dir, 'grafana', datasource)
+        os.makedirs(save_dir, exist_ok=True)
+        
+        filename = self._construct_filename({
+            'platform': 'grafana',
+            'dashboard_name': dashboard_name,
+            'dashboard_id': dashboard_uid,
+            'datasource': datasource,
+            'variables': variables,
+            'panel_id': panel_id,
+            'url': url
+        }, start_date, end_date)
+        
+        file_path = os.path.join(save_dir, filename)
+        self._screenshot(file_path)
+        self.driver.collect_network_stats()
+        
+        # Save metadata
+        self._save_metadata({
+            'platform': 'grafana',
+            'dashboard_name': dashboard_name,
+            'dashboard_id': dashboard_uid,
+            'datasource': datasource,
+            'output_dir': output_dir,
+            'url': url
+        }, start_date, end_date, file_path)
+        
+        return file_path
+
+    @staticmethod
+    def _grafana_panel(dashboard: Dict, panel_id) -> Dict:
+        """Panel by id, including panels nested in collapsed rows"""
+        for panel in dashboard.get('panels', []):
+            for candidate in [panel] + panel.get('panels', []):
+                if str(candidate.get('id')) == str(panel_id):
+                    return candidate
+        raise ValueError(f"Dashboard {dashboard.get('uid')} has no panel {panel_id}")
+
+    def _dynatrace_page(self, base_url: str, dashboard_id: str, time_range: str,
+                        output_dir: str, render: str = 'full') -> str:
+        """Screenshot a Dynatrace dashboard on the logged-in browser"""
+        # Navigate to dashboard
+        start_date, end_date = self.parse_time_range(time_range)
+        url = (f"{base_url}/ui/dashboards/{dashboard_id}"
+              f"?gtf=CUSTOM&from={int(start_date.timestamp() * 1000)}"
+              f"&to={int(end_date.timestamp() * 1000)}")
+        if render != 'full':
+            url += CHROMELESS_PARAMS['dynatrace']
+        self._resize(*WINDOW_SIZE)
+        self.driver.get(url)
+        
+        # Get dashboard name
+        self._wait('dynatrace', dashboard_id, 30,
+                   EC.presence_of_element_located((By.CSS_SELECTOR, ".dashboard-title")))
+        if render != 'full':
+            self._render_eagerly('dynatrace', dashboard_id)
+        dashboard_name = self.driver.find_element(By.CSS_SELECTOR, ".dashboard-title").text
+        
+        # Capture screenshot
+        save_dir = os.path.join(output_dir, 'dynatrace')
+        os.makedirs(save_dir, exist_ok=True)
+        
+        filename = self._construct_filename({
+            'platform': 'dynatrace',
+            'dashboard_name': dashboard_name,
+            'dashboard_id': dashboard_id,
+            'url': url
+        }, start_date, end_date)
+        
+        file_path = os.path.join(save_dir, filename)
+        self._screenshot(file_path)
+        self.driver.collect_network_stats()
+        
+        # Save metadata
+        self._save_metadata({
+            'platform': 'dynatrace',
+            'dashboard_name': dashboard_name,
+            'dashboard_id': dashboard_id,
+            'output_dir': output_dir,
+            'url': url
+        }, start_date, end_date, file_path)
+        
+        return file_path
+
+    def _splunk_page(self, base_url: str, dashboard_name: str, time_range: str,
+                     output_dir: str, render: str = 'full') -> str:
+        """Screenshot a Splunk dashboard on the logged-in browser"""
+        # Navigate to dashboard
+        start_date, end_date = self.parse_time_range(time_range)
+        url = (f"{base_url}/en-GB/app/search/dashboard"
+              f"?earliest={start_date.timestamp()}"
+              f"&latest={end_date.timestamp()}"
+              f"&q=search%20dashboard%3D{dashboard_name}")
+        if render != 'full':
+            url += CHROMELESS_PARAMS['splunk']
+        self._resize(*WINDOW_SIZE)
+        self.driver.get(url)
+        
+        # Wait for dashboard load
+        self._wait('splunk', dashboard_name, 30,
+                   EC.presence_of_element_located((By.CLASS_NAME, "dashboard-container")))
+        if render != 'full':
+            self._render_eagerly('splunk', dashboard_name)
+        
+        # Capture screenshot
+        save_dir = os.path.join(output_dir, 'splunk')
+        os.makedirs(save_dir, exist_ok=True)
+        
+        # Splunk dashboards are addressed by name, which doubles as the ID
+        filename = self._construct_filename({
+            'platform': 'splunk',
+            'dashboard_name': dashboard_name,
+            'dashboard_id': dashboard_name,
+            'url': url
+        }, start_date, end_date)
+        
+        file_path = os.path.join(save_dir, filename)
+        self._screenshot(file_path)
+        self.driver.collect_network_stats()
+        
+        # Save metadata
+        self._save_metadata({
+            'platform': 'splunk',
+            'dashboard_name': dashboard_name,
+            'dashboard_id': dashboard_name,
+            'output_dir': output_dir,
+            'url': url
+        }, start_date, end_date, file_path)
+        
+        return file_path
+
+    def run_job(self, job: Dict, headless: bool = True) -> str:
+        """Capture one validated job dict, reusing the open browser and its logins.
+        If the watchdog kills the browser mid-capture the job is retried once on a fresh one.
+        Past windows already in the capture store are served from there (unless the job has extra resolutions)"""
+        key = self._store_key(job) if self.store and not job.get('resolutions') else None
+        if key:
+            entry = self.store.fetch(key, job['output_dir'])
+            if entry:
+                start_date, end_date = self.parse_time_range(job['time_range'])
+                dashboard = job.get('dashboard_id') or job['dashboard_name']
+                self._save_metadata({'dashboard_name': dashboard, 'dashboard_id': dashboard, **job,
+                                     **entry['metadata'], 'output_dir': job['output_dir']},
+                                    start_date, end_date, entry['file_path'])
+                return entry['file_path']
+        self._last_capture.metadata = None
+        file_path = self._capture_job(job, headless)
+        if key:
+            metadata = self._last_capture.metadata or {}
+            self.store.put(key, file_path, job['output_dir'], {
+                field: metadata[field] for field in ('dashboard_name', 'dashboard_id', 'datasource', 'url')
+                if field in metadata
+            })
+        return file_path
+
+    def _store_key(self, job: Dict) -> Optional[str]:
+        """Capture store key for a job over a window that is over, None when it can't be stored"""
+        start_date, end_date = self.parse_time_range(job['time_range'])
+        if not self.store.cacheable(end_date):
+            return None
+        version = self._dashboard_version(job)
+        if version is None:
+            return None
+        url = urlparse(job['url'])
+        return capture_store.capture_key({
+            'platform': job['platform'],
+            'instance': f"{url.scheme}://{url.netloc}{url.path.rstrip('/')}",
+            'dashboard': job.get('dashboard_id') or job.get('dashboard_name'),
+            'version': version,
+            'window': [int(start_date.timestamp()), int(end_date.timestamp())],
+            'render': render_mode(job) if not job.get('export') else None,
+            'profile': self.profile_name or os.environ.get('CAPTURE_BROWSER_PROFILE'),
+            'window_size': WINDOW_SIZE,
+            **{field: job.get(field) for field in ('datasource', 'variables', 'panel_id', 'search_id', 'export',
+                                                   'table_image', 'chart_image', 'management_zone')},
+        })
+
+    def _dashboard_version(self, job: Dict) -> Optional[str]:
+        """Version of the dashboard definition from the platform API, None when it can't be told"""
+        try:
+            if job['platform'] == 'grafana':
+                return str(grafana_api.GrafanaAPI.for_job(job).dashboard(job['dashboard_id'])['version'])
+            if job['platform'] == 'splunk':
+                return splunk_api.SplunkAPI.for_job(job).dashboard_version(job['dashboard_name'])
+            if job.get('token'):
+                # Dynatrace dashboards carry no version number: the definition itself is the version
+                dashboard = dynatrace_api.DynatraceAPI.for_job(job).dashboard(job['dashboard_id'])
+                return hashlib.sha256(json.dumps(dashboard, sort_keys=True).encode()).hexdigest()
+        except Exception as e:
+            logging.warning(f"No dashboard version for {job.get('dashboard_id') or job.get('dashboard_name')}, "
+                            f"capturing without the store: {str(e)}")
+        return None
+
+    def _capture_job(self, job: Dict, headless: bool) -> str:
+        if job.get('export'):
+            return self._export(job)
+        platform = job['platform']
+        dashboard = job.get('dashboard_id') or job['dashboard_name']
+        self.timeouts = timeouts.policy_for(job['output_dir'])
+        # Fail fast on dashboards that keep timing out
+        self.timeouts.check(platform, dashboard)
+        if self.prefetcher is None:
+            return self._run_attempts(job, headless)
+        # Queries warm up while the browser starts and logs in
+        self.prefetcher.schedule(job)
+        try:
+            file_path = self._run_attempts(job, headless)
+        except Exception:
+            self.prefetcher.discard(job)
+            raise
+        self.prefetcher.after_capture(job)
+        return file_path
+
+    def _run_attempts(self, job: Dict, headless: bool) -> str:
+        platform = job['platform']
+        dashboard = job.get('dashboard_id') or job['dashboard_name']
+        for attempt in (1, 2):
+            if self.watchdog and not self.watchdog.ping():
+                self.close()
+            if self.driver is None:
+                self._init_webdriver(headless=headless, platform=platform)
+            try:
+                if self.watchdog is None:
+                    return self._run_page(job)
+                with self.watchdog.capture(f"{platform} {dashboard}"):
+                    return self._run_page(job)
+            except browser_watchdog.BrowserRecycled as e:
+                self.close()
+                if attempt == 2:
+                    raise
+                logging.warning(f"Retrying {platform} {dashboard} on a fresh browser ({str(e)})")
+
+    def _export(self, job: Dict) -> str:
+        """Data export job: one Grafana panel's, Dynatrace dashboard's or Splunk search's results
+        through the platform API, no browser"""
+        part = {'grafana': 'panel_id', 'splunk': 'search_id'}.get(job['platform'])
+        if part and job.get(part) in (None, '*'):
+            raise ValueError(f"Export jobs take one {part} (expand the job first)")
+        start_date, end_date = self.parse_time_range(job['time_range'])
+        if job['platform'] == 'grafana':
+            dashboard, (file_path,) = panel_export.export_job(job, lambda time_range: (start_date, end_date))
+            name = dashboard['title']
+        elif job['platform'] == 'dynatrace':
+            dashboard, file_path = dynatrace_export.export_job(job, start_date, end_date)
+            name = dashboard.get('dashboardMetadata', {}).get('name') or job['dashboard_id']
+        else:
+            file_path = splunk_export.export_job(job, start_date, end_date)
+            name = job['dashboard_name']
+        self._save_metadata({**job, 'dashboard_name': name, 'dashboard_id': job.get('dashboard_id') or name},
+                            start_date, end_date, file_path)
+        return file_path
+
+    def _run_page(self, job: Dict) -> str:
+        platform = job['platform']
+        render = render_mode(job)
+        self.login(platform, job['url'], {'username': job.get('username'), 'password': job.get('password')})
+        if self.prefetcher:
+            self.prefetcher.before_capture(job)
+        if platform == 'grafana':
+            file_path = self._grafana_page(job['url'], job['dashboard_id'], job['time_range'],
+                                           job['datasource'], job['output_dir'], job.get('variables'),
+                                           render, job.get('panel_id'))
+        elif platform == 'dynatrace':
+            file_path = self._dynatrace_page(job['url'], job['dashboard_id'], job['time_range'],
+                                             job['output_dir'], render)
+        else:
+            file_path = self._splunk_page(job['url'], job['dashboard_name'], job['time_range'],
+                                          job['output_dir'], render)
+        if os.environ.get('CAPTURE_PANEL_BOXES') and render != 'solo':
+            self._record_panel_boxes(platform, file_path)
+        if job.get('resolutions'):
+            self._capture_resolutions(job, file_path)
+        return file_path
+
+    def capture_grafana(self, base_url: str, dashboard_uid: str, time_range: str, 
+                       datasource: str, output_dir: str, credentials: Dict):
+        """Capture Grafana dashboard with Selenium"""
+        try:
+            return self.run_job({
+                'platform': 'grafana', 'url': base_url, 'dashboard_id': dashboard_uid,
+                'time_range': time_range, 'datasource': datasource, 'output_dir': output_dir, **credentials
+            })
         finally:
-            if self.driver:
-                self.driver.quit()
+            self.close()
 
     def capture_dynatrace(self, base_url: str, dashboard_id: str, time_range: str, 
                          output_dir: str, credentials: Dict):
         """Capture Dynatrace dashboard with Selenium"""
         try:
-            self._init_webdriver()
-            
-            # Login
-            self.driver.get(f"{base_url}/login")
-            WebDriverWait(self.driver, 15).until(
-                EC.presence_of_element_located((By.ID, "email")))
-            self.driver.find_element(By.ID, "email").send_keys(credentials['username'])
-            self.driver.find_element(By.ID, "password").send_keys(credentials['password'])
-            self.driver.find_element(By.CSS_SELECTOR, "button[type='submit']").click()
-            
-            # Navigate to dashboard
-            start_date, end_date = self.parse_time_range(time_range)
-            url = (f"{base_url}/ui/dashboards/{dashboard_id}"
-                  f"?gtf=CUSTOM&from={int(start_date.timestamp() * 1000)}"
-                  f"&to={int(end_date.timestamp() * 1000)}")
-            self.driver.get(url)
-            
-            # Get dashboard name
-            WebDriverWait(self.driver, 30).until(
-                EC.presence_of_element_located((By.CSS_SELECTOR, ".dashboard-title")))
-            dashboard_name = self.driver.find_element(By.CSS_SELECTOR, ".dashboard-title").text
-            
-            # Capture screenshot
-            save_dir = os.path.join(output_dir, 'dynatrace')
-            os.makedirs(save_dir, exist_ok=True)
-            
-            filename = self._construct_filename({
-                'platform': 'dynatrace',
-                'dashboard_name': dashboard_name,
-                'dashboard_id': dashboard_id,
-                'url': url
-            }, start_date, end_date)
-            
-            file_path = os.path.join(save_dir, filename)
-            self.driver.save_screenshot(file_path)
-            
-            # Save metadata
-            self._save_metadata({
-                'platform': 'dynatrace',
-                'dashboard_name': dashboard_name,
-                'dashboard_id': dashboard_id,
-                'output_dir': output_dir,
-                'url': url
-            }, start_date, end_date, file_path)
-            
-            return file_path
-            
+            return self.run_job({
+                'platform': 'dynatrace', 'url': base_url, 'dashboard_id': dashboard_id,
+                'time_range': time_range, 'output_dir': output_dir, **credentials
+            })
         finally:
-            if self.driver:
-                self.driver.quit()
+            self.close()
 
     def capture_splunk(self, base_url: str, dashboard_name: str, time_range: str, 
                       output_dir: str, credentials: Dict):
         """Capture Splunk dashboard with Selenium"""
         try:
-            self._init_webdriver()
-            
-            # Login
-            self.driver.get(f"{base_url}/en-GB/account/login")
-            WebDriverWait(self.driver, 15).until(
-                EC.presence_of_element_located((By.ID, "username")))
-            self.driver.find_element(By.ID, "username").send_keys(credentials['username'])
-            self.driver.find_element(By.ID, "password").send_keys(credentials['password'])
-            self.driver.find_element(By.CSS_SELECTOR, "button[type='submit']").click()
-            
-            # Navigate to dashboard
-            start_date, end_date = self.parse_time_range(time_range)
-            url = (f"{base_url}/en-GB/app/search/dashboard"
-                  f"?earliest={start_date.timestamp()}"
-                  f"&latest={end_date.timestamp()}"
-                  f"&q=search%20dashboard%3D{dashboard_name}")
-            self.driver.get(url)
-            
-            # Wait for dashboard load
-            WebDriverWait(self.driver, 30).until(
-                EC.presence_of_element_located((By.CLASS_NAME, "dashboard-container")))
-            
-            # Capture screenshot
-            save_dir = os.path.join(output_dir, 'splunk')
-            os.makedirs(save_dir, exist_ok=True)
-            
-            filename = self._construct_filename({
-                'platform': 'splunk',
-                'dashboard_name': dashboard_name,
-                'url': url
-            }, start_date, end_date)
-            
-            file_path = os.path.join(save_dir, filename)
-            self.driver.save_screenshot(file_path)
-            
-            # Save metadata
-            self._save_metadata({
-                'platform': 'splunk',
-                'dashboard_name': dashboard_name,
-                'output_dir': output_dir,
-                'url': url
-            }, start_date, end_date, file_path)
-            
-            return file_path
-            
+            return self.run_job({
+                'platform': 'splunk', 'url': base_url, 'dashboard_name': dashboard_name,
+                'time_range': time_range, 'output_dir': output_dir, **credentials
+            })
         finally:
-            if self.driver:
-                self.driver.quit()
+            self.close()
 
     @staticmethod
     def parse_time_range(time_range: str) -> Tuple[datetime, datetime]:
-        """Parse complex time ranges including relative and absolute formats"""
-        now = datetime.now()
-        
-        # Handle relative time ranges
-        if time_range.startswith("now"):
-            parts = time_range.split()
-            duration = parts[0].split("-")
-            
-            if len(duration) > 1:
-                value = int(duration[1][:-1])
-                unit = duration[1][-1]
-                
-                unit_map = {
-                    's': 'seconds',
-                    'm': 'minutes',
-                    'h': 'hours',
-                    'd': 'days',
-                    'w': 'weeks'
-                }
-                
-                delta = timedelta(**{unit_map[unit]: value})
-                start = now - delta
-                end = now
-            else:
-                start = now
-                end = now
-        else:
-            # Handle absolute time ranges
-            try:
-                if ' to ' in time_range:
-                    start_str, end_str = time_range.split(' to ')
-                    start = datetime.fromisoformat(start_str)
-                    end = datetime.fromisoformat(end_str)
-                else:
-                    start = datetime.fromisoformat(time_range)
-                    end = now
-            except ValueError:
-                raise ValueError(f"Unsupported time format: {time_range}")
-
-        return start, end
+        """Parse relative (Grafana date math) and absolute time ranges, see time_expr"""
+        return time_expr.parse_range(time_range)
 
-if __name__ == "__main__":
-    app = CaptureApp()
-    
+def main():
     parser = argparse.ArgumentParser(description="Multi-platform Dashboard Capture Tool")
-    parser.add_argument("-p", "--platform", required=True, 
-                      choices=['grafana', 'dynatrace', 'splunk'])
-    parser.add_argument("-u", "--url", required=True, help="Base URL of the platform")
-    parser.add_argument("-n", "--dashboard-name", required=True, 
+    parser.add_argument("-p", "--platform", choices=PLATFORMS)
+    parser.add_argument("-u", "--url", help="Base URL of the platform")
+    parser.add_argument("-n", "--dashboard-name", 
                       help="Dashboard name/identifier")
     parser.add_argument("-i", "--dashboard-id", help="Dashboard ID (for Grafana/Dynatrace)")
     parser.add_argument("-d", "--datasource", help="Datasource name (Grafana only)")
     parser.add_argument("-t", "--time-range", default="now-1h", 
-                      help="Time range (e.g., 'now-2h', '2023-01-01T00:00:00 to 2023-01-02T00:00:00')")
+                      help="Time range (e.g., 'now-2h', 'now-7d/d to now/d', '2023-01-01T00:00:00 to 2023-01-02T00:00:00')")
+    parser.add_argument("--window-step", metavar="STEP",
+                      help="Capture the time range as consecutive windows of STEP (e.g. 1h, 1d, 1M)")
+    parser.add_argument("--timezone",
+                      help="Time zone for /d, /w... rounding (default: $CAPTURE_TIMEZONE or local time)")
     parser.add_argument("-o", "--output-dir", default="./captures",
                       help="Output directory for screenshots and metadata")
-    parser.add_argument("--username", required=True, help="Login username")
-    parser.add_argument("--password", required=True, help="Login password")
+    parser.add_argument("--username", help="Login username")
+    parser.add_argument("--password", help="Login password")
+    parser.add_argument("--browser-profile", choices=list(browser_profile.PROFILES),
+                      help="Chrome profile (default: $CAPTURE_BROWSER_PROFILE or 'screenshot')")
+    parser.add_argument("--render-mode", choices=RENDER_MODES,
+                      help="full page, chromeless kiosk view, or one Grafana panel per capture (default: $CAPTURE_RENDER_MODE or full)")
+    parser.add_argument("--resolutions", metavar="WxH[@SCALE],...",
+                      help="Also screenshot the loaded page at these resolutions, e.g. 2560x1440,1920x1080@0.25,mobile "
+                           f"(presets: {', '.join(device_metrics.PRESETS)})")
+    parser.add_argument("--panel-id", help="Grafana panel for --render-mode solo (default: every panel)")
+    parser.add_argument("--export", choices=sorted({f for formats in EXPORT_FORMATS.values() for f in formats}),
+                      help="Write the data instead of screenshots: Grafana panels via /api/ds/query (csv, parquet), "
+                           "Dynatrace tiles via the metrics v2 API (csv, parquet), "
+                           "Splunk searches via the REST export endpoint (csv, json); one file per panel/dashboard/search")
+    parser.add_argument("--token", help="API token (Dynatrace data export)")
+    parser.add_argument("-m", "--management-zone", help="Dynatrace management zone id or name (data export)")
+    parser.add_argument("--chart-image", action="store_true",
+                      help="With Dynatrace --export, also draw each chart tile as a PNG (needs Pillow)")
+    parser.add_argument("--table-image", action="store_true",
+                      help="With a Splunk --export, also draw each search's first rows as a PNG table")
+    parser.add_argument("--prefetch-lead", type=float, metavar="SECONDS",
+                      help="Fire dashboard queries this long before each capture to warm backend caches "
+                           "(default: $CAPTURE_PREFETCH_LEAD, off)")
+    parser.add_argument("--var", action="append", metavar="NAME[=V1,V2]",
+                      help="Grafana template variable to capture every value of (or the listed values); repeat for a matrix")
+    parser.add_argument("--crop", action="store_true",
+                      help="Afterwards crop the captures to their content and split them into panels (auto_crop.py)")
+    parser.add_argument("--report", action="store_true",
+                      help="Afterwards assemble the captures (of this run, with --jobs) into report.pdf and index.html")
+    parser.add_argument("--timelapse", choices=list(timelapse.FORMATS),
+                      help="Afterwards turn the dashboard's captures over the time range into a video "
+                           "(with --window-step)")
+    parser.add_argument("--timelapse-diff", action="store_true",
+                      help="Highlight what changed between frames of the timelapse")
+    parser.add_argument("--mail-to", default=os.environ.get('MAIL_RECEIVERS'), metavar="ADDRESSES",
+                      help="Mail the report (or the captures) to these comma-separated addresses "
+                           "(default: $MAIL_RECEIVERS)")
+    parser.add_argument("--jobs", metavar="FILE",
+                      help="JSON list of jobs for several platforms, captured concurrently (other options become job defaults)")
+    parser.add_argument("--resume", metavar="RUN_ID",
+                      help="Continue an interrupted --jobs run, skipping captures already done and intact")
+    parser.add_argument("--daemon", action="store_true",
+                      help="Keep browsers warm and accept capture jobs over HTTP (other options become job defaults)")
+    parser.add_argument("--listen", default="127.0.0.1:8765", help="Daemon listen address (host:port)")
+    parser.add_argument("--workers", type=int, default=2, help="Daemon browser workers (0: one per Selenium Grid slot)")
     
     args = parser.parse_args()
+    # Queued uploads finish whichever way main exits
+    atexit.register(s3_sink.close_shared)
+    if args.render_mode:
+        # Picked up by every capture path, including the one-shot capture_* calls
+        os.environ['CAPTURE_RENDER_MODE'] = args.render_mode
+    if args.prefetch_lead is not None:
+        os.environ['CAPTURE_PREFETCH_LEAD'] = str(args.prefetch_lead)
+    if args.timezone:
+        os.environ['CAPTURE_TIMEZONE'] = args.timezone
+    if args.crop:
+        # Panel boxes from the page beat guessing them from pixels
+        os.environ['CAPTURE_PANEL_BOXES'] = '1'
+
+    if args.daemon:
+        import capture_daemon
+        capture_daemon.serve(args)
+        sys.exit(0)
+
+    if args.jobs or args.resume:
+        import multi_capture
+        try:
+            ok = multi_capture.run(args.jobs, defaults={
+                'url': args.url, 'username': args.username, 'password': args.password,
+                'time_range': args.time_range, 'output_dir': args.output_dir, 'datasource': args.datasource,
+                'token': args.token, 'management_zone': args.management_zone,
+            }, profile_name=args.browser_profile, resume=args.resume, report=args.report,
+               mail_to=args.mail_to, crop=args.crop)
+        except Exception as e:
+            logging.error(f"Capture failed: {str(e)}")
+            sys.exit(1)
+        sys.exit(0 if ok else 1)
+
+    required = {'-p/--platform': args.platform, '-u/--url': args.url, '-n/--dashboard-name': args.dashboard_name}
+    if not (args.export and args.token):
+        # API exports with a token need no login
+        required.update({'--username': args.username, '--password': args.password})
+    missing = [flag for flag, value in required.items() if not value]
+    if missing:
+        parser.error(f"the following arguments are required: {', '.join(missing)}")
+    app = CaptureApp(profile_name=args.browser_profile)
+    started_at = datetime.now()
     
     try:
-        if args.platform == 'grafana':
+        if (args.export or args.window_step or args.resolutions
+                or (args.platform == 'grafana' and (args.var or args.render_mode == 'solo'))):
+            variables = {}
+            for var in args.var or []:
+                name, _, values = var.partition('=')
+                variables[name] = values.split(',') if values else None
+            jobs = [validate_job(job) for job in expand_job({**validate_job({
+                'platform': args.platform, 'url': args.url, 'dashboard_id': args.dashboard_id,
+                'dashboard_name': args.dashboard_name, 'datasource': args.datasource,
+                'time_range': args.time_range, 'output_dir': args.output_dir,
+                'username': args.username, 'password': args.password, 'render': args.render_mode,
+                'export': args.export, 'table_image': args.table_image, 'chart_image': args.chart_image,
+                'token': args.token, 'management_zone': args.management_zone, 'window_step': args.window_step,
+                'resolutions': args.resolutions,
+            }), 'variables': variables, 'panel_id': args.panel_id})]
+            if args.export:
+                import multi_capture
+                # No browser: the panel queries / searches run in parallel
+                results = multi_capture.run_exports(jobs)
+                failed = [r for r in results if r['status'] != 'ok']
+                if failed:
+                    raise RuntimeError(f"{len(failed)} of {len(results)} exports failed")
+            else:
+                try:
+                    for job in jobs:
+                        app.run_job(job)
+                finally:
+                    app.close()
+
+        elif args.platform == 'grafana':
             if not args.dashboard_id or not args.datasource:
                 raise ValueError("Grafana requires --dashboard-id and --datasource")
             
@@ -330,9 +911,28 @@ if __name__ == "__main__":
                 credentials={'username': args.username, 'password': args.password}
             )
             
+        if args.crop:
+            auto_crop.process_run(args.output_dir, files=[row['file_path'] for row in capture_report.captures(
+                args.output_dir, since=started_at) if row['file_path'].endswith('.png')])
+        if args.timelapse:
+            video = timelapse.build_timelapse(args.output_dir, args.dashboard_id or args.dashboard_name,
+                                              args.time_range, args.timelapse, diff=args.timelapse_diff,
+                                              platform=args.platform)
+            if app.sink:
+                app.sink.put(video, args.output_dir)
+        paths = capture_report.build_report(args.output_dir, since=started_at) if args.report else None
+        if args.mail_to:
+            mailer = mail_delivery.from_env()
+            try:
+                mail_delivery.deliver_captures(mailer, args.mail_to, args.output_dir, since=started_at, report=paths)
+            finally:
+                mailer.close()
         logging.info("Capture completed successfully")
         sys.exit(0)
         
     except Exception as e:
         logging.error(f"Capture failed: {str(e)}")
-        sys.exit(1)
\ No newline at end of file
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
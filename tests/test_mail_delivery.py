@@ -0,0 +1,128 @@
+import os
+import sys
+import email
+import shutil
+import tempfile
+import threading
+import socketserver
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import mail_delivery
+
+# mail_delivery against a local SMTP sink: a minimal threaded SMTP server that
+# accepts every message and records each connection and transaction.
+
+
+class SMTPHandler(socketserver.StreamRequestHandler):
+    def reply(self, line: str):
+        self.wfile.write(f"{line}\r\n".encode())
+
+    def handle(self):
+        sink = self.server
+        with sink.lock:
+            sink.connections += 1
+        self.reply("220 sink ready")
+        sender, rcpts = None, []
+        for raw in self.rfile:
+            command = raw.decode().strip()
+            verb = command.split(' ', 1)[0].upper()
+            if verb in ('EHLO', 'HELO'):
+                self.reply("250 sink")
+            elif verb == 'MAIL':
+                sender, rcpts = command.split(':', 1)[1].strip(), []
+                self.reply("250 OK")
+            elif verb == 'RCPT':
+                rcpts.append(command.split(':', 1)[1].strip().strip('<>'))
+                self.reply("250 OK")
+            elif verb == 'DATA':
+                self.reply("354 End data with <CR><LF>.<CR><LF>")
+                lines = []
+                for data in self.rfile:
+                    if data == b".\r\n":
+                        break
+                    lines.append(data[1:] if data.startswith(b'..') else data)
+                with sink.lock:
+                    sink.transactions.append((sender, rcpts, b''.join(lines)))
+                self.reply("250 OK queued")
+            elif verb in ('RSET', 'NOOP'):
+                self.reply("250 OK")
+            elif verb == 'QUIT':
+                self.reply("221 Bye")
+                return
+            else:
+                self.reply("502 Command not implemented")
+
+
+class SMTPSink(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self):
+        super().__init__(('127.0.0.1', 0), SMTPHandler)
+        self.lock = threading.Lock()
+        self.connections = 0
+        self.transactions = []
+
+
+class MailDeliveryTest(unittest.TestCase):
+    def setUp(self):
+        self.sink = SMTPSink()
+        threading.Thread(target=self.sink.serve_forever, daemon=True).start()
+        self.pool = mail_delivery.SMTPPool('127.0.0.1', self.sink.server_address[1], starttls=False, timeout=5)
+        self.mailer = mail_delivery.Mailer(self.pool, 'captures@example.com',
+                                           link_base='https://ci.example.com/captures')
+        self.output_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        self.mailer.close()
+        self.sink.shutdown()
+        self.sink.server_close()
+        shutil.rmtree(self.output_dir)
+
+    def _file(self, name: str, size: int) -> str:
+        path = os.path.join(self.output_dir, name)
+        with open(path, 'wb') as f:
+            f.write(os.urandom(size))
+        return path
+
+    def test_recipients_deduplicated(self):
+        self.assertEqual(mail_delivery.recipients("a@example.com, A@Example.com; Ops <ops@example.com>",
+                                                  ["ops@example.com", "b@example.com", "nobody"]),
+                         ["a@example.com", "ops@example.com", "b@example.com"])
+        self.mailer.deliver("a@example.com, A@EXAMPLE.COM, b@example.com; a@example.com", "Dedup", [])
+        self.assertEqual([rcpts for _, rcpts, _ in self.sink.transactions], [["a@example.com", "b@example.com"]])
+
+    def test_one_connection_across_deliveries(self):
+        for n in range(3):
+            self.mailer.deliver("a@example.com", f"Delivery {n}", [])
+        self.assertEqual(len(self.sink.transactions), 3)
+        self.assertEqual(self.sink.connections, 1)
+        self.assertEqual(self.pool.connections, 1)
+
+    def test_transactions_split_at_rcpt_chunk(self):
+        to = [f"user{n}@example.com" for n in range(mail_delivery.RCPT_CHUNK * 2 + 20)]
+        result = self.mailer.deliver(to, "Many recipients", [])
+        self.assertEqual(result['recipients'], len(to))
+        chunks = [rcpts for _, rcpts, _ in self.sink.transactions]
+        self.assertEqual([len(chunk) for chunk in chunks], [mail_delivery.RCPT_CHUNK, mail_delivery.RCPT_CHUNK, 20])
+        self.assertEqual([address for chunk in chunks for address in chunk], to)
+        # The same message every time
+        self.assertEqual(len({data for _, _, data in self.sink.transactions}), 1)
+
+    def test_links_past_max_bytes(self):
+        size = 40 * 1024
+        files = [self._file(f"export-{n}.csv", size) for n in range(3)]
+        # Room for two attachments, not three
+        self.mailer.max_bytes = mail_delivery._encoded_size(size) * 2 + 100
+        result = self.mailer.deliver("a@example.com", "Capped", files, output_dir=self.output_dir)
+        self.assertEqual((result['attached'], result['linked']), (2, 1))
+        message = email.message_from_bytes(self.sink.transactions[0][2])
+        attached = [part.get_filename() for part in message.walk() if part.get_filename()]
+        self.assertEqual(attached, ["export-0.csv", "export-1.csv"])
+        body = next(part for part in message.walk() if part.get_content_type() == 'text/plain').get_payload()
+        self.assertIn("https://ci.example.com/captures/export-2.csv", body)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,135 @@
+import os
+import sys
+import socket
+import tempfile
+import threading
+import shutil
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import s3_sink
+
+# s3_sink against moto's S3 server standing in for MinIO (pip install boto3 "moto[server]")
+try:
+    import boto3
+    from moto.server import ThreadedMotoServer
+except ImportError:
+    ThreadedMotoServer = None
+
+BUCKET = 'captures'
+
+
+class GatedClient:
+    """S3 client whose uploads wait until the gate opens"""
+    def __init__(self, client):
+        self.client = client
+        self.gate = threading.Event()
+        self.started = threading.Event()
+
+    def upload_fileobj(self, *args, **kwargs):
+        self.started.set()
+        self.gate.wait(10)
+        return self.client.upload_fileobj(*args, **kwargs)
+
+
+@unittest.skipIf(ThreadedMotoServer is None, "needs boto3 and moto[server]")
+class S3SinkTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.environ = mock.patch.dict(os.environ, {'AWS_ACCESS_KEY_ID': 'test', 'AWS_SECRET_ACCESS_KEY': 'test',
+                                                   'AWS_DEFAULT_REGION': 'us-east-1'})
+        cls.environ.start()
+        cls.server = ThreadedMotoServer(ip_address='127.0.0.1', port=0, verbose=False)
+        cls.server.start()
+        host, port = cls.server.get_host_and_port()
+        cls.endpoint = f"http://{host}:{port}"
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.stop()
+        cls.environ.stop()
+
+    def setUp(self):
+        self.client = boto3.client('s3', endpoint_url=self.endpoint)
+        self.client.create_bucket(Bucket=BUCKET)
+        self.output_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        for page in self.client.get_paginator('list_objects_v2').paginate(Bucket=BUCKET):
+            for item in page.get('Contents', []):
+                self.client.delete_object(Bucket=BUCKET, Key=item['Key'])
+        self.client.delete_bucket(Bucket=BUCKET)
+        shutil.rmtree(self.output_dir)
+
+    def _file(self, relative: str, size: int) -> str:
+        path = os.path.join(self.output_dir, relative)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as f:
+            f.write(os.urandom(size))
+        return path
+
+    def test_multipart_upload(self):
+        # S3's smallest part is 5 MB: 11 MB in 5 MB parts is 3 parts
+        path = self._file('grafana/ds/export.csv', 11 * 1024 * 1024)
+        sink = s3_sink.S3Sink(BUCKET, prefix='job/42', endpoint_url=self.endpoint, part_mb=5)
+        sink.put(path, self.output_dir)
+        png = b'\x89PNG\r\n\x1a\n' + os.urandom(1024)
+        sink.put(os.path.join(self.output_dir, 'grafana/ds/shot.png'), self.output_dir, data=png)
+        sink.close()
+        self.assertEqual((sink.uploaded, sink.failed), (2, []))
+        head = self.client.head_object(Bucket=BUCKET, Key='job/42/grafana/ds/export.csv')
+        self.assertEqual(head['ContentLength'], 11 * 1024 * 1024)
+        self.assertTrue(head['ETag'].strip('"').endswith('-3'), head['ETag'])
+        shot = self.client.get_object(Bucket=BUCKET, Key='job/42/grafana/ds/shot.png')
+        self.assertEqual(shot['ContentType'], 'image/png')
+        self.assertEqual(shot['Body'].read(), png)
+
+    def test_put_blocks_while_queue_is_full(self):
+        client = GatedClient(boto3.client('s3', endpoint_url=self.endpoint))
+        sink = s3_sink.S3Sink(BUCKET, workers=1, queue_size=1, client=client)
+        sink.put('a.png', self.output_dir, data=b'a')
+        self.assertTrue(client.started.wait(5))
+        # The worker holds a.png, b.png fills the queue, c.png has to wait
+        sink.put('b.png', self.output_dir, data=b'b')
+        third = threading.Thread(target=sink.put, args=('c.png', self.output_dir), kwargs={'data': b'c'})
+        third.start()
+        third.join(0.5)
+        self.assertTrue(third.is_alive())
+        client.gate.set()
+        third.join(5)
+        self.assertFalse(third.is_alive())
+        sink.close()
+        self.assertEqual(sink.uploaded, 3)
+        self.assertEqual(sorted(item['Key'] for item in self.client.list_objects_v2(Bucket=BUCKET)['Contents']),
+                         ['a.png', 'b.png', 'c.png'])
+
+    def test_retries_then_fails(self):
+        # Nothing listens there: every request fails with a connection error
+        with socket.socket() as s:
+            s.bind(('127.0.0.1', 0))
+            closed = f"http://127.0.0.1:{s.getsockname()[1]}"
+        sink = s3_sink.S3Sink(BUCKET, endpoint_url=closed, workers=1, retries=3)
+        requests = []
+        sink.client.meta.events.register('before-send.s3.*', lambda **kwargs: requests.append(1))
+        with mock.patch.object(s3_sink.time, 'sleep') as sleep:
+            sink.put('shot.png', self.output_dir, data=b'png')
+            failed = sink.flush()
+        sink.close()
+        self.assertEqual(failed, ['shot.png'])
+        self.assertEqual(sink.uploaded, 0)
+        # One retry layer: exactly `retries` requests, backing off between them
+        self.assertEqual(len(requests), 3)
+        self.assertEqual([c.args[0] for c in sleep.call_args_list], [2, 4])
+
+    def test_missing_file_is_not_retried(self):
+        sink = s3_sink.S3Sink(BUCKET, endpoint_url=self.endpoint, workers=1, retries=3)
+        with mock.patch.object(s3_sink.time, 'sleep') as sleep:
+            sink.put(os.path.join(self.output_dir, 'gone.csv'), self.output_dir)
+            self.assertEqual(sink.flush(), ['gone.csv'])
+        sink.close()
+        sleep.assert_not_called()
+
+
+if __name__ == "__main__":
+    unittest.main()
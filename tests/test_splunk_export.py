@@ -0,0 +1,49 @@
+import os
+import sys
+import csv
+import json
+import shutil
+import tempfile
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'bench'))
+import splunk_export
+from splunk_api import SplunkAPI
+from fake_server import start_server, splunk_rows
+
+# splunk_export against the bench's fake Splunk export endpoint, whose every
+# 10th event has a _raw spanning several lines (a blank one among them).
+
+SEARCH = {'id': 'errors', 'search': 'index=main | stats count by status', 'earliest': '0', 'latest': '60'}
+
+
+class SplunkExportTest(unittest.TestCase):
+    def setUp(self):
+        self.server = start_server('splunk', splunk_rows=25)
+        self.api = SplunkAPI(self.server.base_url)
+        self.output_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        shutil.rmtree(self.output_dir)
+
+    def test_csv_keeps_multiline_fields(self):
+        path = os.path.join(self.output_dir, 'errors.csv')
+        self.assertEqual(splunk_export.export_search(self.api, SEARCH, 'csv', path), 25)
+        with open(path, newline='') as f:
+            rows = list(csv.DictReader(f))
+        self.assertEqual(rows, splunk_rows(25))
+        self.assertEqual(rows[10]['_raw'], 'GET /api/10 200\r\n\r\n  at handler 10, "retry"')
+
+    def test_json(self):
+        path = os.path.join(self.output_dir, 'errors.json')
+        self.assertEqual(splunk_export.export_search(self.api, SEARCH, 'json', path), 25)
+        with open(path) as f:
+            self.assertEqual(json.load(f), splunk_rows(25))
+
+
+if __name__ == "__main__":
+    unittest.main()
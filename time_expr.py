@@ -0,0 +1,186 @@
+import os
+import re
+import calendar
+from datetime import datetime, timedelta, timezone, tzinfo
+from typing import Dict, List, Optional, Tuple
+from zoneinfo import ZoneInfo
+
+# Time expressions shared by every capture path.
+#
+# A time range is "FROM to TO", "FROM TO" or a lone FROM (TO is now). Each end is
+# Grafana date math (now, now-7d, now-7d/d, now/w+8h; units s m h d w M y), ISO
+# 8601, epoch seconds or milliseconds, or the older %Y:%m:%d-%H:%M:%S and
+# %Y%m%d-%H:%M:%S forms. /unit rounds FROM down to the start of the unit and TO
+# up to the start of the next one, so "now-1d/d to now-1d/d" is all of yesterday.
+#
+# "now" is snapped down to $CAPTURE_TIME_ALIGN (default 1m, 0 for whole seconds):
+# runs and users asking for "now-1h" within the same minute get the same window,
+# and with it the same file names and backend cache entries. Calendar rounding
+# follows $CAPTURE_TIMEZONE (IANA name, default the local time zone).
+
+UNITS = {'s': 'seconds', 'm': 'minutes', 'h': 'hours', 'd': 'days', 'w': 'weeks'}
+CALENDAR_UNITS = {'M': 1, 'y': 12}
+DATE_MATH = re.compile(r'([+-])(\d+)([smhdwMy])|/([smhdwMy])')
+STEP = re.compile(r'^(\d+)([smhdwMy])$')
+EPOCH = re.compile(r'^\d{9,13}$')
+LEGACY_FORMATS = ['%Y:%m:%d-%H:%M:%S', '%Y%m%d-%H:%M:%S', '%Y%m%d-%H%M%S']
+DEFAULT_ALIGN = '1m'
+
+
+def _zone(tz: Optional[str]) -> Optional[tzinfo]:
+    tz = tz or os.environ.get('CAPTURE_TIMEZONE')
+    return ZoneInfo(tz) if tz else None
+
+
+def _normalize(moment: datetime, zone: Optional[tzinfo]) -> datetime:
+    """Naive local time without a time zone, aware in the zone with one"""
+    if zone is None:
+        return moment.astimezone().replace(tzinfo=None) if moment.tzinfo else moment
+    return moment.astimezone(zone) if moment.tzinfo else moment.replace(tzinfo=zone)
+
+
+def duration(text: str) -> timedelta:
+    """Fixed-length duration such as 30s, 5m, 1d (not M or y, whose length varies)"""
+    match = STEP.match(text.strip())
+    if not match or match.group(2) not in UNITS:
+        raise ValueError(f"Unsupported duration: {text} (use s, m, h, d or w, e.g. 5m)")
+    return timedelta(**{UNITS[match.group(2)]: int(match.group(1))})
+
+
+def shift(moment: datetime, amount: int, unit: str) -> datetime:
+    """moment plus amount units; months and years move on the calendar, clamping the day"""
+    if unit not in CALENDAR_UNITS:
+        return moment + timedelta(**{UNITS[unit]: amount})
+    month = moment.year * 12 + moment.month - 1 + amount * CALENDAR_UNITS[unit]
+    year, month = divmod(month, 12)
+    day = min(moment.day, calendar.monthrange(year, month + 1)[1])
+    return moment.replace(year=year, month=month + 1, day=day)
+
+
+def floor(moment: datetime, unit: str) -> datetime:
+    """Start of the second/minute/hour/day/week (Monday)/month/year moment falls in"""
+    moment = moment.replace(microsecond=0)
+    if unit == 's':
+        return moment
+    moment = moment.replace(second=0)
+    if unit == 'm':
+        return moment
+    moment = moment.replace(minute=0)
+    if unit == 'h':
+        return moment
+    moment = moment.replace(hour=0)
+    if unit == 'w':
+        return moment - timedelta(days=moment.weekday())
+    if unit == 'M':
+        return moment.replace(day=1)
+    if unit == 'y':
+        return moment.replace(month=1, day=1)
+    return moment
+
+
+def now(tz: str = None, align: str = None) -> datetime:
+    """Current time snapped down to the alignment step ($CAPTURE_TIME_ALIGN)"""
+    zone = _zone(tz)
+    align = os.environ.get('CAPTURE_TIME_ALIGN', DEFAULT_ALIGN) if align is None else align
+    step = duration(align).total_seconds() if align.strip() not in ('', '0') else 1
+    seconds = datetime.now().timestamp()
+    return _normalize(datetime.fromtimestamp(seconds - seconds % step).astimezone(), zone)
+
+
+def parse(expression: str, round_up: bool = False, tz: str = None, reference: datetime = None) -> datetime:
+    """One end of a range; round_up rounds /unit to the next boundary (for TO)"""
+    text = expression.strip()
+    zone = _zone(tz)
+    if text.startswith('now'):
+        moment = reference or now(tz)
+        math, position = text[3:].replace(' ', ''), 0
+        for match in DATE_MATH.finditer(math):
+            if match.start() != position:
+                break
+            position = match.end()
+            sign, amount, unit, rounding = match.groups()
+            if rounding:
+                moment = floor(moment, rounding)
+                if round_up:
+                    moment = shift(moment, 1, rounding)
+            else:
+                moment = shift(moment, int(amount) * (-1 if sign == '-' else 1), unit)
+        if position == len(math):
+            return moment
+    elif EPOCH.match(text):
+        value = int(text)
+        return _normalize(datetime.fromtimestamp(value / 1000 if len(text) > 10 else value).astimezone(), zone)
+    else:
+        try:
+            return _normalize(datetime.fromisoformat(text), zone)
+        except ValueError:
+            pass
+        for fmt in LEGACY_FORMATS:
+            try:
+                return _normalize(datetime.strptime(text, fmt), zone)
+            except ValueError:
+                continue
+    raise ValueError(f"Unsupported time expression: {expression}")
+
+
+def _ends(time_range: str) -> List[List[str]]:
+    """Ways to split a range into FROM [TO], most explicit first"""
+    text = time_range.strip()
+    if ' to ' in text:
+        return [text.split(' to ', 1)]
+    if '_' in text and ' ' not in text:
+        # python-2.py style: %Y%m%d-%H:%M:%S_%Y%m%d-%H:%M:%S
+        return [text.split('_', 1)]
+    parts = text.split()
+    return [parts, [text]] if len(parts) == 2 else [[text]]
+
+
+def parse_range(time_range: str, tz: str = None) -> Tuple[datetime, datetime]:
+    """(start, end) of a time range; both ends see the same now"""
+    reference = now(tz)
+    error = None
+    for ends in _ends(time_range):
+        try:
+            start = parse(ends[0], False, tz, reference)
+            end = parse(ends[1], True, tz, reference) if len(ends) > 1 else reference
+        except ValueError as e:
+            error = e
+            continue
+        if start > end:
+            raise ValueError(f"Time range ends before it starts: {time_range}")
+        return start, end
+    raise ValueError(f"Unsupported time format: {time_range}") from error
+
+
+def windows(time_range: str, step: str, tz: str = None) -> List[Tuple[datetime, datetime]]:
+    """Consecutive step-long windows covering the range (the last one may be shorter)"""
+    match = STEP.match(step.strip())
+    if not match or int(match.group(1)) == 0:
+        raise ValueError(f"Unsupported window step: {step} (e.g. 1h, 1d, 1w, 1M)")
+    amount, unit = int(match.group(1)), match.group(2)
+    first, end = parse_range(time_range, tz)
+    # Sub-day steps are elapsed time: stepped in UTC, a DST change neither empties nor doubles a window
+    elapsed = unit in ('s', 'm', 'h') and first.tzinfo is not None
+    origin, last = (first.astimezone(timezone.utc), end.astimezone(timezone.utc)) if elapsed else (first, end)
+    result, start = [], origin
+    while start < last:
+        # Each boundary from the first start, so clamped month ends don't drift (Jan 31, Feb 29, Mar 31)
+        result.append((start, min(shift(origin, (len(result) + 1) * amount, unit), last)))
+        start = result[-1][1]
+    if elapsed:
+        result = [(start.astimezone(first.tzinfo), stop.astimezone(first.tzinfo)) for start, stop in result]
+    return result
+
+
+def format_range(start: datetime, end: datetime) -> str:
+    """Absolute range that parses back to the same window"""
+    return f"{start.isoformat(timespec='seconds')} to {end.isoformat(timespec='seconds')}"
+
+
+def expand_job(job: Dict) -> List[Dict]:
+    """Job with a window_step: one job per window of its time range"""
+    if not job.get('window_step'):
+        return [job]
+    single = {k: v for k, v in job.items() if k != 'window_step'}
+    return [{**single, 'time_range': format_range(start, end)}
+            for start, end in windows(job.get('time_range') or 'now-1h', job['window_step'])]
@@ -0,0 +1,210 @@
+import os
+import shutil
+import logging
+import argparse
+import subprocess
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import capture_report
+import device_metrics
+import time_expr
+
+# Frames need Pillow
+try:
+    from PIL import Image, ImageChops, ImageDraw, ImageFilter, ImageFont
+except ImportError:
+    Image = None
+
+# ffmpeg from imageio-ffmpeg when it is installed and there is none on the PATH
+try:
+    import imageio_ffmpeg
+except ImportError:
+    imageio_ffmpeg = None
+
+# Timelapse of one dashboard: its captures over a time window, from the capture
+# history, as an MP4, WebM or animated WebP.
+#
+# Frames are decoded and scaled by a few threads ahead of the encoder and piped
+# to ffmpeg as raw RGB one at a time, so only a handful are in memory however
+# long the window. Every frame is scaled onto the first frame's size and gets a
+# caption with its window. With diff highlighting, pixels that changed since
+# the previous frame are tinted red (grown a little so thin lines show).
+
+FORMATS = {
+    'mp4': ['-c:v', 'libx264', '-pix_fmt', 'yuv420p', '-preset', 'medium', '-crf', '23', '-movflags', '+faststart'],
+    'webm': ['-c:v', 'libvpx-vp9', '-pix_fmt', 'yuv420p', '-b:v', '0', '-crf', '33', '-row-mt', '1'],
+    'webp': ['-c:v', 'libwebp_anim', '-lossless', '0', '-quality', '75', '-loop', '0'],
+}
+DEFAULT_FPS = 2
+# Frames wider than this are scaled down
+DEFAULT_WIDTH = 1920
+CAPTION_HEIGHT = 24
+# Per-channel difference below this is noise (antialiasing, JPEG)
+DIFF_THRESHOLD = 24
+DIFF_GROW_PX = 5
+DIFF_COLOR = (255, 0, 0)
+DIFF_OPACITY = 0.45
+
+
+def ffmpeg() -> str:
+    """ffmpeg executable: $CAPTURE_FFMPEG, the PATH, else imageio-ffmpeg's"""
+    path = os.environ.get('CAPTURE_FFMPEG') or shutil.which('ffmpeg')
+    if not path and imageio_ffmpeg is not None:
+        path = imageio_ffmpeg.get_ffmpeg_exe()
+    if not path:
+        raise ValueError("Timelapses need ffmpeg (install it, or pip install imageio-ffmpeg)")
+    return path
+
+
+def _aware(moment: datetime) -> datetime:
+    """moment with a UTC offset: history dates are naive local time, or carry one with $CAPTURE_TIMEZONE"""
+    return moment if moment.tzinfo is not None else moment.astimezone()
+
+
+def _window(row: Dict) -> Tuple[datetime, datetime]:
+    return _aware(datetime.fromisoformat(row['start_date'])), _aware(datetime.fromisoformat(row['end_date']))
+
+
+def frames(output_dir: str, dashboard: str, time_range: str = None, platform: str = None) -> List[Dict]:
+    """History rows of one dashboard's screenshots (by id or name) whose windows overlap time_range,
+    oldest window first"""
+    start, end = (_aware(moment) for moment in time_expr.parse_range(time_range)) if time_range else (None, None)
+    rows = []
+    for row in capture_report.captures(output_dir):
+        if dashboard not in (row['dashboard_id'], row['dashboard_name']):
+            continue
+        if platform and row['platform'] != platform:
+            continue
+        if not row['file_path'].lower().endswith(capture_report.IMAGE_EXTENSIONS):
+            continue
+        # Extra resolutions would mix frame sizes
+        if device_metrics.is_variant(row['file_path']):
+            continue
+        if start is not None:
+            row_start, row_end = _window(row)
+            if row_end <= start or row_start >= end:
+                continue
+        rows.append(row)
+    return sorted(rows, key=lambda r: (*_window(r), r['capture_time']))
+
+
+def _frame_size(file_path: str, width: int) -> Tuple[int, int]:
+    """Size of every frame: the first capture's, scaled to width at most, even for yuv420p"""
+    with Image.open(file_path) as image:
+        w, h = image.size
+    if w > width:
+        w, h = width, round(h * width / w)
+    return w - w % 2, (h + CAPTION_HEIGHT) - (h + CAPTION_HEIGHT) % 2
+
+
+def _load(row: Dict, size: Tuple[int, int]) -> 'Image.Image':
+    """One frame: the capture fitted into size under its caption"""
+    frame = Image.new('RGB', size, 'white')
+    with Image.open(row['file_path']) as image:
+        image = image.convert('RGB')
+    image.thumbnail((size[0], size[1] - CAPTION_HEIGHT))
+    frame.paste(image, ((size[0] - image.width) // 2, CAPTION_HEIGHT))
+    caption = f"{row['dashboard_name']}   {capture_report.window_label(row).replace('–', '-')}"
+    ImageDraw.Draw(frame).text((8, 6), caption, fill='black', font=ImageFont.load_default())
+    return frame
+
+
+def _loaded(rows: List[Dict], size: Tuple[int, int], workers: int) -> Iterator[Tuple[Dict, Optional[object]]]:
+    """(row, frame future) in order, with at most 2 x workers frames decoded ahead"""
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='timelapse-frame') as pool:
+        window = deque()
+        for row in rows:
+            window.append((row, pool.submit(_load, row, size)))
+            if len(window) >= workers * 2:
+                yield window.popleft()
+        while window:
+            yield window.popleft()
+
+
+def highlight(previous: 'Image.Image', frame: 'Image.Image') -> 'Image.Image':
+    """frame with the pixels that differ from previous tinted"""
+    diff = ImageChops.difference(previous, frame).convert('L')
+    mask = diff.point(lambda v: 255 if v > DIFF_THRESHOLD else 0).filter(ImageFilter.MaxFilter(DIFF_GROW_PX))
+    # The caption changes every frame
+    mask.paste(0, (0, 0, frame.width, CAPTION_HEIGHT))
+    if not mask.getbbox():
+        return frame
+    tinted = Image.blend(frame, Image.new('RGB', frame.size, DIFF_COLOR), DIFF_OPACITY)
+    return Image.composite(tinted, frame, mask)
+
+
+def output_filename(rows: List[Dict], fmt: str) -> str:
+    first, last = rows[0], rows[-1]
+    safe_name = first['dashboard_name'].replace(' ', '_').replace('/', '-')
+    start = datetime.fromisoformat(first['start_date']).strftime('%Y%m%dT%H%M%S')
+    end = datetime.fromisoformat(last['end_date']).strftime('%Y%m%dT%H%M%S')
+    return f"{safe_name}_{first['dashboard_id']}_{start}_{end}_timelapse.{fmt}"
+
+
+def build_timelapse(output_dir: str, dashboard: str, time_range: str = None, fmt: str = 'mp4',
+                    fps: float = DEFAULT_FPS, diff: bool = False, platform: str = None, file_path: str = None,
+                    width: int = DEFAULT_WIDTH, workers: int = None) -> str:
+    """Encode one dashboard's captures over time_range as a timelapse; returns its path"""
+    if Image is None:
+        raise ValueError("Timelapses need Pillow (pip install pillow)")
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown timelapse format: {fmt} (choose from {', '.join(FORMATS)})")
+    rows = frames(output_dir, dashboard, time_range, platform)
+    if len(rows) < 2:
+        raise ValueError(f"Need at least 2 captures of {dashboard} for a timelapse, found {len(rows)}")
+    file_path = file_path or os.path.join(output_dir, 'timelapse', output_filename(rows, fmt))
+    os.makedirs(os.path.dirname(os.path.abspath(file_path)), exist_ok=True)
+    size = _frame_size(rows[0]['file_path'], width)
+    workers = workers or int(os.environ.get('CAPTURE_TIMELAPSE_WORKERS', min(4, os.cpu_count() or 2)))
+    command = [ffmpeg(), '-y', '-loglevel', 'error', '-f', 'rawvideo', '-pix_fmt', 'rgb24',
+               '-s', f"{size[0]}x{size[1]}", '-framerate', str(fps), '-i', '-', *FORMATS[fmt], file_path]
+    encoder = subprocess.Popen(command, stdin=subprocess.PIPE, stderr=subprocess.PIPE)
+    written, previous = 0, None
+    try:
+        for row, future in _loaded(rows, size, workers):
+            try:
+                frame = future.result()
+            except Exception as e:
+                logging.warning(f"Timelapse: skipping {row['file_path']}: {str(e)}")
+                continue
+            encoder.stdin.write((highlight(previous, frame) if diff and previous else frame).tobytes())
+            previous = frame
+            written += 1
+        encoder.stdin.close()
+    except BrokenPipeError:
+        # ffmpeg gave up; its message below says why
+        pass
+    except BaseException:
+        encoder.kill()
+        raise
+    finally:
+        error = encoder.stderr.read().decode(errors='replace').strip()
+        encoder.wait()
+    if encoder.returncode != 0:
+        raise RuntimeError(f"ffmpeg failed ({encoder.returncode}): {error}")
+    logging.info(f"Timelapse of {written} captures of {rows[0]['dashboard_name']} written to {file_path}")
+    return file_path
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Turn one dashboard's captures into a timelapse video")
+    parser.add_argument("dashboard", help="Dashboard id or name")
+    parser.add_argument("-o", "--output-dir", default="./captures", help="Output dir of the captures")
+    parser.add_argument("-t", "--time-range", help="Only captures whose windows fall in this range")
+    parser.add_argument("-p", "--platform", help="Only captures of this platform")
+    parser.add_argument("-f", "--format", default="mp4", choices=list(FORMATS))
+    parser.add_argument("--fps", type=float, default=DEFAULT_FPS, help="Captures per second of video")
+    parser.add_argument("--diff", action="store_true", help="Highlight what changed since the previous capture")
+    parser.add_argument("--width", type=int, default=DEFAULT_WIDTH, help="Maximum frame width")
+    parser.add_argument("--out", help="Video path (default: <output dir>/timelapse/...)")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
+    print(build_timelapse(args.output_dir, args.dashboard, args.time_range, args.format, args.fps, args.diff,
+                          args.platform, args.out, args.width))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+import os
+import csv
+import math
+import time
+import logging
+import threading
+from datetime import datetime
+from typing import Dict, List, Tuple
+
+from selenium.common.exceptions import TimeoutException
+from selenium.webdriver.support.ui import WebDriverWait
+
+# Adaptive wait timeouts learned from past captures.
+#
+# Every wait records how long the page took (or that it timed out) in
+# render_history.csv next to capture_history.csv. Once a dashboard has enough
+# successful samples its timeout becomes p95 * margin, clamped to [floor, ceiling];
+# a dashboard that timed out gets a longer budget next time. A dashboard that
+# failed failure_threshold times in a row is skipped (CircuitOpen) until
+# cooldown_seconds have passed, then gets one trial capture.
+
+HISTORY_COLUMNS = ['recorded_at', 'platform', 'dashboard', 'seconds', 'timeout', 'ok']
+HISTORY_WINDOW = 50
+
+
+class CircuitOpen(Exception):
+    """Dashboard failed repeatedly and is being skipped"""
+
+
+def percentile(values: List[float], pct: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, math.ceil(pct / 100 * len(ordered)) - 1))]
+
+
+class TimeoutPolicy:
+    """Per-dashboard wait timeouts and circuit breaker over a render history file"""
+    def __init__(self, path: str, floor: float = 5.0, ceiling: float = 120.0, pct: float = 95,
+                 margin: float = 1.5, min_samples: int = 5, failure_threshold: int = 3,
+                 cooldown_seconds: float = 3600):
+        self.path = path
+        self.floor = floor
+        self.ceiling = ceiling
+        self.pct = pct
+        self.margin = margin
+        self.min_samples = min_samples
+        self.failure_threshold = failure_threshold
+        self.cooldown_seconds = cooldown_seconds
+        self._lock = threading.Lock()
+        self._history: Dict[Tuple[str, str], List[Dict]] = {}
+        self._load()
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, newline='') as f:
+            for row in csv.DictReader(f):
+                try:
+                    self._remember(row['platform'], row['dashboard'], {
+                        'recorded_at': datetime.fromisoformat(row['recorded_at']).timestamp(),
+                        'seconds': float(row['seconds']),
+                        'timeout': float(row['timeout']),
+                        'ok': row['ok'] == '1',
+                    })
+                except (KeyError, ValueError):
+                    continue
+
+    def _remember(self, platform: str, dashboard: str, sample: Dict):
+        samples = self._history.setdefault((platform, dashboard), [])
+        samples.append(sample)
+        del samples[:-HISTORY_WINDOW]
+
+    def timeout(self, platform: str, dashboard: str, default: float) -> float:
+        """Seconds to wait for this dashboard"""
+        with self._lock:
+            samples = list(self._history.get((platform, dashboard), []))
+        durations = [s['seconds'] for s in samples if s['ok']]
+        timeout = default
+        if len(durations) >= self.min_samples:
+            timeout = percentile(durations, self.pct) * self.margin
+        if samples and not samples[-1]['ok']:
+            # Last attempt ran out of time: it may just be heavy, give it more
+            timeout = max(timeout, samples[-1]['timeout'] * 2)
+        return round(min(self.ceiling, max(self.floor, timeout)), 1)
+
+    def check(self, platform: str, dashboard: str):
+        """Raise CircuitOpen while a repeatedly failing dashboard is cooling down"""
+        with self._lock:
+            recent = self._history.get((platform, dashboard), [])[-self.failure_threshold:]
+        if len(recent) < self.failure_threshold or any(s['ok'] for s in recent):
+            return
+        remaining = recent[-1]['recorded_at'] + self.cooldown_seconds - time.time()
+        if remaining > 0:
+            raise CircuitOpen(f"{platform} {dashboard} failed {self.failure_threshold} times in a row, "
+                              f"skipping for another {remaining:.0f}s")
+
+    def record(self, platform: str, dashboard: str, seconds: float, timeout: float, ok: bool):
+        sample = {'recorded_at': time.time(), 'seconds': seconds, 'timeout': timeout, 'ok': ok}
+        with self._lock:
+            self._remember(platform, dashboard, sample)
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            file_exists = os.path.exists(self.path)
+            with open(self.path, 'a', newline='') as f:
+                writer = csv.DictWriter(f, fieldnames=HISTORY_COLUMNS)
+                if not file_exists:
+                    writer.writeheader()
+                writer.writerow({
+                    'recorded_at': datetime.fromtimestamp(sample['recorded_at']).isoformat(),
+                    'platform': platform,
+                    'dashboard': dashboard,
+                    'seconds': f"{seconds:.3f}",
+                    'timeout': timeout,
+                    'ok': int(ok),
+                })
+
+    def wait(self, driver, platform: str, dashboard: str, default: float, condition):
+        """WebDriverWait(driver, <adaptive timeout>).until(condition), recording the outcome"""
+        timeout = self.timeout(platform, dashboard, default)
+        started = time.perf_counter()
+        try:
+            result = WebDriverWait(driver, timeout).until(condition)
+        except TimeoutException:
+            self.record(platform, dashboard, time.perf_counter() - started, timeout, ok=False)
+            logging.warning(f"{platform} {dashboard} did not render within {timeout}s")
+            raise
+        self.record(platform, dashboard, time.perf_counter() - started, timeout, ok=True)
+        return result
+
+
+_policies: Dict[str, TimeoutPolicy] = {}
+_policies_lock = threading.Lock()
+
+
+def policy_for(output_dir: str) -> TimeoutPolicy:
+    """Shared policy for an output dir ($CAPTURE_RENDER_HISTORY overrides the file)"""
+    path = os.path.abspath(os.environ.get('CAPTURE_RENDER_HISTORY')
+                           or os.path.join(output_dir, 'render_history.csv'))
+    with _policies_lock:
+        if path not in _policies:
+            _policies[path] = TimeoutPolicy(
+                path,
+                ceiling=float(os.environ.get('CAPTURE_TIMEOUT_CEILING', 120)),
+                failure_threshold=int(os.environ.get('CAPTURE_CIRCUIT_FAILURES', 3)),
+                cooldown_seconds=float(os.environ.get('CAPTURE_CIRCUIT_COOLDOWN', 3600)),
+            )
+        return _policies[path]
@@ -0,0 +1,322 @@
+import argparse
+import json
+import os
+import socket
+import sqlite3
+import sys
+import threading
+import time
+import uuid
+import logging
+from contextlib import closing
+from typing import Dict, List, Optional
+
+import run_journal
+import s3_sink
+import superfake
+
+# Shared capture work queue for many worker hosts.
+#
+# Backend is a single SQLite file on shared storage, so it works offline with no
+# broker. Workers lease jobs, heartbeat while capturing, and the lease returns to
+# the queue if a worker dies. A result is recorded only by the worker that still
+# holds the lease, in the same transaction that marks the job done, so each job
+# produces exactly one result and one capture history row.
+#
+# NFS and SMB locking is only as good as the mount. Use "hard" NFS mounts with
+# working lockd, or a local disk shared through a single host.
+#
+# Passwords and tokens never go into the queue file: each worker adds its own
+# (--password/--token, else $CAPTURE_<PLATFORM>_PASSWORD/_TOKEN). Relative time
+# ranges are pinned when a job is submitted, so a retry or a late lease captures
+# the same window.
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    payload TEXT NOT NULL,
+    priority INTEGER NOT NULL DEFAULT 0,
+    status TEXT NOT NULL DEFAULT 'queued',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    max_attempts INTEGER NOT NULL DEFAULT 3,
+    not_before REAL NOT NULL DEFAULT 0,
+    lease_owner TEXT,
+    lease_expires REAL,
+    error TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS jobs_ready ON jobs (status, priority DESC, created_at);
+CREATE TABLE IF NOT EXISTS results (
+    job_id TEXT PRIMARY KEY REFERENCES jobs(id),
+    worker TEXT NOT NULL,
+    file_path TEXT,
+    recorded_at REAL NOT NULL
+);
+"""
+
+DEFAULT_LEASE_SECONDS = 120
+RETRY_BACKOFF_SECONDS = 30
+CREDENTIAL_FIELDS = ('username',) + run_journal.SECRET_FIELDS
+
+
+class LeaseLost(Exception):
+    """The job's lease expired and was taken over by another worker"""
+
+
+class WorkQueue:
+    """SQLite-backed job queue with leases, heartbeats and bounded retries"""
+    def __init__(self, path: str, lease_seconds: int = DEFAULT_LEASE_SECONDS):
+        self.path = path
+        self.lease_seconds = lease_seconds
+        with closing(self._connect()) as conn:
+            conn.executescript(SCHEMA)
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, timeout=60, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def _transaction(self, conn: sqlite3.Connection):
+        # IMMEDIATE takes the write lock up front so two workers can't lease the same row
+        conn.execute("BEGIN IMMEDIATE")
+
+    def submit(self, payload: Dict, priority: int = 0, max_attempts: int = 3) -> str:
+        """Queue a job, without its secrets and with its time range pinned"""
+        payload = run_journal.pin_window(payload, superfake.CaptureApp.parse_time_range)
+        payload = {k: v for k, v in payload.items() if k not in run_journal.SECRET_FIELDS}
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        with closing(self._connect()) as conn:
+            conn.execute(
+                "INSERT INTO jobs (id, payload, priority, max_attempts, created_at, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (job_id, json.dumps(payload), priority, max_attempts, now, now),
+            )
+        return job_id
+
+    def lease(self, worker: str) -> Optional[Dict]:
+        """Claim the best ready job (or one whose lease expired)"""
+        now = time.time()
+        conn = self._connect()
+        try:
+            self._transaction(conn)
+            row = conn.execute(
+                "SELECT * FROM jobs WHERE (status = 'queued' AND not_before <= ?) "
+                "OR (status = 'leased' AND lease_expires < ?) "
+                "ORDER BY priority DESC, created_at LIMIT 1",
+                (now, now),
+            ).fetchone()
+            if row is None:
+                conn.execute("COMMIT")
+                return None
+            if row['status'] == 'leased':
+                logging.warning(f"Reclaiming job {row['id']} from {row['lease_owner']} (lease expired)")
+            if row['status'] == 'leased' and row['attempts'] >= row['max_attempts']:
+                conn.execute(
+                    "UPDATE jobs SET status = 'failed', error = ?, lease_owner = NULL, updated_at = ? WHERE id = ?",
+                    ("lease expired on final attempt", now, row['id']),
+                )
+                conn.execute("COMMIT")
+                return self.lease(worker)
+            conn.execute(
+                "UPDATE jobs SET status = 'leased', lease_owner = ?, lease_expires = ?, "
+                "attempts = attempts + 1, updated_at = ? WHERE id = ?",
+                (worker, now + self.lease_seconds, now, row['id']),
+            )
+            conn.execute("COMMIT")
+            return {'id': row['id'], 'payload': json.loads(row['payload']), 'attempt': row['attempts'] + 1}
+        except Exception:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+
+    def heartbeat(self, job_id: str, worker: str):
+        """Extend our lease; raises LeaseLost if someone else owns the job now"""
+        with closing(self._connect()) as conn:
+            cursor = conn.execute(
+                "UPDATE jobs SET lease_expires = ?, updated_at = ? "
+                "WHERE id = ? AND lease_owner = ? AND status = 'leased'",
+                (time.time() + self.lease_seconds, time.time(), job_id, worker),
+            )
+            if cursor.rowcount != 1:
+                raise LeaseLost(job_id)
+
+    def complete(self, job_id: str, worker: str, file_path: str, on_commit=None) -> bool:
+        """Record the result exactly once; on_commit runs inside the transaction"""
+        conn = self._connect()
+        try:
+            self._transaction(conn)
+            cursor = conn.execute(
+                "UPDATE jobs SET status = 'done', lease_owner = NULL, error = NULL, updated_at = ? "
+                "WHERE id = ? AND lease_owner = ? AND status = 'leased'",
+                (time.time(), job_id, worker),
+            )
+            if cursor.rowcount != 1:
+                conn.execute("ROLLBACK")
+                return False
+            conn.execute(
+                "INSERT INTO results (job_id, worker, file_path, recorded_at) VALUES (?, ?, ?, ?)",
+                (job_id, worker, file_path, time.time()),
+            )
+            if on_commit:
+                on_commit()
+            conn.execute("COMMIT")
+            return True
+        except Exception:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+
+    def fail(self, job_id: str, worker: str, error: str):
+        """Requeue with backoff, or mark failed once attempts run out"""
+        now = time.time()
+        with closing(self._connect()) as conn:
+            conn.execute(
+                "UPDATE jobs SET "
+                "status = CASE WHEN attempts >= max_attempts THEN 'failed' ELSE 'queued' END, "
+                "not_before = ? + ? * attempts, lease_owner = NULL, error = ?, updated_at = ? "
+                "WHERE id = ? AND lease_owner = ? AND status = 'leased'",
+                (now, RETRY_BACKOFF_SECONDS, error, now, job_id, worker),
+            )
+
+    def counts(self) -> Dict[str, int]:
+        with closing(self._connect()) as conn:
+            return {row['status']: row['n'] for row in
+                    conn.execute("SELECT status, COUNT(*) AS n FROM jobs GROUP BY status")}
+
+    def failed(self) -> List[Dict]:
+        with closing(self._connect()) as conn:
+            return [dict(row) for row in
+                    conn.execute("SELECT id, payload, attempts, error FROM jobs WHERE status = 'failed'")]
+
+
+class Heartbeat(threading.Thread):
+    """Keeps a lease alive while a capture runs"""
+    def __init__(self, queue: WorkQueue, job_id: str, worker: str):
+        super().__init__(daemon=True)
+        self.queue, self.job_id, self.worker = queue, job_id, worker
+        self.lost = False
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.wait(self.queue.lease_seconds / 3):
+            try:
+                self.queue.heartbeat(self.job_id, self.worker)
+            except LeaseLost:
+                logging.error(f"Lost lease on job {self.job_id}")
+                self.lost = True
+                return
+            except sqlite3.Error as e:
+                logging.warning(f"Heartbeat for {self.job_id} failed: {str(e)}")
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+
+
+def credentials(platform: str, given: Dict = None) -> Dict:
+    """This host's login for platform: given values (CLI), else $CAPTURE_<PLATFORM>_USERNAME/_PASSWORD/_TOKEN"""
+    # A --token is a Dynatrace API token, not a Grafana or Splunk login
+    given = run_journal.defaults_for(given, platform)
+    found = {}
+    for field in CREDENTIAL_FIELDS:
+        value = given.get(field) or os.environ.get(f"CAPTURE_{platform.upper()}_{field.upper()}")
+        if value:
+            found[field] = value
+    return found
+
+
+def run_worker(queue: WorkQueue, worker: str, profile_name: str = None, exit_when_empty: bool = False,
+               poll_seconds: float = 5.0, login: Dict = None):
+    """Lease and capture jobs until stopped (or until the queue drains); login holds
+    username/password/token for every platform, over $CAPTURE_<PLATFORM>_*"""
+    app = superfake.CaptureApp(profile_name=profile_name)
+    # History rows are written only after the queue accepts the result
+    app.defer_history = True
+    try:
+        while True:
+            job = queue.lease(worker)
+            if job is None:
+                counts = queue.counts()
+                if exit_when_empty and not counts.get('queued') and not counts.get('leased'):
+                    logging.info("Queue drained, worker exiting")
+                    return
+                time.sleep(poll_seconds)
+                continue
+            logging.info(f"[{worker}] Job {job['id']} attempt {job['attempt']}: {job['payload']['platform']}")
+            heartbeat = Heartbeat(queue, job['id'], worker)
+            heartbeat.start()
+            try:
+                payload = {**job['payload'], **credentials(job['payload']['platform'], login)}
+                file_path = app.run_job(superfake.validate_job(payload))
+            except Exception as e:
+                heartbeat.stop()
+                app.flush_history(discard=True)
+                app.close()
+                logging.error(f"[{worker}] Job {job['id']} failed: {str(e)}")
+                queue.fail(job['id'], worker, str(e))
+                continue
+            heartbeat.stop()
+            if heartbeat.lost or not queue.complete(job['id'], worker, file_path, on_commit=app.flush_history):
+                logging.warning(f"[{worker}] Result for {job['id']} dropped, another worker owns it")
+                app.flush_history(discard=True)
+    finally:
+        app.close()
+        # Uploads still queued would be lost with the process
+        s3_sink.close_shared()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Distributed capture work queue")
+    parser.add_argument("--queue", required=True, help="SQLite queue file on shared storage")
+    parser.add_argument("--lease-seconds", type=int, default=DEFAULT_LEASE_SECONDS)
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    submit = sub.add_parser("submit", help="Add jobs from a JSON job file (as for superfake.py --jobs)")
+    submit.add_argument("jobs", help="JSON job file")
+    submit.add_argument("--priority", type=int, default=0)
+    submit.add_argument("--max-attempts", type=int, default=3)
+    submit.add_argument("-o", "--output-dir", help="Default output target (shared storage)")
+    # Expanding variable matrices and exported panels/searches asks the platform's API
+    submit.add_argument("--username", help="Login to expand jobs with (default: $CAPTURE_<PLATFORM>_USERNAME)")
+    submit.add_argument("--password", help="Password to expand jobs with, not queued "
+                                           "(default: $CAPTURE_<PLATFORM>_PASSWORD)")
+    submit.add_argument("--token", help="Dynatrace API token to expand and validate exports with, not queued "
+                                        "(default: $CAPTURE_DYNATRACE_TOKEN)")
+
+    work = sub.add_parser("work", help="Run a worker on this host")
+    work.add_argument("--worker-id", default=f"{socket.gethostname()}-{os.getpid()}")
+    work.add_argument("--browser-profile", help="Chrome profile")
+    work.add_argument("--exit-when-empty", action="store_true")
+    work.add_argument("--username", help="Login for every platform (default: $CAPTURE_<PLATFORM>_USERNAME)")
+    work.add_argument("--password", help="Password for every platform (default: $CAPTURE_<PLATFORM>_PASSWORD)")
+    work.add_argument("--token", help="Dynatrace API token (default: $CAPTURE_DYNATRACE_TOKEN)")
+
+    sub.add_parser("status", help="Show job counts and failures")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
+    queue = WorkQueue(args.queue, lease_seconds=args.lease_seconds)
+    if args.command == "submit":
+        import multi_capture
+        login = {'username': args.username, 'password': args.password, 'token': args.token}
+        jobs = multi_capture.load_jobs(args.jobs, defaults={'output_dir': args.output_dir},
+                                       credentials=lambda platform: credentials(platform, login))
+        for job in jobs:
+            queue.submit(job, priority=args.priority, max_attempts=args.max_attempts)
+        logging.info(f"Queued {len(jobs)} jobs")
+    elif args.command == "work":
+        run_worker(queue, args.worker_id, profile_name=args.browser_profile, exit_when_empty=args.exit_when_empty,
+                   login={'username': args.username, 'password': args.password, 'token': args.token})
+    else:
+        print(json.dumps({'counts': queue.counts(), 'failed': queue.failed()}, indent=2))
+    sys.exit(0)
+
+
+if __name__ == "__main__":
+    main()